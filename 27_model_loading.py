@@ -10,6 +10,7 @@ from PIL import Image
 import tinyobjloader as tol
 
 import glm
+import mesh
 
 validationLayers = [
     'VK_LAYER_LUNARG_standard_validation'
@@ -995,42 +996,13 @@ class HelloTriangleApplication(QtGui.QWindow):
     def __loadModel(self):
         # startTime = time.time()
         model = tol.LoadObj(self.modelPath)
-        attrib = model['attribs']
-        vertices = attrib['vertices']
-        texcoords = attrib['texcoords']
-        shapes = model['shapes']
-
-        uniqueVertices = {}
-        vertexData = []
-        indexData = []
-        for shape in shapes:
-            allIndices = shapes[shape]['indices']
-            for idx in range(0, len(allIndices), 3):
-                vid = allIndices[idx]
-                tid = allIndices[idx+2]
-                data = (
-                    # vertex position
-                    vertices[3 * vid + 0],
-                    vertices[3 * vid + 1],
-                    vertices[3 * vid + 2],
-
-                    # color
-                    1.0, 1.0, 1.0,
-
-                    # texture coord
-                    texcoords[2 * tid + 0],
-                    1.0 - texcoords[2 * tid + 1]
-                )
-
-                if data not in uniqueVertices:
-                    uniqueVertices[data] = len(vertexData)
-                    vertexData.append(data)
-                indexData.append(uniqueVertices[data])
+        positions, texcoords, positionIndices, texcoordIndices = mesh.fromTinyObj(model)
+        del model
 
+        self.__vertices, self.__indices = mesh.deduplicateVertices(positions, texcoords,
+                                                                   positionIndices, texcoordIndices)
         # useTime = time.time() - startTime
         # print('Model loading time: {} s'.format(useTime))
-        self.__vertices = np.array(vertexData, np.float32)
-        self.__indices = np.array(indexData, np.uint32)
 
     def __createVertexBuffer(self):
         bufferSize = self.__vertices.nbytes
@@ -1,5 +1,6 @@
 # -*- coding: UTF-8 -*-
 
+import os
 import sys
 import time
 import math
@@ -8,11 +9,25 @@ from vulkan import *
 from PySide2 import (QtGui, QtCore)
 import numpy as np
 from PIL import Image
-import tinyobjloader as tol
 
 import glm
-
+import bcn
+import geometry
+import indirect
+import lod
+import mesh
+import meshlet
+import meshopt
+import scene
+import texture
+import vertexformat
+from memory import DeviceMemoryAllocator, UniformRingBuffer
+from upload import UploadBatch, UINT64_MAX
+from pipelinecache import PipelineCache
+
+# tried in order, the LunarG meta layer is gone from current SDKs and drivers
 validationLayers = [
+    'VK_LAYER_KHRONOS_validation',
     'VK_LAYER_LUNARG_standard_validation'
 ]
 
@@ -22,93 +37,36 @@ deviceExtensions = [
 
 enableValidationLayers = True
 
-
-class InstanceProcAddr(object):
-    T = None
-
-    def __init__(self, func):
-        self.__func = func
-
-    def __call__(self, *args, **kwargs):
-        funcName = self.__func.__name__
-        func = InstanceProcAddr.procfunc(funcName)
-        if func:
-            return func(*args, **kwargs)
-        else:
-            return VK_ERROR_EXTENSION_NOT_PRESENT
-
-    @staticmethod
-    def procfunc(funcName):
-        return vkGetInstanceProcAddr(InstanceProcAddr.T, funcName)
-
-
-class DeviceProcAddr(InstanceProcAddr):
-
-    @staticmethod
-    def procfunc(funcName):
-        return vkGetDeviceProcAddr(InstanceProcAddr.T, funcName)
-
-# instance ext functions
-@InstanceProcAddr
-def vkCreateDebugReportCallbackEXT(instance, pCreateInfo, pAllocator):
-    pass
-
-
-@InstanceProcAddr
-def vkDestroyDebugReportCallbackEXT(instance, pCreateInfo, pAllocator):
-    pass
-
-
-@InstanceProcAddr
-def vkCreateWin32SurfaceKHR(instance, pCreateInfo, pAllocator):
-    pass
-
-
-@InstanceProcAddr
-def vkDestroySurfaceKHR(instance, surface, pAllocator):
-    pass
+MAX_FRAMES_IN_FLIGHT = 2
 
 
-@InstanceProcAddr
-def vkGetPhysicalDeviceSurfaceSupportKHR(physicalDevice, queueFamilyIndex, surface):
-    pass
+class DispatchTable(object):
+    """Extension functions of one instance or device.
 
+    Every function is resolved with ``getProcAddr`` on first use and cached
+    as an attribute, so several instances and devices can coexist, each
+    with its own table.
 
-@InstanceProcAddr
-def vkGetPhysicalDeviceSurfaceCapabilitiesKHR(physicalDevice, surface):
-    pass
+    Parameters
+    ----------
+    getProcAddr : callable
+        ``vkGetInstanceProcAddr`` or ``vkGetDeviceProcAddr``.
+    handle : VkInstance | VkDevice
+        Handle the functions are resolved for.
+    """
 
+    def __init__(self, getProcAddr, handle):
+        self.handle = handle
+        self.__getProcAddr = getProcAddr
 
-@InstanceProcAddr
-def vkGetPhysicalDeviceSurfaceFormatsKHR(physicalDevice, surface):
-    pass
+    def __getattr__(self, funcName):
+        if funcName.startswith('_'):
+            raise AttributeError(funcName)
 
+        func = self.__getProcAddr(self.handle, funcName)
+        setattr(self, funcName, func)
+        return func
 
-@InstanceProcAddr
-def vkGetPhysicalDeviceSurfacePresentModesKHR(physicalDevice, surface):
-    pass
-
-
-# device ext functions
-@DeviceProcAddr
-def vkCreateSwapchainKHR(device, pCreateInfo, pAllocator):
-    pass
-
-@DeviceProcAddr
-def vkDestroySwapchainKHR(device, swapchain, pAllocator):
-    pass
-
-@DeviceProcAddr
-def vkGetSwapchainImagesKHR(device, swapchain):
-    pass
-
-@DeviceProcAddr
-def vkAcquireNextImageKHR(device, swapchain, timeout, semaphore, fence):
-    pass
-
-@DeviceProcAddr
-def vkQueuePresentKHR(queue, pPresentInfo):
-    pass
 
 def debugCallback(*args):
     print('DEBUG: {} {}'.format(args[5], args[6]))
@@ -146,70 +104,150 @@ class SwapChainSupportDetails(object):
 
 class Vertex(object):
 
-    POS = np.array([0, 0, 0], np.float32)
-    COLOR = np.array([0, 0, 0], np.float32)
-    TEXCOORD = np.array([0, 0], np.float32)
-
-    # def __init__(self):
-    #     self.pos = []
-    #     self.color = []
+    # float32 position, color and texture coordinate, as mesh.py stores them
+    LAYOUT = vertexformat.VertexLayout()
 
     @staticmethod
-    def getBindingDescription():
+    def getBindingDescription(layout=LAYOUT):
         bindingDescription = VkVertexInputBindingDescription(
             binding=0,
-            stride=Vertex.POS.nbytes + Vertex.COLOR.nbytes + Vertex.TEXCOORD.nbytes,
+            stride=layout.stride,
             inputRate=VK_VERTEX_INPUT_RATE_VERTEX
         )
 
         return bindingDescription
 
     @staticmethod
-    def getAttributeDescriptions():
-        pos = VkVertexInputAttributeDescription(
-            location=0,
+    def getAttributeDescriptions(layout=LAYOUT):
+        return [VkVertexInputAttributeDescription(
+            location=attribute.location,
             binding=0,
-            format=VK_FORMAT_R32G32B32_SFLOAT,
-            offset=0
-        )
+            format=attribute.format,
+            offset=attribute.offset
+        ) for attribute in layout.attributes]
 
-        color = VkVertexInputAttributeDescription(
-            location=1,
-            binding=0,
-            format=VK_FORMAT_R32G32B32_SFLOAT,
-            offset=Vertex.POS.nbytes,
-        )
 
-        texcoord = VkVertexInputAttributeDescription(
-            location=2,
-            binding=0,
-            format=VK_FORMAT_R32G32_SFLOAT,
-            offset=Vertex.POS.nbytes+Vertex.COLOR.nbytes,
+class Instance(object):
+
+    # row vector model matrix, one vec4 attribute per row
+    MODEL = np.identity(4, np.float32)
+    LOCATION = 3
+
+    @staticmethod
+    def getBindingDescription():
+        bindingDescription = VkVertexInputBindingDescription(
+            binding=1,
+            stride=Instance.MODEL.nbytes,
+            inputRate=VK_VERTEX_INPUT_RATE_INSTANCE
         )
-        return [pos, color, texcoord]
+
+        return bindingDescription
+
+    @staticmethod
+    def getAttributeDescriptions():
+        return [VkVertexInputAttributeDescription(
+            location=Instance.LOCATION + row,
+            binding=1,
+            format=VK_FORMAT_R32G32B32A32_SFLOAT,
+            offset=row * Instance.MODEL[row].nbytes
+        ) for row in range(4)]
 
 
 class UniformBufferObject(object):
 
-    def __init__(self):
-        self.model = np.identity(4, np.float32)
-        self.view = np.identity(4, np.float32)
-        self.proj = np.identity(4, np.float32)
+    NBYTES = 3 * 16 * 4
+
+    def __init__(self, data=None):
+        # model, view and proj live in one (3, 4, 4) array, which can be a
+        # view of mapped memory so assigning a matrix writes it to the GPU
+        self.__data = np.empty((3, 4, 4), np.float32) if data is None else data.reshape(3, 4, 4)
+        self.__data[:] = np.identity(4, np.float32)
+
+    @property
+    def model(self):
+        return self.__data[0]
+
+    @model.setter
+    def model(self, value):
+        self.__data[0] = value
+
+    @property
+    def view(self):
+        return self.__data[1]
+
+    @view.setter
+    def view(self, value):
+        self.__data[1] = value
+
+    @property
+    def proj(self):
+        return self.__data[2]
 
+    @proj.setter
+    def proj(self, value):
+        self.__data[2] = value
 
     def toArray(self):
-        return np.concatenate((self.model, self.view, self.proj))
+        return self.__data
 
     @property
     def nbytes(self):
-        return self.proj.nbytes + self.view.nbytes + self.model.nbytes
+        return self.__data.nbytes
+
+
+class FrameStats(object):
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+
+        self.__start = time.perf_counter()
+        self.__frames = 0
+        self.__cpuWait = 0.0
+        self.__culled = []
+
+        self.fps = 0.0
+        self.cpuWait = 0.0
+        # fraction of triangles culled in each frame of the last interval
+        self.culled = []
+
+    def addFrame(self, cpuWait, culled=None):
+        self.__frames += 1
+        self.__cpuWait += cpuWait
+        if culled is not None:
+            self.__culled.append(culled)
+
+        elapsed = time.perf_counter() - self.__start
+        if elapsed >= self.interval:
+            self.fps = self.__frames / elapsed
+            self.cpuWait = self.__cpuWait / self.__frames
+            self.culled = self.__culled
+            message = '{:.1f} fps, cpu wait {:.2f} ms/frame'.format(self.fps, self.cpuWait * 1000.0)
+            if self.culled:
+                message += ', culled {:.1f}% of triangles (min {:.1f}%, max {:.1f}%)'.format(
+                    100.0 * np.mean(self.culled), 100.0 * min(self.culled), 100.0 * max(self.culled))
+            print(message)
+
+            self.__start += elapsed
+            self.__frames = 0
+            self.__cpuWait = 0.0
+            self.__culled = []
 
 
 class HelloTriangleApplication(QtGui.QWindow):
 
-    def __init__(self):
+    def __init__(self, framesInFlight=MAX_FRAMES_IN_FLIGHT, headless=False, mipmaps='auto', vertexPositions='unorm16',
+                 instances=1, validation=enableValidationLayers, verbose=False):
         super(HelloTriangleApplication, self).__init__()
 
+        # headless renders into offscreen images instead of a swap chain,
+        # no surface or window system is needed
+        self.__headless = headless
+        # the layers actually enabled, empty without validation
+        self.__validation = validation
+        self.__validationLayers = []
+        # print statistics of the loaded assets and the pipeline cache
+        self.verbose = verbose
+
         self.setWidth(1280)
         self.setHeight(720)
         self.setMinimumWidth(40)
@@ -221,12 +259,16 @@ class HelloTriangleApplication(QtGui.QWindow):
 
         self.__instance = None
         self.__callbcak = None
+        # extension functions of self.__instance and self.__device
+        self.__instanceFuncs = None
+        self.__deviceFuncs = None
         self.__surface = None
 
         self.__physicalDevice = None
         self.__device = None
         self.__graphicQueue = None
         self.__presentQueue = None
+        self.__allocator = None
 
         self.__swapChain = None
         self.__swapChainImages = []
@@ -234,19 +276,30 @@ class HelloTriangleApplication(QtGui.QWindow):
         self.__swapChainExtent = None
         self.__swapChainImageViews = []
         self.__swapChainFramebuffers = []
+        self.__offscreenImageMemory = []
 
         self.__renderpass = None
+        self.__pipelineCache = None
         self.__pipeline = None
         self.__pipelineLayout = None
 
         self.__commandPool = None
         self.__commandBuffers = []
+        self.__uploads = []
 
-        self.__imageAvailableSemaphore = None
-        self.__renderFinishedSemaphore = None
+        self.__framesInFlight = framesInFlight
+        self.__currentFrame = 0
+        self.__lastImageIndex = None
+        self.__imageAvailableSemaphores = []
+        self.__renderFinishedSemaphores = []
+        self.__inFlightFences = []
+        self.__imagesInFlight = []
+        self.__frameStats = FrameStats()
 
         self.__mipLevels = 1
         self.__textureImage = None
+        self.__textureFormat = VK_FORMAT_R8G8B8A8_UNORM
+        self.__textureCompressionBC = False
         self.__textureImageMemory = None
         self.__textureImageView = None
         self.__textureSampler = None
@@ -255,38 +308,94 @@ class HelloTriangleApplication(QtGui.QWindow):
         self.__depthImageMemory = None
         self.__depthImageView = None
 
-        self.__vertexBuffer = None
-        self.__vertexBufferMemory = None
-
-        self.__indexBuffer = None
-        self.__indexBufferMemory = None
+        # one vertex and one index buffer for every mesh, the model is one
+        # PoolMesh in it
+        self.__geometryPool = None
+        self.__poolMesh = None
+        self.__vertexLayout = Vertex.LAYOUT
+        self.__positionTransform = np.identity(4, np.float32)
+        self.__indexType = VK_INDEX_TYPE_UINT32
+        # SubMesh list per LOD level
+        self.__subMeshes = []
+        self.__lodLevels = []
+        self.__lodLevel = 0
+        self.__boundingSphere = (np.zeros(3), 0.0)
+        # meshlets per LOD level and the draws that survived culling this frame
+        self.__meshlets = []
+        self.__frameDraws = np.zeros(0, indirect.DRAW_INDEXED_INDIRECT_COMMAND)
+        self.__culledTriangles = None
+        self.__visibleObjects = np.zeros(0, np.int32)
+
+        # objects and their bounds, one per instance of the model
+        self.scene = scene.Scene()
+        self.__instanceIds = np.zeros(0, np.int64)
+        self.__placements = np.zeros((0, 4, 4), np.float32)
+        self.__instanceCount = 0
 
         self.__descriptorPool = None
         self.__descriptorSet = None
         self.__descriptorSetLayout = None
-        self.__uniformBuffer = None
-        self.__uniformBufferMemory = None
+        self.__uniformRing = None
+        # per instance model matrices, one slot per swap chain image
+        self.__instanceRing = None
+        # VkDrawIndexedIndirectCommands recorded per frame, one slot per swap chain image
+        self.__indirectRing = None
+        self.__multiDrawIndirect = False
+        self.__drawIndirectFirstInstance = False
+        self.__maxDrawIndirectCount = 1
 
 
         self.modelPath = 'models/chalet.obj'
+        self.modelCachePath = 'models/chalet.obj.cache'
+        # reorder triangles and vertices for the vertex cache, done once and cached
+        self.optimizeMesh = True
+        # 'float', 'half' or 'unorm16' positions, texture coordinates and colors follow the mesh
+        self.vertexPositions = vertexPositions
+        # coarser index buffers, one is picked per frame so its error stays below lodPixelError
+        self.meshLods = True
+        self.lodPixelError = 1.0
+        # frustum cull instances and frustum and backface cull meshlets on
+        # the CPU, command buffers are recorded every frame
+        self.meshletCulling = True
+        # copies of the model on a grid, drawn with one instanced draw or one draw each
+        self.instanceCount = instances
+        self.instancedDraws = True
+        # draws recorded every frame go through an indirect buffer, a single
+        # vkCmdDrawIndexedIndirect call with multiDrawIndirect
+        self.indirectDraws = True
+        self.pipelineCachePath = 'shader/pipeline.cache'
         self.texturePath = 'textures/chalet.jpg'
+        self.bakedTexturePath = 'textures/chalet.vktex'
+        # 'gpu' blits the mip chain, 'cpu' filters it with NumPy, 'auto' picks per format
+        self.mipmaps = mipmaps
+        self.mipmapFilter = 'box'
 
         self.__vertices = []
 
         self.__indices = []
 
-        self.__ubo = UniformBufferObject()
+        self.__ubos = []
 
         self.__startTime = time.time()
 
+        # seconds spent in each __recreateSwapChain, see benchmarks/bench_resize.py
+        self.recreateTimes = []
+
         self.timer = QtCore.QTimer(self)
         self.timer.timeout.connect(self.render)
 
+        # decode the texture on a worker while the instance and device are created
+        self.__textureLoader = texture.TextureLoader()
+        self.__textureFuture = self.__textureLoader.submit(self.texturePath, self.bakedTexturePath,
+                                                           self.mipmaps, self.mipmapFilter, alpha=1)
+
         self.initVulkan()
-        self.timer.start()
+        if not self.__headless:
+            self.timer.start()
 
     def __del__(self):
         vkDeviceWaitIdle(self.__device)
+        self.__collectUploads(True)
 
         if self.__textureSampler:
             vkDestroySampler(self.__device, self.__textureSampler, None)
@@ -298,50 +407,50 @@ class HelloTriangleApplication(QtGui.QWindow):
             vkDestroyImage(self.__device, self.__textureImage, None)
 
         if self.__textureImageMemory:
-            vkFreeMemory(self.__device, self.__textureImageMemory, None)
+            self.__allocator.free(self.__textureImageMemory)
 
         if self.__descriptorPool:
             vkDestroyDescriptorPool(self.__device, self.__descriptorPool, None)
 
-        if self.__uniformBuffer:
-            vkDestroyBuffer(self.__device, self.__uniformBuffer, None)
-
-        if self.__uniformBufferMemory:
-            vkFreeMemory(self.__device, self.__uniformBufferMemory, None)
-
-        if self.__vertexBuffer:
-            vkDestroyBuffer(self.__device, self.__vertexBuffer, None)
-
-        if self.__vertexBufferMemory:
-            vkFreeMemory(self.__device, self.__vertexBufferMemory, None)
-
-        if self.__indexBuffer:
-            vkDestroyBuffer(self.__device, self.__indexBuffer, None)
+        if self.__uniformRing:
+            self.__ubos = []
+            self.__uniformRing.destroy()
+            self.__instanceRing.destroy()
+            self.__indirectRing.destroy()
 
-        if self.__indexBufferMemory:
-            vkFreeMemory(self.__device, self.__indexBufferMemory, None)
+        if self.__geometryPool:
+            self.__geometryPool.destroy()
 
-        if self.__imageAvailableSemaphore:
-            vkDestroySemaphore(self.__device, self.__imageAvailableSemaphore, None)
-        if self.__renderFinishedSemaphore:
-            vkDestroySemaphore(self.__device, self.__renderFinishedSemaphore, None)
+        [vkDestroySemaphore(self.__device, i, None) for i in self.__imageAvailableSemaphores]
+        [vkDestroySemaphore(self.__device, i, None) for i in self.__renderFinishedSemaphores]
+        [vkDestroyFence(self.__device, i, None) for i in self.__inFlightFences]
 
         if self.__descriptorSetLayout:
             vkDestroyDescriptorSetLayout(self.__device, self.__descriptorSetLayout, None)
 
         self.__cleanupSwapChain()
+        self.__cleanupPipeline()
+
+        if self.__pipelineCache:
+            self.__pipelineCache.save()
+            if self.verbose:
+                print(self.__pipelineCache)
+            self.__pipelineCache.destroy()
 
         if self.__commandPool:
             vkDestroyCommandPool(self.__device, self.__commandPool, None)
 
+        if self.__allocator:
+            self.__allocator.destroy()
+
         if self.__device:
             vkDestroyDevice(self.__device, None)
 
         if self.__callbcak:
-            vkDestroyDebugReportCallbackEXT(self.__instance, self.__callbcak, None)
+            self.__instanceFuncs.vkDestroyDebugReportCallbackEXT(self.__instance, self.__callbcak, None)
 
         if self.__surface:
-            vkDestroySurfaceKHR(self.__instance, self.__surface, None)
+            self.__instanceFuncs.vkDestroySurfaceKHR(self.__instance, self.__surface, None)
 
         if self.__instance:
             vkDestroyInstance(self.__instance, None)
@@ -352,7 +461,7 @@ class HelloTriangleApplication(QtGui.QWindow):
     def __cleanupSwapChain(self):
         vkDestroyImageView(self.__device, self.__depthImageView, None)
         vkDestroyImage(self.__device, self.__depthImage, None)
-        vkFreeMemory(self.__device, self.__depthImageMemory, None)
+        self.__allocator.free(self.__depthImageMemory)
 
         [vkDestroyFramebuffer(self.__device, i, None) for i in self.__swapChainFramebuffers]
         self.__swapChainFramebuffers = []
@@ -360,55 +469,103 @@ class HelloTriangleApplication(QtGui.QWindow):
         vkFreeCommandBuffers(self.__device, self.__commandPool, len(self.__commandBuffers), self.__commandBuffers)
         self.__swapChainFramebuffers = []
 
+        [vkDestroyImageView(self.__device, i, None) for i in self.__swapChainImageViews]
+        self.__swapChainImageViews = []
+
+        if self.__headless:
+            [vkDestroyImage(self.__device, i, None) for i in self.__swapChainImages]
+            [self.__allocator.free(i) for i in self.__offscreenImageMemory]
+            self.__offscreenImageMemory = []
+        else:
+            self.__deviceFuncs.vkDestroySwapchainKHR(self.__device, self.__swapChain, None)
+
+    def __cleanupPipeline(self):
         vkDestroyPipeline(self.__device, self.__pipeline, None)
         vkDestroyPipelineLayout(self.__device, self.__pipelineLayout, None)
         vkDestroyRenderPass(self.__device, self.__renderpass, None)
 
-        [vkDestroyImageView(self.__device, i, None) for i in self.__swapChainImageViews]
-        self.__swapChainImageViews = []
-        vkDestroySwapchainKHR(self.__device, self.__swapChain, None)
-
     def __recreateSwapChain(self):
+        startTime = time.perf_counter()
         vkDeviceWaitIdle(self.__device)
 
+        oldFormat = self.__swapChainImageFormat
+
         self.__cleanupSwapChain()
         self.__createSwapChain()
         self.__createImageViews()
-        self.__createRenderPass()
-        self.__createGraphicsPipeline()
-        self.__createDepthResources()
+
+        # viewport and scissor are dynamic, the pipeline only depends on
+        # the swap chain through the render pass attachment format
+        if self.__swapChainImageFormat != oldFormat:
+            self.__cleanupPipeline()
+            self.__createRenderPass()
+            self.__createGraphicsPipeline()
+
+        if len(self.__swapChainImages) > self.__uniformRing.slotCount:
+            self.__ubos = []
+            self.__uniformRing.destroy()
+            self.__instanceRing.destroy()
+            self.__indirectRing.destroy()
+            self.__createUniformBuffer()
+            self.__writeUniformDescriptor()
+
+        batch = self.__createUploadBatch()
+        self.__createDepthResources(batch)
+        self.__uploads.append(batch.submit())
+
         self.__createFrambuffers()
         self.__createCommandBuffers()
 
+        self.__imagesInFlight = [None] * len(self.__swapChainImages)
+
+        self.recreateTimes.append(time.perf_counter() - startTime)
+
     def initVulkan(self):
         self.__cretaeInstance()
         self.__setupDebugCallback()
         self.__createSurface()
         self.__pickPhysicalDevice()
         self.__createLogicalDevice()
+        self.__createAllocator()
+        self.__createPipelineCache()
         self.__createSwapChain()
         self.__createImageViews()
         self.__createRenderPass()
         self.__createDescriptorSetLayout()
+        # the pipeline's vertex input depends on the mesh
+        self.__loadModel()
+        self.__createScene()
+        self.__createVertexLayout()
         self.__createGraphicsPipeline()
         self.__createCommandPool()
-        self.__createDepthResources()
+
+        # every startup transfer goes into one batch, the CPU carries on
+        # with descriptors and command buffers while it executes
+        batch = self.__createUploadBatch()
+        self.__createDepthResources(batch)
         self.__createFrambuffers()
-        self.__createTextureImage()
+        self.__createTextureImage(batch)
+        self.__textureLoader.shutdown(False)
         self.__createTextureImageView()
         self.__createTextureSampler()
-        self.__loadModel()
-        self.__createVertexBuffer()
-        self.__createIndexBuffer()
+        self.__createGeometry(batch)
+        self.__uploads.append(batch.submit())
+        self.__createMeshlets()
+
         self.__createUniformBuffer()
         self.__createDescriptorPool()
         self.__createDescriptorSet()
         self.__createCommandBuffers()
-        self.__createSemaphores()
+        self.__createSyncObjects()
 
     def __cretaeInstance(self):
-        if enableValidationLayers and not self.__checkValidationLayerSupport():
-            raise Exception("validation layers requested, but not available!")
+        if self.__validation:
+            self.__validationLayers = self.__supportedValidationLayers()
+            if not self.__validationLayers:
+                # render nodes and CI machines rarely have the SDK installed
+                if not self.__headless:
+                    raise Exception("validation layers requested, but not available!")
+                print('validation layers not available, running without them')
 
         appInfo = VkApplicationInfo(
             # sType=VK_STRUCTURE_TYPE_APPLICATION_INFO,
@@ -420,11 +577,11 @@ class HelloTriangleApplication(QtGui.QWindow):
         )
 
         extenstions = self.__getRequiredExtensions()
-        if enableValidationLayers:
+        if self.__validationLayers:
             instanceInfo = VkInstanceCreateInfo(
                 pApplicationInfo=appInfo,
                 # enabledLayerCount=len(validationLayers),
-                ppEnabledLayerNames=validationLayers,
+                ppEnabledLayerNames=self.__validationLayers,
                 # enabledExtensionCount=len(extenstions),
                 ppEnabledExtensionNames=extenstions
             )
@@ -438,10 +595,10 @@ class HelloTriangleApplication(QtGui.QWindow):
 
         self.__instance = vkCreateInstance(instanceInfo, None)
 
-        InstanceProcAddr.T = self.__instance
+        self.__instanceFuncs = DispatchTable(vkGetInstanceProcAddr, self.__instance)
 
     def __setupDebugCallback(self):
-        if not enableValidationLayers:
+        if not self.__validationLayers:
             return
 
         createInfo = VkDebugReportCallbackCreateInfoEXT(
@@ -449,9 +606,12 @@ class HelloTriangleApplication(QtGui.QWindow):
             pfnCallback=debugCallback
         )
 
-        self.__callbcak = vkCreateDebugReportCallbackEXT(self.__instance, createInfo, None)
+        self.__callbcak = self.__instanceFuncs.vkCreateDebugReportCallbackEXT(self.__instance, createInfo, None)
 
     def __createSurface(self):
+        if self.__headless:
+            return
+
         if sys.platform == 'win32':
             hwnd = self.winId()
             hinstance = Win32misc.getInstance(hwnd)
@@ -460,7 +620,7 @@ class HelloTriangleApplication(QtGui.QWindow):
                 hwnd=hwnd
             )
 
-            self.__surface = vkCreateWin32SurfaceKHR(self.__instance, createInfo, None)
+            self.__surface = self.__instanceFuncs.vkCreateWin32SurfaceKHR(self.__instance, createInfo, None)
         # elif sys.platform == 'linux':
         #     pass
 
@@ -489,14 +649,26 @@ class HelloTriangleApplication(QtGui.QWindow):
 
         deviceFeatures = VkPhysicalDeviceFeatures()
         deviceFeatures.samplerAnisotropy = True
-        if enableValidationLayers:
+        # needed to sample BC compressed baked textures
+        self.__textureCompressionBC = bool(vkGetPhysicalDeviceFeatures(self.__physicalDevice).textureCompressionBC)
+        deviceFeatures.textureCompressionBC = self.__textureCompressionBC
+        # one indirect call for all draws of a frame, and per instance draws
+        # selecting their instance through firstInstance
+        supportedFeatures = vkGetPhysicalDeviceFeatures(self.__physicalDevice)
+        self.__multiDrawIndirect = bool(supportedFeatures.multiDrawIndirect)
+        self.__drawIndirectFirstInstance = bool(supportedFeatures.drawIndirectFirstInstance)
+        deviceFeatures.multiDrawIndirect = self.__multiDrawIndirect
+        deviceFeatures.drawIndirectFirstInstance = self.__drawIndirectFirstInstance
+        if self.__multiDrawIndirect:
+            self.__maxDrawIndirectCount = vkGetPhysicalDeviceProperties(self.__physicalDevice).limits.maxDrawIndirectCount
+        if self.__validationLayers:
             createInfo = VkDeviceCreateInfo(
                 # queueCreateInfoCount=len(queueCreateInfos),
                 pQueueCreateInfos=queueCreateInfos,
                 # enabledExtensionCount=len(deviceExtensions),
-                ppEnabledExtensionNames=deviceExtensions,
+                ppEnabledExtensionNames=self.__requiredDeviceExtensions,
                 # enabledLayerCount=len(validationLayers),
-                ppEnabledLayerNames=validationLayers,
+                ppEnabledLayerNames=self.__validationLayers,
                 pEnabledFeatures=deviceFeatures
             )
         else:
@@ -504,19 +676,48 @@ class HelloTriangleApplication(QtGui.QWindow):
                 queueCreateInfoCount=1,
                 pQueueCreateInfos=queueCreateInfo,
                 # enabledExtensionCount=len(deviceExtensions),
-                ppEnabledExtensionNames=deviceExtensions,
+                ppEnabledExtensionNames=self.__requiredDeviceExtensions,
                 enabledLayerCount=0,
                 pEnabledFeatures=deviceFeatures
             )
 
         self.__device = vkCreateDevice(self.__physicalDevice, createInfo, None)
 
-        DeviceProcAddr.T = self.__device
+        self.__deviceFuncs = DispatchTable(vkGetDeviceProcAddr, self.__device)
 
         self.__graphicQueue = vkGetDeviceQueue(self.__device, indices.graphicsFamily, 0)
         self.__presentQueue = vkGetDeviceQueue(self.__device, indices.presentFamily, 0)
 
+    def __createAllocator(self):
+        self.__allocator = DeviceMemoryAllocator(self.__device, self.__physicalDevice)
+
+    def __createPipelineCache(self):
+        self.__pipelineCache = PipelineCache(self.__device, self.__physicalDevice, self.pipelineCachePath)
+
+    def __createOffscreenTargets(self):
+        # stands in for the swap chain in headless mode, one color image per
+        # frame in flight, left in TRANSFER_SRC layout for readback
+        self.__swapChainImageFormat = VK_FORMAT_R8G8B8A8_UNORM
+        self.__swapChainExtent = VkExtent2D(self.width(), self.height())
+
+        self.__swapChainImages = []
+        self.__offscreenImageMemory = []
+        for i in range(self.__framesInFlight):
+            image, imageMemory = self.__createImage(self.__swapChainExtent.width,
+                                                    self.__swapChainExtent.height,
+                                                    1,
+                                                    self.__swapChainImageFormat,
+                                                    VK_IMAGE_TILING_OPTIMAL,
+                                                    VK_IMAGE_USAGE_COLOR_ATTACHMENT_BIT | VK_IMAGE_USAGE_TRANSFER_SRC_BIT,
+                                                    VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
+            self.__swapChainImages.append(image)
+            self.__offscreenImageMemory.append(imageMemory)
+
     def __createSwapChain(self):
+        if self.__headless:
+            self.__createOffscreenTargets()
+            return
+
         swapChainSupport = self.__querySwapChainSupport(self.__physicalDevice)
 
         surfaceFormat = self.__chooseSwapSurfaceFormat(swapChainSupport.formats)
@@ -565,10 +766,10 @@ class HelloTriangleApplication(QtGui.QWindow):
                 clipped=True
             )
 
-        self.__swapChain = vkCreateSwapchainKHR(self.__device, createInfo, None)
+        self.__swapChain = self.__deviceFuncs.vkCreateSwapchainKHR(self.__device, createInfo, None)
         assert self.__swapChain != None
 
-        self.__swapChainImages = vkGetSwapchainImagesKHR(self.__device, self.__swapChain)
+        self.__swapChainImages = self.__deviceFuncs.vkGetSwapchainImagesKHR(self.__device, self.__swapChain)
 
         self.__swapChainImageFormat = surfaceFormat.format
         self.__swapChainExtent = extent
@@ -589,7 +790,7 @@ class HelloTriangleApplication(QtGui.QWindow):
             stencilLoadOp=VK_ATTACHMENT_LOAD_OP_DONT_CARE,
             stencilStoreOp=VK_ATTACHMENT_STORE_OP_DONT_CARE,
             initialLayout=VK_IMAGE_LAYOUT_UNDEFINED,
-            finalLayout=VK_IMAGE_LAYOUT_PRESENT_SRC_KHR
+            finalLayout=VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL if self.__headless else VK_IMAGE_LAYOUT_PRESENT_SRC_KHR
         )
 
         depthAttachment = VkAttachmentDescription(
@@ -639,7 +840,7 @@ class HelloTriangleApplication(QtGui.QWindow):
     def __createDescriptorSetLayout(self):
         uboLayoutBinding = VkDescriptorSetLayoutBinding(
             binding=0,
-            descriptorType=VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER,
+            descriptorType=VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC,
             descriptorCount=1,
             stageFlags=VK_SHADER_STAGE_VERTEX_BIT
         )
@@ -658,7 +859,9 @@ class HelloTriangleApplication(QtGui.QWindow):
         self.__descriptorSetLayout = vkCreateDescriptorSetLayout(self.__device, layoutInfo, None)
 
     def __createGraphicsPipeline(self):
-        vertexShaderMode = self.__createShaderModule('shader/vert.spv')
+        # without a color attribute the shader supplies the constant white
+        vertexShader = 'shader/vert_instanced.spv' if self.__vertexLayout.has('color') else 'shader/vert_quantized.spv'
+        vertexShaderMode = self.__createShaderModule(vertexShader)
         fragmentShaderMode = self.__createShaderModule('shader/frag.spv')
 
         vertexShaderStageInfo = VkPipelineShaderStageCreateInfo(
@@ -674,12 +877,12 @@ class HelloTriangleApplication(QtGui.QWindow):
 
         shaderStageInfos = [vertexShaderStageInfo, fragmentShaderStageInfo]
 
-        bindingDescription = Vertex.getBindingDescription()
-        attributeDescription = Vertex.getAttributeDescriptions()
+        bindingDescriptions = [Vertex.getBindingDescription(self.__vertexLayout), Instance.getBindingDescription()]
+        attributeDescription = Vertex.getAttributeDescriptions(self.__vertexLayout) + Instance.getAttributeDescriptions()
 
         vertexInputInfo = VkPipelineVertexInputStateCreateInfo(
             # vertexBindingDescriptionCount=0,
-            pVertexBindingDescriptions=[bindingDescription],
+            pVertexBindingDescriptions=bindingDescriptions,
             # vertexAttributeDescriptionCount=0,
             pVertexAttributeDescriptions=attributeDescription,
         )
@@ -689,17 +892,17 @@ class HelloTriangleApplication(QtGui.QWindow):
             primitiveRestartEnable=False
         )
 
-        viewport = VkViewport(0.0, 0.0,
-                              float(self.__swapChainExtent.width),
-                              float(self.__swapChainExtent.height),
-                              0.0, 1.0)
-
-        scissor = VkRect2D([0, 0], self.__swapChainExtent)
+        # viewport and scissor are set when recording, so resizing the
+        # window does not require a new pipeline
         viewportStage = VkPipelineViewportStateCreateInfo(
             viewportCount=1,
-            pViewports=viewport,
+            pViewports=None,
             scissorCount=1,
-            pScissors=scissor
+            pScissors=None
+        )
+
+        dynamicState = VkPipelineDynamicStateCreateInfo(
+            pDynamicStates=[VK_DYNAMIC_STATE_VIEWPORT, VK_DYNAMIC_STATE_SCISSOR]
         )
 
         rasterizer = VkPipelineRasterizationStateCreateInfo(
@@ -756,13 +959,14 @@ class HelloTriangleApplication(QtGui.QWindow):
             pMultisampleState=multisampling,
             pColorBlendState=colorBending,
             pDepthStencilState=depthStencil,
+            pDynamicState=dynamicState,
             layout=self.__pipelineLayout,
             renderPass=self.__renderpass,
             subpass=0,
             basePipelineHandle=VK_NULL_HANDLE
         )
 
-        self.__pipeline = vkCreateGraphicsPipelines(self.__device, VK_NULL_HANDLE, 1, pipelineInfo, None)#[0]
+        self.__pipeline = self.__pipelineCache.createGraphicsPipeline(pipelineInfo)#[0]
 
         vkDestroyShaderModule(self.__device, vertexShaderMode, None)
         vkDestroyShaderModule(self.__device, fragmentShaderMode, None)
@@ -783,13 +987,26 @@ class HelloTriangleApplication(QtGui.QWindow):
     def __createCommandPool(self):
         queueFamilyIndices = self.__findQueueFamilies(self.__physicalDevice)
 
+        # meshlet culling records command buffers again every frame
         createInfo = VkCommandPoolCreateInfo(
+            flags=VK_COMMAND_POOL_CREATE_RESET_COMMAND_BUFFER_BIT,
             queueFamilyIndex=queueFamilyIndices.graphicsFamily
         )
 
         self.__commandPool = vkCreateCommandPool(self.__device, createInfo, None)
 
-    def __createDepthResources(self):
+    def __createUploadBatch(self):
+        return UploadBatch(self.__device, self.__commandPool, self.__graphicQueue, self.__allocator)
+
+    def __collectUploads(self, wait=False):
+        for ticket in self.__uploads:
+            if wait:
+                ticket.wait()
+            else:
+                ticket.poll()
+        self.__uploads = [ticket for ticket in self.__uploads if not ticket.done]
+
+    def __createDepthResources(self, batch):
         depthFormat = self.depthFormat
 
         self.__depthImage, self.__depthImageMemory = self.__createImage(self.__swapChainExtent.width,
@@ -802,8 +1019,8 @@ class HelloTriangleApplication(QtGui.QWindow):
         self.__depthImageView = self.__createImageView(self.__depthImage, depthFormat,
                                                        VK_IMAGE_ASPECT_DEPTH_BIT, 1)
 
-        self.__transitionImageLayout(self.__depthImage, depthFormat, VK_IMAGE_LAYOUT_UNDEFINED,
-                                     VK_IMAGE_LAYOUT_DEPTH_STENCIL_ATTACHMENT_OPTIMAL, 1)
+        batch.transitionImageLayout(self.__depthImage, depthFormat, VK_IMAGE_LAYOUT_UNDEFINED,
+                                    VK_IMAGE_LAYOUT_DEPTH_STENCIL_ATTACHMENT_OPTIMAL, 1)
 
     def __findSupportedFormat(self, candidates, tiling, feature):
         for i in candidates:
@@ -821,26 +1038,59 @@ class HelloTriangleApplication(QtGui.QWindow):
                                           VK_IMAGE_TILING_OPTIMAL,
                                           VK_FORMAT_FEATURE_DEPTH_STENCIL_ATTACHMENT_BIT)
 
-    def hasStencilComponent(self, fm):
-        return fm == VK_FORMAT_D32_SFLOAT_S8_UINT or fm == VK_FORMAT_D24_UNORM_S8_UINT
-
-    def __createTextureImage(self):
-        _image = Image.open(self.texturePath)
-        _image.putalpha(1)
-        width = _image.width
-        height = _image.height
-        imageSize = width * height * 4
-
-        self.__mipLevels = int(math.floor(math.log2(max(width, height)))) + 1
+    def __supportsTextureFormat(self, imFormat):
+        if bcn.isCompressed(imFormat) and not self.__textureCompressionBC:
+            return False
+
+        feature = VK_FORMAT_FEATURE_SAMPLED_IMAGE_BIT | VK_FORMAT_FEATURE_SAMPLED_IMAGE_FILTER_LINEAR_BIT
+        props = vkGetPhysicalDeviceFormatProperties(self.__physicalDevice, imFormat)
+        return props.optimalTilingFeatures & feature == feature
+
+    def __useBlitMipmaps(self, imFormat, width, height):
+        if self.mipmaps != 'auto':
+            return self.mipmaps == 'gpu'
+
+        # blits need linear filtering support, and halving with int(mipWidth / 2)
+        # drops texels of odd sized levels, the CPU chain handles both
+        props = vkGetPhysicalDeviceFormatProperties(self.__physicalDevice, imFormat)
+        linearBlit = props.optimalTilingFeatures & VK_FORMAT_FEATURE_SAMPLED_IMAGE_FILTER_LINEAR_BIT
+        return bool(linearBlit) and texture.isPowerOfTwo(width) and texture.isPowerOfTwo(height)
+
+    def __createTextureImage(self, batch):
+        decoded = self.__textureFuture.result()
+        self.__textureFuture = None
+
+        if decoded.format != VK_FORMAT_R8G8B8A8_UNORM and not self.__supportsTextureFormat(decoded.format):
+            if not bcn.canEncode(decoded.format):
+                raise Exception('texture format {} is not supported!'.format(decoded.format))
+            # the device can't sample this block format, decompress on the CPU instead
+            chain = [bcn.decode(decoded.data[offset:], w, h, decoded.format)
+                     for offset, w, h in decoded.levels]
+            data, levels = texture.packMipChain(chain)
+            decoded = texture.BakedTexture(VK_FORMAT_R8G8B8A8_UNORM, decoded.width, decoded.height, levels, data)
+
+        width = decoded.width
+        height = decoded.height
+        self.__mipLevels = texture.mipLevelCount(width, height)
+
+        if decoded.mipLevels > 1 or self.__mipLevels == 1:
+            # every level is ready, from the baked file or the loader
+            self.__mipLevels = decoded.mipLevels
+            self.__uploadMipChain(batch, decoded.format, width, height, decoded.data, decoded.levels)
+            return
 
-        stagingBuffer, stagingMem = self.__createBuffer(imageSize, VK_BUFFER_USAGE_TRANSFER_SRC_BIT,
-                                                        VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
+        if not self.__useBlitMipmaps(VK_FORMAT_R8G8B8A8_UNORM, width, height):
+            pixels = np.asarray(decoded.data).reshape(height, width, 4)
+            chain = texture.buildMipChain(pixels, self.mipmapFilter, self.__mipLevels)
+            data, levels = texture.packMipChain(chain)
+            self.__uploadMipChain(batch, VK_FORMAT_R8G8B8A8_UNORM, width, height, data, levels)
 
-        data = vkMapMemory(self.__device, stagingMem, 0, imageSize, 0)
-        ffi.memmove(data, _image.tobytes(), imageSize)
-        vkUnmapMemory(self.__device, stagingMem)
+            # the chain is built anyway, keep it for the next start
+            sourceHash = mesh.fileHash(self.texturePath) if os.path.isfile(self.texturePath) else b''
+            texture.saveTexture(self.bakedTexturePath, VK_FORMAT_R8G8B8A8_UNORM, width, height, chain, sourceHash)
+            return
 
-        del _image
+        stagingBuffer = batch.stage(decoded.data)
 
         self.__textureImage, self.__textureImageMemory = self.__createImage(width, height,
                                                                             self.__mipLevels,
@@ -849,22 +1099,33 @@ class HelloTriangleApplication(QtGui.QWindow):
                                                                             VK_IMAGE_USAGE_TRANSFER_SRC_BIT | VK_IMAGE_USAGE_TRANSFER_DST_BIT | VK_IMAGE_USAGE_SAMPLED_BIT,
                                                                             VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
 
-        self.__transitionImageLayout(self.__textureImage, VK_FORMAT_R8G8B8A8_UNORM,
-                                     VK_IMAGE_LAYOUT_UNDEFINED, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
-                                     self.__mipLevels)
-        self.__copyBufferToImage(stagingBuffer, self.__textureImage, width, height)
-        # self.__transitionImageLayout(self.__textureImage, VK_FORMAT_R8G8B8A8_UNORM,
-        #                              VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL,
-        #                              self.__mipLevels)
+        batch.transitionImageLayout(self.__textureImage, VK_FORMAT_R8G8B8A8_UNORM,
+                                    VK_IMAGE_LAYOUT_UNDEFINED, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+                                    self.__mipLevels)
+        batch.copyBufferToImage(stagingBuffer, self.__textureImage, width, height)
 
-        vkDestroyBuffer(self.__device, stagingBuffer, None)
-        vkFreeMemory(self.__device, stagingMem, None)
+        self.__generateMipmaps(batch.commandBuffer, self.__textureImage, width, height, self.__mipLevels)
 
-        self.__generateMipmaps(self.__textureImage, width, height, self.__mipLevels)
+    def __uploadMipChain(self, batch, imFormat, width, height, data, levels):
+        self.__textureFormat = imFormat
+        stagingBuffer = batch.stage(data)
 
-    def __generateMipmaps(self, image, width, height, mipLevels):
-        cmdbuffer = self.__beginSingleTimeCommands()
+        self.__textureImage, self.__textureImageMemory = self.__createImage(width, height,
+                                                                            len(levels),
+                                                                            imFormat,
+                                                                            VK_IMAGE_TILING_OPTIMAL,
+                                                                            VK_IMAGE_USAGE_TRANSFER_DST_BIT | VK_IMAGE_USAGE_SAMPLED_BIT,
+                                                                            VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
 
+        batch.transitionImageLayout(self.__textureImage, imFormat,
+                                    VK_IMAGE_LAYOUT_UNDEFINED, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+                                    len(levels))
+        batch.copyBufferToImageLevels(stagingBuffer, self.__textureImage, levels)
+        batch.transitionImageLayout(self.__textureImage, imFormat,
+                                    VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL,
+                                    len(levels))
+
+    def __generateMipmaps(self, cmdbuffer, image, width, height, mipLevels):
         subresourceRange = VkImageSubresourceRange(
             aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
             baseArrayLayer=0,
@@ -952,10 +1213,8 @@ class HelloTriangleApplication(QtGui.QWindow):
                              0, 0, None, 0, None,
                              1, barrier)
 
-        self.__endSingleTimeCommands(cmdbuffer)
-
     def __createTextureImageView(self):
-        self.__textureImageView = self.__createImageView(self.__textureImage, VK_FORMAT_R8G8B8A8_UNORM,
+        self.__textureImageView = self.__createImageView(self.__textureImage, self.__textureFormat,
                                                          VK_IMAGE_ASPECT_COLOR_BIT, self.__mipLevels)
 
     def __createTextureSampler(self):
@@ -1012,186 +1271,157 @@ class HelloTriangleApplication(QtGui.QWindow):
 
         image = vkCreateImage(self.__device, imageInfo, None)
 
-        memReuirements = vkGetImageMemoryRequirements(self.__device, image)
-        allocInfo = VkMemoryAllocateInfo(
-            allocationSize=memReuirements.size,
-            memoryTypeIndex=self.__findMemoryType(memReuirements.memoryTypeBits, properties)
-        )
-
-        imageMemory = vkAllocateMemory(self.__device, allocInfo, None)
-
-        vkBindImageMemory(self.__device, image, imageMemory, 0)
+        imageMemory = self.__allocator.allocateImage(image, properties, tiling == VK_IMAGE_TILING_LINEAR)
 
         return (image, imageMemory)
 
-    def __transitionImageLayout(self, image, imFormat, oldLayout, newLayout, mipLevels):
-        cmdBuffer = self.__beginSingleTimeCommands()
-
-        subresourceRange = VkImageSubresourceRange(
-            aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
-            baseMipLevel=0,
-            levelCount=mipLevels,
-            baseArrayLayer=0,
-            layerCount=1
-        )
-        if newLayout == VK_IMAGE_LAYOUT_DEPTH_STENCIL_ATTACHMENT_OPTIMAL:
-            subresourceRange.aspectMask = VK_IMAGE_ASPECT_DEPTH_BIT
-            if self.hasStencilComponent(imFormat):
-                subresourceRange.aspectMask = VK_IMAGE_ASPECT_DEPTH_BIT | VK_IMAGE_ASPECT_STENCIL_BIT
-
-        barrier = VkImageMemoryBarrier(
-            oldLayout=oldLayout,
-            newLayout=newLayout,
-            srcQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
-            dstQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
-            image=image,
-            subresourceRange=subresourceRange
-        )
-
-        sourceStage = 0
-        destinationStage = 0
-
-        if oldLayout == VK_IMAGE_LAYOUT_UNDEFINED and newLayout == VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL:
-            barrier.srcAccessMask = 0
-            barrier.dstAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT
-
-            sourceStage = VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT
-            destinationStage = VK_PIPELINE_STAGE_TRANSFER_BIT
-        elif oldLayout == VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL and newLayout == VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL:
-            barrier.srcAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT
-            barrier.dstAccessMask = VK_ACCESS_SHADER_READ_BIT
-
-            sourceStage = VK_PIPELINE_STAGE_TRANSFER_BIT
-            destinationStage = VK_PIPELINE_STAGE_FRAGMENT_SHADER_BIT
-        elif oldLayout == VK_IMAGE_LAYOUT_UNDEFINED and newLayout == VK_IMAGE_LAYOUT_DEPTH_STENCIL_ATTACHMENT_OPTIMAL:
-            barrier.srcAccessMask = 0
-            barrier.dstAccessMask = VK_ACCESS_DEPTH_STENCIL_ATTACHMENT_READ_BIT | VK_ACCESS_DEPTH_STENCIL_ATTACHMENT_WRITE_BIT
-
-            sourceStage = VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT
-            destinationStage = VK_PIPELINE_STAGE_EARLY_FRAGMENT_TESTS_BIT
-        else:
-            raise Exception('unsupported layout transition!')
-
-        vkCmdPipelineBarrier(cmdBuffer,
-                             sourceStage,
-                             destinationStage,
-                             0,
-                             0, None,
-                             0, None,
-                             1, barrier)
-
-        self.__endSingleTimeCommands(cmdBuffer)
-
-    def __copyBufferToImage(self, buffer, image, width, height):
-        cmdbuffer = self.__beginSingleTimeCommands()
-
-        subresource = VkImageSubresourceLayers(
-            aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
-            mipLevel=0,
-            baseArrayLayer=0,
-            layerCount=1
-        )
-        region = VkBufferImageCopy(
-            bufferOffset=0,
-            bufferRowLength=0,
-            bufferImageHeight=0,
-            imageSubresource=subresource,
-            imageOffset=[0, 0],
-            imageExtent=[width, height, 1]
-        )
-
-        vkCmdCopyBufferToImage(cmdbuffer, buffer, image, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, 1, region)
-
-        self.__endSingleTimeCommands(cmdbuffer)
-
     def __loadModel(self):
         # startTime = time.time()
-        model = tol.LoadObj(self.modelPath)
-        attrib = model['attribs']
-        vertices = attrib['vertices']
-        texcoords = attrib['texcoords']
-        shapes = model['shapes']
-
-        uniqueVertices = {}
-        vertexData = []
-        indexData = []
-        for shape in shapes:
-            allIndices = shapes[shape]['indices']
-            for idx in range(0, len(allIndices), 3):
-                vid = allIndices[idx]
-                tid = allIndices[idx+2]
-                data = (
-                    # vertex position
-                    vertices[3 * vid + 0],
-                    vertices[3 * vid + 1],
-                    vertices[3 * vid + 2],
-
-                    # color
-                    1.0, 1.0, 1.0,
-
-                    # texture coord
-                    texcoords[2 * tid + 0],
-                    1.0 - texcoords[2 * tid + 1]
-                )
-
-                if data not in uniqueVertices:
-                    uniqueVertices[data] = len(vertexData)
-                    vertexData.append(data)
-                indexData.append(uniqueVertices[data])
+        sourceHash = mesh.fileHash(self.modelPath)
+        cached = mesh.loadMeshCache(self.modelCachePath, sourceHash, mesh.VERTEX_LAYOUT)
+        if cached:
+            self.__vertices = cached['vertices']
+            self.__indices = cached['indices']
+        else:
+            positions, texcoords, positionIndices, texcoordIndices = mesh.loadObj(self.modelPath, workers=None)
+
+            self.__vertices, self.__indices = mesh.deduplicateVertices(positions, texcoords,
+                                                                       positionIndices, texcoordIndices)
+
+        # whatever the cache is missing is built and the cache rewritten
+        sections = {name: a for name, a in (cached or {}).items() if name not in ('vertices', 'indices')}
+        changed = not cached
+        if self.optimizeMesh and 'vcache' not in sections:
+            acmr, atvr = meshopt.vertexCacheStats(self.__indices, len(self.__vertices))
+            self.__vertices, self.__indices = meshopt.optimizeMesh(self.__vertices, self.__indices)
+            newAcmr, newAtvr = meshopt.vertexCacheStats(self.__indices, len(self.__vertices))
+            if self.verbose:
+                print('vertex cache: ACMR {:.3f} -> {:.3f}, ATVR {:.3f} -> {:.3f}'.format(acmr, newAcmr, atvr, newAtvr))
+            sections['vcache'] = np.array([meshopt.DEFAULT_CACHE_SIZE], np.uint32)
+            # renumbered vertices invalidate the LOD chain
+            for name in lod.LOD_SECTIONS:
+                sections.pop(name, None)
+            changed = True
+
+        if self.meshLods and 'lodRanges' not in sections:
+            levels = lod.buildLodChain(self.__vertices, self.__indices)
+            if self.verbose:
+                print('LOD triangles: ' + ', '.join(str(len(indices) // 3) for indices, _ in levels))
+            sections.update(lod.toSections(levels))
+            changed = True
+
+        if self.meshLods:
+            self.__lodLevels = lod.fromSections(self.__indices, sections)
+        else:
+            self.__lodLevels = [(self.__indices, 0.0)]
+        self.__boundingSphere = lod.boundingSphere(self.__vertices)
 
+        if changed:
+            mesh.saveMeshCache(self.modelCachePath, sourceHash, mesh.VERTEX_LAYOUT,
+                               vertices=self.__vertices, indices=self.__indices, **sections)
         # useTime = time.time() - startTime
         # print('Model loading time: {} s'.format(useTime))
-        self.__vertices = np.array(vertexData, np.float32)
-        self.__indices = np.array(indexData, np.uint32)
-
-    def __createVertexBuffer(self):
-        bufferSize = self.__vertices.nbytes
-
-        stagingBuffer, stagingMemory = self.__createBuffer(bufferSize, VK_BUFFER_USAGE_TRANSFER_SRC_BIT,
-                                                           VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
-
-        data = vkMapMemory(self.__device, stagingMemory, 0, bufferSize, 0)
-        vertePtr = ffi.cast('float *', self.__vertices.ctypes.data)
-        ffi.memmove(data, vertePtr, bufferSize)
-        vkUnmapMemory(self.__device, stagingMemory)
-
-        self.__vertexBuffer, self.__vertexBufferMemory = self.__createBuffer(bufferSize,
-                                                                             VK_BUFFER_USAGE_TRANSFER_DST_BIT | VK_BUFFER_USAGE_VERTEX_BUFFER_BIT,
-                                                                             VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
-        self.__copyBuffer(stagingBuffer, self.__vertexBuffer, bufferSize)
-
-        vkDestroyBuffer(self.__device, stagingBuffer, None)
-        vkFreeMemory(self.__device, stagingMemory, None)
-
-    def __createIndexBuffer(self):
-        bufferSize = self.__indices.nbytes
-
-        stagingBuffer, stagingMemory = self.__createBuffer(bufferSize, VK_BUFFER_USAGE_TRANSFER_SRC_BIT,
-                                                           VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
-        data = vkMapMemory(self.__device, stagingMemory, 0, bufferSize, 0)
 
-        indicesPtr = ffi.cast('uint16_t*', self.__indices.ctypes.data)
-        ffi.memmove(data, indicesPtr, bufferSize)
-
-        vkUnmapMemory(self.__device, stagingMemory)
-
-        self.__indexBuffer, self.__indexBufferMemory = self.__createBuffer(bufferSize,
-                                                                           VK_BUFFER_USAGE_TRANSFER_DST_BIT | VK_BUFFER_USAGE_INDEX_BUFFER_BIT,
-                                                                           VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
-
-        self.__copyBuffer(stagingBuffer, self.__indexBuffer, bufferSize)
+    def __createScene(self):
+        positions = self.__vertices[:, :3]
+        lower = positions.min(axis=0)
+        upper = positions.max(axis=0)
+
+        # a square grid in the xy plane centered on the first copy
+        columns = int(math.ceil(math.sqrt(self.instanceCount)))
+        spacing = 1.2 * float((upper - lower)[:2].max())
+        grid = np.arange(self.instanceCount)
+        self.__placements = np.tile(np.identity(4, np.float32), (self.instanceCount, 1, 1))
+        self.__placements[:, 3, 0] = (grid % columns - (columns - 1) // 2) * spacing
+        self.__placements[:, 3, 1] = (grid // columns - (columns - 1) // 2) * spacing
+
+        self.__instanceIds = self.scene.addObjects(self.__placements, lower, upper)
+
+    def __createVertexLayout(self):
+        layout = vertexformat.VertexLayout.fromVertices(self.__vertices, self.vertexPositions)
+        color = layout.constants.get('color')
+        if color is not None and (color != 1.0).any():
+            # shader/vert_quantized.spv can only stand in for white
+            layout = vertexformat.VertexLayout.fromVertices(self.__vertices, self.vertexPositions, dropConstant=False)
+
+        if self.verbose:
+            for line in layout.report(self.__vertices):
+                print('vertices: ' + line)
+        self.__vertexLayout = layout
+        self.__positionTransform = layout.positionTransform
+
+    def __createGeometry(self, batch):
+        # every LOD level in one index range, 16 bit indices when every draw
+        # of every level reaches its vertices from a base vertex
+        split = [meshopt.splitIndices16(levelIndices) for levelIndices, _ in self.__lodLevels]
+        levels = []
+        firstIndex = 0
+        if all(levelIndices is not None for levelIndices, _ in split):
+            indices = np.concatenate([levelIndices for levelIndices, _ in split])
+            for levelIndices, subMeshes in split:
+                levels.append([meshopt.SubMesh(firstIndex + subMesh.firstIndex, subMesh.indexCount, subMesh.vertexOffset)
+                               for subMesh in subMeshes])
+                firstIndex += len(levelIndices)
+            self.__indexType = VK_INDEX_TYPE_UINT16
+        else:
+            indices = np.concatenate([np.asarray(levelIndices, np.uint32) for levelIndices, _ in self.__lodLevels])
+            for levelIndices, _ in self.__lodLevels:
+                levels.append([meshopt.SubMesh(firstIndex, len(levelIndices), 0)])
+                firstIndex += len(levelIndices)
+            self.__indexType = VK_INDEX_TYPE_UINT32
+
+        vertices = self.__vertexLayout.pack(self.__vertices)
+        self.__geometryPool = geometry.GeometryPool(self.__device, self.__allocator, self.__vertexLayout.stride,
+                                                    len(vertices), len(indices), self.__indexType)
+        self.__poolMesh = self.__geometryPool.add(batch, vertices, indices)
+
+        # draws of the model are relative to its ranges in the pool
+        poolMesh = self.__poolMesh
+        self.__subMeshes = [[meshopt.SubMesh(poolMesh.firstIndex + subMesh.firstIndex, subMesh.indexCount,
+                                             poolMesh.vertexOffset + subMesh.vertexOffset) for subMesh in subMeshes]
+                            for subMeshes in levels]
+
+    def __createMeshlets(self):
+        if not self.meshletCulling:
+            return
 
-        vkDestroyBuffer(self.__device, stagingBuffer, None)
-        vkFreeMemory(self.__device, stagingMemory, None)
+        # meshlets never cross a sub mesh, so they keep its base vertex
+        startTime = time.perf_counter()
+        self.__meshlets = []
+        for (levelIndices, _), subMeshes in zip(self.__lodLevels, self.__subMeshes):
+            levelStart = subMeshes[0].firstIndex if subMeshes else 0
+            self.__meshlets.append(meshlet.Meshlets.concatenate(
+                meshlet.buildMeshlets(self.__vertices,
+                                      levelIndices[subMesh.firstIndex - levelStart:
+                                                   subMesh.firstIndex - levelStart + subMesh.indexCount],
+                                      firstIndex=subMesh.firstIndex, vertexOffset=subMesh.vertexOffset)
+                for subMesh in subMeshes))
+        if self.verbose:
+            print('meshlets per LOD level: {} in {:.3f} s'.format(
+                ', '.join(str(len(m)) for m in self.__meshlets), time.perf_counter() - startTime))
 
     def __createUniformBuffer(self):
-        self.__uniformBuffer, self.__uniformBufferMemory = self.__createBuffer(self.__ubo.nbytes,
-                                                                               VK_BUFFER_USAGE_UNIFORM_BUFFER_BIT,
-                                                                               VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
+        # one slot per swap chain image, the command buffer of each image
+        # selects its slot with a dynamic offset
+        self.__uniformRing = UniformRingBuffer(self.__device, self.__physicalDevice, self.__allocator,
+                                               UniformBufferObject.NBYTES, len(self.__swapChainImages))
+        self.__ubos = [UniformBufferObject(self.__uniformRing.view(i)) for i in range(self.__uniformRing.slotCount)]
+
+        # bound as vertex buffer 1 at the offset of the image's slot
+        self.__instanceRing = UniformRingBuffer(self.__device, self.__physicalDevice, self.__allocator,
+                                                Instance.MODEL.nbytes * max(self.instanceCount, 1),
+                                                len(self.__swapChainImages), VK_BUFFER_USAGE_VERTEX_BUFFER_BIT)
+
+        # room for every meshlet of the largest level, once per copy for draws per instance
+        maxDraws = max([len(m) for m in self.__meshlets] + [len(s) for s in self.__subMeshes] + [1])
+        self.__indirectRing = UniformRingBuffer(self.__device, self.__physicalDevice, self.__allocator,
+                                                indirect.DRAW_INDEXED_INDIRECT_COMMAND.itemsize * maxDraws *
+                                                max(self.instanceCount, 1),
+                                                len(self.__swapChainImages), VK_BUFFER_USAGE_INDIRECT_BUFFER_BIT)
 
     def __createDescriptorPool(self):
         poolSize1 = VkDescriptorPoolSize(
-            type=VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER,
+            type=VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC,
             descriptorCount=1
         )
 
@@ -1216,27 +1446,12 @@ class HelloTriangleApplication(QtGui.QWindow):
 
         self.__descriptorSet = vkAllocateDescriptorSets(self.__device, allocInfo)
 
-        bufferInfo = VkDescriptorBufferInfo(
-            buffer=self.__uniformBuffer,
-            offset=0,
-            range=self.__ubo.nbytes
-        )
-
         imageInfo = VkDescriptorImageInfo(
             imageLayout=VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL,
             imageView=self.__textureImageView,
             sampler=self.__textureSampler
         )
 
-        descriptWrite1 = VkWriteDescriptorSet(
-            dstSet=self.__descriptorSet[0],
-            dstBinding=0,
-            dstArrayElement=0,
-            descriptorType=VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER,
-            # descriptorCount=1,
-            pBufferInfo=[bufferInfo]
-        )
-
         descriptWrite2 = VkWriteDescriptorSet(
             dstSet=self.__descriptorSet[0],
             dstBinding=1,
@@ -1245,7 +1460,28 @@ class HelloTriangleApplication(QtGui.QWindow):
             pImageInfo=[imageInfo]
         )
 
-        vkUpdateDescriptorSets(self.__device, 2, [descriptWrite1, descriptWrite2], 0, None)
+        vkUpdateDescriptorSets(self.__device, 1, [descriptWrite2], 0, None)
+
+        self.__writeUniformDescriptor()
+
+    def __writeUniformDescriptor(self):
+        # the range covers one slot, the dynamic offset picks which one
+        bufferInfo = VkDescriptorBufferInfo(
+            buffer=self.__uniformRing.buffer,
+            offset=0,
+            range=UniformBufferObject.NBYTES
+        )
+
+        descriptWrite1 = VkWriteDescriptorSet(
+            dstSet=self.__descriptorSet[0],
+            dstBinding=0,
+            dstArrayElement=0,
+            descriptorType=VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC,
+            # descriptorCount=1,
+            pBufferInfo=[bufferInfo]
+        )
+
+        vkUpdateDescriptorSets(self.__device, 1, [descriptWrite1], 0, None)
 
     def __createBuffer(self, size, usage, properties):
         buffer = None
@@ -1259,161 +1495,299 @@ class HelloTriangleApplication(QtGui.QWindow):
 
         buffer = vkCreateBuffer(self.__device, bufferInfo, None)
 
-        memRequirements = vkGetBufferMemoryRequirements(self.__device, buffer)
-        allocInfo = VkMemoryAllocateInfo(
-            allocationSize=memRequirements.size,
-            memoryTypeIndex=self.__findMemoryType(memRequirements.memoryTypeBits, properties)
-        )
-        bufferMemory = vkAllocateMemory(self.__device, allocInfo, None)
-
-        vkBindBufferMemory(self.__device, buffer, bufferMemory, 0)
+        bufferMemory = self.__allocator.allocateBuffer(buffer, properties)
 
         return (buffer, bufferMemory)
 
-    def __beginSingleTimeCommands(self):
+    def __createCommandBuffers(self):
+        self.__commandBuffers = []
+
+        # one command buffer per swap chain image and LOD level, the level is
+        # picked at submit time so nothing is recorded per frame. Culled
+        # meshlets change the draws every frame, then drawFrame records the
+        # one command buffer of each image
+        levels = 1 if self.meshletCulling else len(self.__subMeshes)
         allocInfo = VkCommandBufferAllocateInfo(
-            level=VK_COMMAND_BUFFER_LEVEL_PRIMARY,
             commandPool=self.__commandPool,
-            commandBufferCount=1
+            level=VK_COMMAND_BUFFER_LEVEL_PRIMARY,
+            commandBufferCount=len(self.__swapChainFramebuffers) * levels
         )
 
-        commandBuffer = vkAllocateCommandBuffers(self.__device, allocInfo)[0]
-        beginInfo = VkCommandBufferBeginInfo(flags=VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT)
-        vkBeginCommandBuffer(commandBuffer, beginInfo)
+        self.__commandBuffers = vkAllocateCommandBuffers(self.__device, allocInfo)
+        if self.meshletCulling:
+            return
 
-        return commandBuffer
+        for index, buffer in enumerate(self.__commandBuffers):
+            i, level = divmod(index, levels)
+            subMeshes = self.__subMeshes[level]
+            draws = indirect.drawCommands([subMesh.firstIndex for subMesh in subMeshes],
+                                          [subMesh.indexCount for subMesh in subMeshes],
+                                          [subMesh.vertexOffset for subMesh in subMeshes], self.instanceCount)
+            # the indirect ring has one slot per image, not per level
+            self.__recordCommandBuffer(buffer, i, draws, VK_COMMAND_BUFFER_USAGE_SIMULTANEOUS_USE_BIT, False)
+
+    def __recordCommandBuffer(self, buffer, i, draws, flags, indirectDraws=None):
+        # draws are VkDrawIndexedIndirectCommand records with one instance
+        # count for all visible copies, drawn from the image's slot of the
+        # indirect ring unless indirectDraws is off
+        if not self.instancedDraws:
+            draws = indirect.perInstance(draws[draws['instanceCount'] > 0], int(draws['instanceCount'].max(initial=0)))
+        if indirectDraws is None:
+            indirectDraws = self.indirectDraws
+        if not self.instancedDraws and not self.__drawIndirectFirstInstance:
+            indirectDraws = False
+
+        beginInfo = VkCommandBufferBeginInfo(flags=flags)
+        vkBeginCommandBuffer(buffer, beginInfo)
+
+        renderArea = VkRect2D([0, 0], self.__swapChainExtent)
+        clearColor = [VkClearValue(color=[[0.0, 0.0, 0.0, 1.0]]), VkClearValue(depthStencil=[1.0, 0])]
+        renderPassInfo = VkRenderPassBeginInfo(
+            renderPass=self.__renderpass,
+            framebuffer=self.__swapChainFramebuffers[i],
+            renderArea=renderArea,
+            pClearValues=clearColor
+        )
 
-    def __endSingleTimeCommands(self, commandBuffer):
-        vkEndCommandBuffer(commandBuffer)
+        vkCmdBeginRenderPass(buffer, renderPassInfo, VK_SUBPASS_CONTENTS_INLINE)
 
-        submitInfo = VkSubmitInfo(pCommandBuffers=[commandBuffer])
+        vkCmdBindPipeline(buffer, VK_PIPELINE_BIND_POINT_GRAPHICS, self.__pipeline)
 
-        vkQueueSubmit(self.__graphicQueue, 1, [submitInfo], VK_NULL_HANDLE)
-        vkQueueWaitIdle(self.__graphicQueue)
+        viewport = VkViewport(0.0, 0.0,
+                              float(self.__swapChainExtent.width),
+                              float(self.__swapChainExtent.height),
+                              0.0, 1.0)
+        vkCmdSetViewport(buffer, 0, 1, [viewport])
+        vkCmdSetScissor(buffer, 0, 1, [renderArea])
 
-        vkFreeCommandBuffers(self.__device, self.__commandPool, 1, [commandBuffer])
+        vkCmdBindVertexBuffers(buffer, 0, 2, [self.__geometryPool.vertexBuffer, self.__instanceRing.buffer],
+                               [0, self.__instanceRing.offset(i)])
 
-    def __copyBuffer(self, src, dst, bufferSize):
-        commandBuffer = self.__beginSingleTimeCommands()
+        vkCmdBindIndexBuffer(buffer, self.__geometryPool.indexBuffer, 0, self.__geometryPool.indexType)
 
-        # copyRegion = VkBufferCopy(size=bufferSize)
-        copyRegion = VkBufferCopy(0, 0, bufferSize)
-        vkCmdCopyBuffer(commandBuffer, src, dst, 1, [copyRegion])
+        vkCmdBindDescriptorSets(buffer, VK_PIPELINE_BIND_POINT_GRAPHICS, self.__pipelineLayout, 0, 1, self.__descriptorSet,
+                                1, [self.__uniformRing.offset(i)])
 
-        self.__endSingleTimeCommands(commandBuffer)
+        if indirectDraws:
+            self.__indirectRing.view(i, indirect.DRAW_INDEXED_INDIRECT_COMMAND)[:len(draws)] = draws
+            indirect.cmdDrawIndexedIndirect(buffer, self.__indirectRing.buffer, self.__indirectRing.offset(i),
+                                            len(draws), self.__maxDrawIndirectCount)
+        else:
+            for command in draws.tolist():
+                vkCmdDrawIndexed(buffer, *command)
 
-    def __findMemoryType(self, typeFilter, properties):
-        memProperties = vkGetPhysicalDeviceMemoryProperties(self.__physicalDevice)
+        vkCmdEndRenderPass(buffer)
 
-        for i, prop in enumerate(memProperties.memoryTypes):
-            if (typeFilter & (1 << i)) and ((prop.propertyFlags & properties) == properties):
-                return i
+        vkEndCommandBuffer(buffer)
 
-        return -1
+    def __createSyncObjects(self):
+        semaphoreInfo = VkSemaphoreCreateInfo()
+        fenceInfo = VkFenceCreateInfo(flags=VK_FENCE_CREATE_SIGNALED_BIT)
 
-    def __createCommandBuffers(self):
-        self.__commandBuffers = []
+        for i in range(self.__framesInFlight):
+            self.__imageAvailableSemaphores.append(vkCreateSemaphore(self.__device, semaphoreInfo, None))
+            self.__renderFinishedSemaphores.append(vkCreateSemaphore(self.__device, semaphoreInfo, None))
+            self.__inFlightFences.append(vkCreateFence(self.__device, fenceInfo, None))
 
-        allocInfo = VkCommandBufferAllocateInfo(
-            commandPool=self.__commandPool,
-            level=VK_COMMAND_BUFFER_LEVEL_PRIMARY,
-            commandBufferCount=len(self.__swapChainFramebuffers)
-        )
+        # the fence of the frame that last rendered to each swap chain image
+        self.__imagesInFlight = [None] * len(self.__swapChainImages)
 
-        self.__commandBuffers = vkAllocateCommandBuffers(self.__device, allocInfo)
+    def __updateUniformBuffer(self, imageIndex):
+        currentTime = time.time()
 
-        for i, buffer in enumerate(self.__commandBuffers):
-            beginInfo = VkCommandBufferBeginInfo(flags=VK_COMMAND_BUFFER_USAGE_SIMULTANEOUS_USE_BIT)
-            vkBeginCommandBuffer(buffer, beginInfo)
+        t = currentTime - self.__startTime
 
-            renderArea = VkRect2D([0, 0], self.__swapChainExtent)
-            clearColor = [VkClearValue(color=[[0.0, 0.0, 0.0, 1.0]]), VkClearValue(depthStencil=[1.0, 0])]
-            renderPassInfo = VkRenderPassBeginInfo(
-                renderPass=self.__renderpass,
-                framebuffer=self.__swapChainFramebuffers[i],
-                renderArea=renderArea,
-                pClearValues=clearColor
-            )
+        # the matrices are written straight into the mapped slot of this image
+        ubo = self.__ubos[imageIndex]
+        # positionTransform maps quantized positions back to model space,
+        # every instance then turns in place before it is moved to its spot
+        model = glm.rotate(np.identity(4, np.float32), 90.0 * t, 0.0, 0.0, 1.0)
+        ubo.model = self.__positionTransform
+        ubo.view = glm.lookAt(np.array([2, 2, 2], np.float32), np.array([0, 0, 0], np.float32), np.array([0, 0, 1], np.float32))
+        ubo.proj = glm.perspective(-45.0, float(self.__swapChainExtent.width) / self.__swapChainExtent.height, 0.1, 10.0)
+        # ubo.proj[1][1] *= -1
+
+        self.scene.setTransforms(self.__instanceIds, np.matmul(model, self.__placements))
+        if self.meshletCulling:
+            self.__visibleObjects = self.scene.cull(np.dot(ubo.view, ubo.proj))
+        else:
+            # prerecorded command buffers draw every instance
+            self.__visibleObjects = self.__instanceIds
+        self.__instanceCount = len(self.__visibleObjects)
+        instances = self.__instanceRing.view(imageIndex, shape=(-1, 4, 4))
+        instances[:self.__instanceCount] = self.scene.transforms[self.__visibleObjects]
+
+        # the nearest visible copy picks the level of detail for all of them
+        if self.__instanceCount:
+            center, radius = self.__boundingSphere
+            eye = np.linalg.inv(ubo.view)[3, :3]
+            distance = np.linalg.norm(self.scene.centers[self.__visibleObjects] - eye, axis=1)
+            nearest = self.scene.transforms[self.__visibleObjects[np.argmin(distance)]]
+            pixelRadius = lod.projectedRadius(center, radius, np.dot(nearest, ubo.view), ubo.proj,
+                                              self.__swapChainExtent.height)
+            self.__lodLevel = lod.selectLevel([error for _, error in self.__lodLevels], radius, pixelRadius,
+                                              self.lodPixelError)
+
+        if self.meshletCulling:
+            meshlets = self.__meshlets[self.__lodLevel]
+            if self.__instanceCount == 1:
+                modelView = np.dot(self.scene.transforms[self.__visibleObjects[0]], ubo.view)
+                visible = meshlet.cullMeshlets(meshlets, modelView, ubo.proj)
+            else:
+                # meshlets can only be culled for a single copy
+                visible = np.full(len(meshlets), self.__instanceCount > 1)
+            firstIndex, indexCount, vertexOffset = meshlet.drawRanges(meshlets, visible)
+            self.__frameDraws = indirect.drawCommands(firstIndex, indexCount, vertexOffset, self.__instanceCount)
+            drawn = indexCount.sum() * self.__instanceCount
+            self.__culledTriangles = 1.0 - drawn / float(max(meshlets.indexCount.sum() * len(self.__instanceIds), 1))
 
-            vkCmdBeginRenderPass(buffer, renderPassInfo, VK_SUBPASS_CONTENTS_INLINE)
+    def drawFrame(self):
+        if not self.__headless and not self.isExposed():
+            return
 
-            vkCmdBindPipeline(buffer, VK_PIPELINE_BIND_POINT_GRAPHICS, self.__pipeline)
+        frameFence = self.__inFlightFences[self.__currentFrame]
+        imageAvailableSemaphore = self.__imageAvailableSemaphores[self.__currentFrame]
+        renderFinishedSemaphore = self.__renderFinishedSemaphores[self.__currentFrame]
 
-            vkCmdBindVertexBuffers(buffer, 0, 1, [self.__vertexBuffer], [0])
+        waitStart = time.perf_counter()
+        vkWaitForFences(self.__device, 1, [frameFence], VK_TRUE, UINT64_MAX)
 
-            vkCmdBindIndexBuffer(buffer, self.__indexBuffer, 0, VK_INDEX_TYPE_UINT32)
+        if self.__headless:
+            # one offscreen image per frame in flight, nothing to acquire
+            imageIndex = self.__currentFrame
+        else:
+            try:
+                imageIndex = self.__deviceFuncs.vkAcquireNextImageKHR(self.__device, self.__swapChain, UINT64_MAX,
+                                                                      imageAvailableSemaphore, VK_NULL_HANDLE)
+            except (VkErrorSurfaceLostKhr, VkErrorOutOfDateKhr):
+                self.__recreateSwapChain()
+                return
+            # else:
+            #     raise Exception('faild to acquire next image.')
+
+        # an earlier frame may still be rendering to this image
+        imageFence = self.__imagesInFlight[imageIndex]
+        if imageFence is not None and imageFence != frameFence:
+            vkWaitForFences(self.__device, 1, [imageFence], VK_TRUE, UINT64_MAX)
+        self.__imagesInFlight[imageIndex] = frameFence
+        cpuWait = time.perf_counter() - waitStart
+
+        self.__updateUniformBuffer(imageIndex)
+        if self.meshletCulling:
+            # the fences above guarantee this image's command buffer is no longer pending
+            commandBuffer = self.__commandBuffers[imageIndex]
+            self.__recordCommandBuffer(commandBuffer, imageIndex, self.__frameDraws,
+                                       VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT)
+        else:
+            commandBuffer = self.__commandBuffers[imageIndex * len(self.__subMeshes) + self.__lodLevel]
 
-            vkCmdBindDescriptorSets(buffer, VK_PIPELINE_BIND_POINT_GRAPHICS, self.__pipelineLayout, 0, 1, self.__descriptorSet, 0, None)
+        waitSemaphores = [imageAvailableSemaphore]
+        signalSemaphores = [renderFinishedSemaphore]
+        waitStages = [VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT]
+        if self.__headless:
+            submit = VkSubmitInfo(pCommandBuffers=[commandBuffer])
+        else:
+            submit = VkSubmitInfo(
+                pWaitSemaphores=waitSemaphores,
+                pWaitDstStageMask=waitStages,
+                pCommandBuffers=[commandBuffer],
+                pSignalSemaphores=signalSemaphores
+            )
 
-            vkCmdDrawIndexed(buffer, len(self.__indices), 1, 0, 0, 0)
+        vkResetFences(self.__device, 1, [frameFence])
+        vkQueueSubmit(self.__graphicQueue, 1, submit, frameFence)
+        self.__lastImageIndex = imageIndex
 
-            vkCmdEndRenderPass(buffer)
+        if not self.__headless:
+            presenInfo = VkPresentInfoKHR(
+                pWaitSemaphores=signalSemaphores,
+                pSwapchains=[self.__swapChain],
+                pImageIndices=[imageIndex]
+            )
 
-            vkEndCommandBuffer(buffer)
+            try:
+                self.__deviceFuncs.vkQueuePresentKHR(self.__presentQueue, presenInfo)
+            except VkErrorOutOfDateKhr:
+                self.__recreateSwapChain()
 
-    def __createSemaphores(self):
-        semaphoreInfo = VkSemaphoreCreateInfo()
+        self.__currentFrame = (self.__currentFrame + 1) % self.__framesInFlight
+        self.__frameStats.addFrame(cpuWait, self.__culledTriangles)
 
-        self.__imageAvailableSemaphore = vkCreateSemaphore(self.__device, semaphoreInfo, None)
-        self.__renderFinishedSemaphore = vkCreateSemaphore(self.__device, semaphoreInfo, None)
+    def readFrame(self):
+        """Read the last headless frame back as a (height, width, 4) uint8 array."""
+        assert self.__headless and self.__lastImageIndex is not None
 
-    def __updateUniformBuffer(self):
-        currentTime = time.time()
+        width = self.__swapChainExtent.width
+        height = self.__swapChainExtent.height
+        image = self.__swapChainImages[self.__lastImageIndex]
 
-        t = currentTime - self.__startTime
+        buffer, bufferMemory = self.__createBuffer(width * height * 4, VK_BUFFER_USAGE_TRANSFER_DST_BIT,
+                                                   VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
 
-        self.__ubo.model = glm.rotate(np.identity(4, np.float32), 90.0 * t, 0.0, 0.0, 1.0)
-        self.__ubo.view = glm.lookAt(np.array([2, 2, 2], np.float32), np.array([0, 0, 0], np.float32), np.array([0, 0, 1], np.float32))
-        self.__ubo.proj = glm.perspective(-45.0, float(self.__swapChainExtent.width) / self.__swapChainExtent.height, 0.1, 10.0)
-        # self.__ubo.proj[1][1] *= -1
+        batch = self.__createUploadBatch()
 
+        barrier = VkMemoryBarrier(
+            srcAccessMask=VK_ACCESS_COLOR_ATTACHMENT_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_TRANSFER_READ_BIT
+        )
+        vkCmdPipelineBarrier(batch.commandBuffer,
+                             VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT,
+                             VK_PIPELINE_STAGE_TRANSFER_BIT,
+                             0, 1, [barrier], 0, None, 0, None)
 
-        data = vkMapMemory(self.__device, self.__uniformBufferMemory, 0, self.__ubo.nbytes, 0)
+        subresource = VkImageSubresourceLayers(
+            aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
+            mipLevel=0,
+            baseArrayLayer=0,
+            layerCount=1
+        )
+        region = VkBufferImageCopy(
+            bufferOffset=0,
+            bufferRowLength=0,
+            bufferImageHeight=0,
+            imageSubresource=subresource,
+            imageOffset=[0, 0],
+            imageExtent=[width, height, 1]
+        )
+        vkCmdCopyImageToBuffer(batch.commandBuffer, image, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, buffer, 1, [region])
 
-        ma = self.__ubo.toArray()
-        dptr = ffi.cast('float *', ma.ctypes.data)
-        ffi.memmove(data, dptr, self.__ubo.nbytes)
+        barrier = VkMemoryBarrier(
+            srcAccessMask=VK_ACCESS_TRANSFER_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_HOST_READ_BIT
+        )
+        vkCmdPipelineBarrier(batch.commandBuffer,
+                             VK_PIPELINE_STAGE_TRANSFER_BIT,
+                             VK_PIPELINE_STAGE_HOST_BIT,
+                             0, 1, [barrier], 0, None, 0, None)
 
-        vkUnmapMemory(self.__device, self.__uniformBufferMemory)
+        batch.submit().wait()
 
-    def drawFrame(self):
-        if not self.isExposed():
-            return
+        pixels = np.frombuffer(bufferMemory.mapped, np.uint8).reshape(height, width, 4).copy()
 
-        try:
-            imageIndex = vkAcquireNextImageKHR(self.__device, self.__swapChain, 18446744073709551615,
-                                               self.__imageAvailableSemaphore, VK_NULL_HANDLE)
-        except VkErrorSurfaceLostKhr:
-            self.__recreateSwapChain()
-            return
-        # else:
-        #     raise Exception('faild to acquire next image.')
+        vkDestroyBuffer(self.__device, buffer, None)
+        self.__allocator.free(bufferMemory)
 
-        waitSemaphores = [self.__imageAvailableSemaphore]
-        signalSemaphores = [self.__renderFinishedSemaphore]
-        waitStages = [VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT]
-        submit = VkSubmitInfo(
-            pWaitSemaphores=waitSemaphores,
-            pWaitDstStageMask=waitStages,
-            pCommandBuffers=[self.__commandBuffers[imageIndex]],
-            pSignalSemaphores=signalSemaphores
-        )
+        return pixels
 
-        vkQueueSubmit(self.__graphicQueue, 1, submit, VK_NULL_HANDLE)
+    def runHeadless(self, frameCount):
+        """Render ``frameCount`` frames offscreen, returns the seconds each frame took."""
+        assert self.__headless
 
-        presenInfo = VkPresentInfoKHR(
-            pWaitSemaphores=signalSemaphores,
-            pSwapchains=[self.__swapChain],
-            pImageIndices=[imageIndex]
-        )
+        frameTimes = []
+        startTime = time.perf_counter()
+        for i in range(frameCount):
+            frameStart = time.perf_counter()
+            self.render()
+            frameTimes.append(time.perf_counter() - frameStart)
+        vkDeviceWaitIdle(self.__device)
+        totalTime = time.perf_counter() - startTime
 
-        try:
-            vkQueuePresentKHR(self.__presentQueue, presenInfo)
-        except VkErrorOutOfDateKhr:
-            self.__recreateSwapChain()
+        frameTimes = np.array(frameTimes)
+        print('{} frames in {:.3f} s, {:.1f} fps, frame ms: mean {:.2f}  median {:.2f}  max {:.2f}'.format(
+            frameCount, totalTime, frameCount / totalTime,
+            frameTimes.mean() * 1000.0, np.median(frameTimes) * 1000.0, frameTimes.max() * 1000.0))
 
-        if enableValidationLayers:
-            vkQueueWaitIdle(self.__presentQueue)
+        return frameTimes
 
     def __createShaderModule(self, shaderFile):
         with open(shaderFile, 'rb') as sf:
@@ -1457,9 +1831,9 @@ class HelloTriangleApplication(QtGui.QWindow):
     def __querySwapChainSupport(self, device):
         detail = SwapChainSupportDetails()
 
-        detail.capabilities = vkGetPhysicalDeviceSurfaceCapabilitiesKHR(device, self.__surface)
-        detail.formats = vkGetPhysicalDeviceSurfaceFormatsKHR(device, self.__surface)
-        detail.presentModes = vkGetPhysicalDeviceSurfacePresentModesKHR(device, self.__surface)
+        detail.capabilities = self.__instanceFuncs.vkGetPhysicalDeviceSurfaceCapabilitiesKHR(device, self.__surface)
+        detail.formats = self.__instanceFuncs.vkGetPhysicalDeviceSurfaceFormatsKHR(device, self.__surface)
+        detail.presentModes = self.__instanceFuncs.vkGetPhysicalDeviceSurfacePresentModesKHR(device, self.__surface)
         return detail
 
     def __isDeviceSuitable(self, device):
@@ -1467,8 +1841,8 @@ class HelloTriangleApplication(QtGui.QWindow):
 
         extensionsSupported = self.__checkDeviceExtensionSupport(device)
 
-        swapChainAdequate = False
-        if extensionsSupported:
+        swapChainAdequate = self.__headless
+        if extensionsSupported and not self.__headless:
             swapChainSupport = self.__querySwapChainSupport(device)
             swapChainAdequate = (swapChainSupport.formats is not None) and (swapChainSupport.presentModes is not None)
 
@@ -1476,11 +1850,15 @@ class HelloTriangleApplication(QtGui.QWindow):
 
         return indices.isComplete and extensionsSupported and swapChainAdequate and supportedFeatures.samplerAnisotropy
 
+    @property
+    def __requiredDeviceExtensions(self):
+        return [] if self.__headless else deviceExtensions
+
     def __checkDeviceExtensionSupport(self, device):
         availableExtensions = vkEnumerateDeviceExtensionProperties(device, None)
 
         aen = [i.extensionName for i in availableExtensions]
-        for i in deviceExtensions:
+        for i in self.__requiredDeviceExtensions:
             if i not in aen:
                 return False
 
@@ -1494,7 +1872,10 @@ class HelloTriangleApplication(QtGui.QWindow):
             if prop.queueCount > 0 and prop.queueFlags & VK_QUEUE_GRAPHICS_BIT:
                 indices.graphicsFamily = i
 
-            presentSupport = vkGetPhysicalDeviceSurfaceSupportKHR(device, i, self.__surface)
+            if self.__headless:
+                presentSupport = prop.queueFlags & VK_QUEUE_GRAPHICS_BIT
+            else:
+                presentSupport = self.__instanceFuncs.vkGetPhysicalDeviceSurfaceSupportKHR(device, i, self.__surface)
 
             if prop.queueCount > 0 and presentSupport:
                 indices.presentFamily = i
@@ -1507,27 +1888,23 @@ class HelloTriangleApplication(QtGui.QWindow):
     def __getRequiredExtensions(self):
         extenstions = [e.extensionName for e in vkEnumerateInstanceExtensionProperties(None)]
 
-        if enableValidationLayers:
+        if self.__validationLayers:
             extenstions.append(VK_EXT_DEBUG_REPORT_EXTENSION_NAME)
 
         return extenstions
 
-    def __checkValidationLayerSupport(self):
-        availableLayers = vkEnumerateInstanceLayerProperties()
+    def __supportedValidationLayers(self):
+        # the first of validationLayers the loader knows, [] if none
+        availableLayers = [layerProp.layerName for layerProp in vkEnumerateInstanceLayerProperties()]
 
         for layer in validationLayers:
-            layerfound = False
+            if layer in availableLayers:
+                return [layer]
 
-            for layerProp in availableLayers:
-                if layer == layerProp.layerName:
-                    layerfound = True
-                    break
-            return layerfound
-
-        return False
+        return []
 
     def render(self):
-        self.__updateUniformBuffer()
+        self.__collectUploads()
         self.drawFrame()
 
     def resizeEvent(self, event):
@@ -1538,10 +1915,39 @@ class HelloTriangleApplication(QtGui.QWindow):
 
 if __name__ == '__main__':
     import sys
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', type=int, metavar='FRAMES',
+                        help='render FRAMES frames offscreen without a window and exit')
+    parser.add_argument('--output', help='headless only, save the last frame to this image file')
+    parser.add_argument('--mipmaps', choices=['auto', 'cpu', 'gpu'], default='auto',
+                        help='build the texture mip chain with NumPy or with blits')
+    parser.add_argument('--positions', choices=['float', 'half', 'unorm16'], default='unorm16',
+                        help='vertex position format')
+    parser.add_argument('--instances', type=int, default=1, help='copies of the model to draw')
+    parser.add_argument('--no-validation', dest='validation', action='store_false',
+                        help='do not enable the validation layers')
+    parser.add_argument('--verbose', action='store_true', help='print mesh and pipeline cache statistics')
+    args, qtArgs = parser.parse_known_args()
+
+    if args.headless:
+        # no display needed, e.g. on render nodes or with a software ICD
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        app = QtGui.QGuiApplication(sys.argv[:1] + qtArgs)
+
+        win = HelloTriangleApplication(headless=True, mipmaps=args.mipmaps, vertexPositions=args.positions,
+                                       instances=args.instances, validation=args.validation, verbose=args.verbose)
+        win.runHeadless(args.headless)
+        if args.output:
+            Image.fromarray(win.readFrame()).save(args.output)
+        del win
+        sys.exit(0)
 
-    app = QtGui.QGuiApplication(sys.argv)
+    app = QtGui.QGuiApplication(sys.argv[:1] + qtArgs)
 
-    win = HelloTriangleApplication()
+    win = HelloTriangleApplication(mipmaps=args.mipmaps, vertexPositions=args.positions,
+                                   instances=args.instances, validation=args.validation, verbose=args.verbose)
     win.show()
 
     def clenaup():
@@ -0,0 +1,32 @@
+#version 450
+#extension GL_ARB_separate_shader_objects : enable
+
+// 26_shader_depth.vert with a model matrix per instance, binding 1 of the
+// pipeline advances once per instance. ubo.model is applied first, it is
+// shared by all instances.
+// glslangValidator -V 28_shader_instanced.vert -o shader/vert_instanced.spv
+
+layout(binding = 0) uniform UniformBufferObject {
+    mat4 model;
+    mat4 view;
+    mat4 proj;
+} ubo;
+
+layout(location = 0) in vec3 inPosition;
+layout(location = 1) in vec3 inColor;
+layout(location = 2) in vec2 inTexCoord;
+// per instance, locations 3 to 6
+layout(location = 3) in mat4 inModel;
+
+layout(location = 0) out vec3 fragColor;
+layout(location = 1) out vec2 fragTexCoord;
+
+out gl_PerVertex {
+    vec4 gl_Position;
+};
+
+void main() {
+    gl_Position = ubo.proj * ubo.view * inModel * ubo.model * vec4(inPosition, 1.0);
+    fragColor = inColor;
+    fragTexCoord = inTexCoord;
+}
\ No newline at end of file
@@ -0,0 +1,31 @@
+#version 450
+#extension GL_ARB_separate_shader_objects : enable
+
+// 28_shader_instanced.vert without the color attribute, the mesh color is
+// always white. Positions may be stored relative to the bounding box,
+// ubo.model then holds the matrix that undoes it.
+// glslangValidator -V 28_shader_quantized.vert -o shader/vert_quantized.spv
+
+layout(binding = 0) uniform UniformBufferObject {
+    mat4 model;
+    mat4 view;
+    mat4 proj;
+} ubo;
+
+layout(location = 0) in vec3 inPosition;
+layout(location = 2) in vec2 inTexCoord;
+// per instance, locations 3 to 6
+layout(location = 3) in mat4 inModel;
+
+layout(location = 0) out vec3 fragColor;
+layout(location = 1) out vec2 fragTexCoord;
+
+out gl_PerVertex {
+    vec4 gl_Position;
+};
+
+void main() {
+    gl_Position = ubo.proj * ubo.view * inModel * ubo.model * vec4(inPosition, 1.0);
+    fragColor = vec3(1.0);
+    fragTexCoord = inTexCoord;
+}
\ No newline at end of file
@@ -0,0 +1,164 @@
+# -*- coding: UTF-8 -*-
+"""
+Pure Python range allocator.
+
+Notes
+-----
+
+``RangeAllocator`` hands out ``[offset, offset + size)`` ranges of a fixed
+size address space. It knows nothing about Vulkan, ``memory.py`` uses one per
+``VkDeviceMemory`` block, which keeps the placement rules easy to exercise on
+their own.
+"""
+
+import bisect
+
+
+def alignUp(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def samePage(endOffset, startOffset, pageSize):
+    """True if the byte before ``endOffset`` and ``startOffset`` share a page."""
+    return (endOffset - 1) // pageSize == startOffset // pageSize
+
+
+class Range(object):
+
+    def __init__(self, offset, size, alignment, linear):
+        self.offset = offset
+        self.size = size
+        self.alignment = alignment
+        self.linear = linear
+
+    @property
+    def end(self):
+        return self.offset + self.size
+
+
+class RangeAllocator(object):
+    """First fit allocator over a fixed size range.
+
+    Parameters
+    ----------
+    size : int
+        Size of the managed range.
+    granularity : int
+        ``bufferImageGranularity``, linear (buffer) and non linear (optimal
+        image) ranges never share a page of this size.
+    """
+
+    def __init__(self, size, granularity=1):
+        self.size = size
+        self.granularity = max(granularity, 1)
+
+        self.__offsets = []
+        self.__ranges = []
+
+    def __len__(self):
+        return len(self.__ranges)
+
+    @property
+    def ranges(self):
+        return list(self.__ranges)
+
+    @property
+    def usedBytes(self):
+        return sum(r.size for r in self.__ranges)
+
+    @property
+    def freeBytes(self):
+        return self.size - self.usedBytes
+
+    @property
+    def largestFreeRange(self):
+        largest = 0
+        start = 0
+        for r in self.__ranges:
+            largest = max(largest, r.offset - start)
+            start = r.end
+        return max(largest, self.size - start)
+
+    @property
+    def fragmentation(self):
+        """0 when all free space is one range, close to 1 when it is scattered."""
+        free = self.freeBytes
+        if free == 0:
+            return 0.0
+        return 1.0 - float(self.largestFreeRange) / free
+
+    def __conflicts(self, a, linear):
+        return self.granularity > 1 and a.linear != linear
+
+    def __place(self, index, size, alignment, linear):
+        # offset for a new range inserted before self.__ranges[index], or None
+        prev = self.__ranges[index - 1] if index > 0 else None
+        nxt = self.__ranges[index] if index < len(self.__ranges) else None
+
+        start = prev.end if prev else 0
+        end = nxt.offset if nxt else self.size
+
+        offset = alignUp(start, alignment)
+        if prev and self.__conflicts(prev, linear) and samePage(prev.end, offset, self.granularity):
+            offset = alignUp(offset, self.granularity)
+
+        if offset + size > end:
+            return None
+        if nxt and self.__conflicts(nxt, linear) and samePage(offset + size, nxt.offset, self.granularity):
+            return None
+        return offset
+
+    def allocate(self, size, alignment=1, linear=True):
+        """Reserve ``size`` bytes.
+
+        Returns
+        -------
+        offset : int | None
+            Start of the range, or None if nothing fits.
+        """
+        assert size > 0
+        alignment = max(alignment, 1)
+
+        for index in range(len(self.__ranges) + 1):
+            offset = self.__place(index, size, alignment, linear)
+            if offset is not None:
+                self.__offsets.insert(index, offset)
+                self.__ranges.insert(index, Range(offset, size, alignment, linear))
+                return offset
+
+        return None
+
+    def free(self, offset):
+        index = bisect.bisect_left(self.__offsets, offset)
+        if index == len(self.__offsets) or self.__offsets[index] != offset:
+            raise KeyError('no allocation at offset {}'.format(offset))
+
+        del self.__offsets[index]
+        del self.__ranges[index]
+
+    def defragment(self):
+        """Slide every range as far towards offset 0 as its rules allow.
+
+        Returns
+        -------
+        moves : list
+            ``(oldOffset, newOffset, size)`` for every range that moved, in
+            an order that is safe to replay as overlapping copies.
+        """
+        ranges = self.__ranges
+        self.__offsets = []
+        self.__ranges = []
+
+        moves = []
+        for r in ranges:
+            offset = self.__place(len(self.__ranges), r.size, r.alignment, r.linear)
+            # a range can always stay where it was
+            if offset is None or offset > r.offset:
+                offset = r.offset
+            if offset != r.offset:
+                moves.append((r.offset, offset, r.size))
+
+            self.__offsets.append(offset)
+            self.__ranges.append(Range(offset, r.size, r.alignment, r.linear))
+
+        return moves
@@ -0,0 +1,269 @@
+# -*- coding: UTF-8 -*-
+"""
+Block compression, BC1 and BC3 encoder and decoder in NumPy.
+
+Notes
+-----
+
+Every 4x4 texel block is encoded independently and all blocks of an image
+are processed at once. Color endpoints start at the extremes of the
+block's principal axis, are refined once by least squares for the chosen
+indices, then quantized to RGB565. BC1 here is the opaque 4 color mode
+(``VK_FORMAT_BC1_RGB_UNORM_BLOCK``), BC3 adds an 8 value alpha block in
+front of the same color block.
+
+This is meant for offline baking and for checking results without a GPU,
+it is far slower than dedicated encoders. BC7 textures baked by other tools
+can be loaded and uploaded but not encoded or decoded here.
+"""
+
+import numpy as np
+
+
+# VkFormat values
+BC1_RGB_UNORM = 131
+BC3_UNORM = 137
+BC7_UNORM = 145
+
+BLOCK_BYTES = {
+    BC1_RGB_UNORM: 8,
+    BC3_UNORM: 16,
+    BC7_UNORM: 16,
+}
+
+NAMES = {
+    'bc1': BC1_RGB_UNORM,
+    'bc3': BC3_UNORM,
+    'bc7': BC7_UNORM,
+}
+
+
+def isCompressed(vkFormat):
+    return vkFormat in BLOCK_BYTES
+
+
+def canEncode(vkFormat):
+    return vkFormat in (BC1_RGB_UNORM, BC3_UNORM)
+
+
+def blockCount(width, height):
+    return (height + 3) // 4, (width + 3) // 4
+
+
+def toBlocks(pixels):
+    """Split an ``(H, W, C)`` image into ``(H / 4, W / 4, 16, C)`` blocks.
+
+    Sizes that are not a multiple of 4 are padded by repeating the edge,
+    the padded texels are never sampled.
+    """
+    height, width, channels = pixels.shape
+    rows, columns = blockCount(width, height)
+    padded = np.pad(pixels, ((0, rows * 4 - height), (0, columns * 4 - width), (0, 0)), mode='edge')
+    return padded.reshape(rows, 4, columns, 4, channels).transpose(0, 2, 1, 3, 4).reshape(rows, columns, 16, channels)
+
+
+def fromBlocks(blocks, width, height):
+    rows, columns, _, channels = blocks.shape
+    pixels = blocks.reshape(rows, columns, 4, 4, channels).transpose(0, 2, 1, 3, 4)
+    return pixels.reshape(rows * 4, columns * 4, channels)[:height, :width]
+
+
+def _expand565(c):
+    r = (c >> 11) & 31
+    g = (c >> 5) & 63
+    b = c & 31
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=-1)
+
+
+def _quantize565(color):
+    color = np.clip(color, 0.0, 255.0)
+    r = np.rint(color[..., 0] * (31.0 / 255.0)).astype(np.int32)
+    g = np.rint(color[..., 1] * (63.0 / 255.0)).astype(np.int32)
+    b = np.rint(color[..., 2] * (31.0 / 255.0)).astype(np.int32)
+    return (r << 11) | (g << 5) | b
+
+
+def _colorPalette(c0, c1):
+    # 4 color mode: c0, c1, 2/3 c0 + 1/3 c1, 1/3 c0 + 2/3 c1
+    e0 = _expand565(c0)
+    e1 = _expand565(c1)
+    return np.stack([e0, e1, (2 * e0 + e1) // 3, (e0 + 2 * e1) // 3], axis=-2)
+
+
+def _nearest(values, palette):
+    # index of the closest palette entry for every texel of every block
+    distance = ((values[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis=-1)
+    return np.argmin(distance, axis=-1)
+
+
+def _principalEndpoints(colors):
+    mean = colors.mean(axis=1, keepdims=True)
+    centered = colors - mean
+    covariance = np.einsum('nki,nkj->nij', centered, centered)
+
+    # a few power iterations are enough for 3x3
+    axis = np.ones((len(colors), 3))
+    for _ in range(8):
+        axis = np.einsum('nij,nj->ni', covariance, axis)
+        length = np.linalg.norm(axis, axis=1, keepdims=True)
+        axis = np.where(length > 1e-12, axis / np.maximum(length, 1e-12), 0.0)
+
+    t = np.einsum('nki,ni->nk', centered, axis)
+    lo = t.min(axis=1, keepdims=True)
+    hi = t.max(axis=1, keepdims=True)
+    # pull the endpoints in a little, the extremes are rarely the best fit
+    inset = (hi - lo) / 16.0
+    return mean[:, 0] + axis * (hi - inset), mean[:, 0] + axis * (lo + inset)
+
+
+def _refineEndpoints(colors, indices, c0, c1):
+    # least squares endpoints for fixed indices, weight of c0 per index
+    w = np.array([1.0, 0.0, 2.0 / 3.0, 1.0 / 3.0])[indices]
+    v = 1.0 - w
+    aa = (w * w).sum(axis=1)
+    ab = (w * v).sum(axis=1)
+    bb = (v * v).sum(axis=1)
+    ax = np.einsum('nk,nki->ni', w, colors)
+    bx = np.einsum('nk,nki->ni', v, colors)
+
+    det = aa * bb - ab * ab
+    ok = np.abs(det) > 1e-6
+    det = np.where(ok, det, 1.0)[:, None]
+    e0 = (ax * bb[:, None] - bx * ab[:, None]) / det
+    e1 = (bx * aa[:, None] - ax * ab[:, None]) / det
+    return np.where(ok[:, None], e0, c0), np.where(ok[:, None], e1, c1)
+
+
+def _encodeColor(colors):
+    """Color blocks for ``(N, 16, 3)`` float texels, ``(N, 8)`` uint8."""
+    e0, e1 = _principalEndpoints(colors)
+    for refine in range(2):
+        c0 = _quantize565(e0)
+        c1 = _quantize565(e1)
+
+        # c0 > c1 selects the 4 color mode, equal endpoints only use index 0
+        swap = c0 < c1
+        c0, c1 = np.where(swap, c1, c0), np.where(swap, c0, c1)
+        indices = _nearest(colors, _colorPalette(c0, c1).astype(np.float64))
+
+        if refine == 0:
+            e0, e1 = _refineEndpoints(colors, indices, _expand565(c0), _expand565(c1))
+
+    bits = (indices.astype(np.uint32) << (2 * np.arange(16, dtype=np.uint32))).sum(axis=1, dtype=np.uint32)
+
+    out = np.empty((len(colors), 8), np.uint8)
+    out[:, 0:2] = c0.astype('<u2').view(np.uint8).reshape(-1, 2)
+    out[:, 2:4] = c1.astype('<u2').view(np.uint8).reshape(-1, 2)
+    out[:, 4:8] = bits.astype('<u4').view(np.uint8).reshape(-1, 4)
+    return out
+
+
+def _decodeColor(blocks):
+    """``(N, 16, 3)`` uint8 texels of ``(N, 8)`` color blocks, 4 color mode."""
+    c0 = blocks[:, 0:2].copy().view('<u2')[:, 0].astype(np.int32)
+    c1 = blocks[:, 2:4].copy().view('<u2')[:, 0].astype(np.int32)
+    bits = blocks[:, 4:8].copy().view('<u4')[:, 0]
+
+    indices = (bits[:, None] >> (2 * np.arange(16, dtype=np.uint32))) & 3
+    palette = _colorPalette(c0, c1)
+    return np.take_along_axis(palette, indices[:, :, None].astype(np.int64), axis=1).astype(np.uint8)
+
+
+def _alphaPalette(a0, a1):
+    # a0 > a1 gives 8 values interpolated between them, weight of a0 per index
+    w0 = np.array([7, 0, 6, 5, 4, 3, 2, 1])
+    return (w0 * a0[:, None] + (7 - w0) * a1[:, None]) // 7
+
+
+def _encodeAlpha(alpha):
+    """Alpha blocks for ``(N, 16)`` alpha values, ``(N, 8)`` uint8."""
+    alpha = alpha.astype(np.int32)
+    a0 = alpha.max(axis=1)
+    a1 = alpha.min(axis=1)
+
+    palette = _alphaPalette(a0, a1)
+    indices = np.argmin(np.abs(alpha[:, :, None] - palette[:, None, :]), axis=-1)
+    # equal endpoints select the 6 value mode, whose index 0 is still a0
+    indices[a0 == a1] = 0
+
+    bits = (indices.astype(np.uint64) << (3 * np.arange(16, dtype=np.uint64))).sum(axis=1, dtype=np.uint64)
+
+    out = np.empty((len(alpha), 8), np.uint8)
+    out[:, 0] = a0
+    out[:, 1] = a1
+    out[:, 2:8] = bits.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :6]
+    return out
+
+
+def _decodeAlpha(blocks):
+    a0 = blocks[:, 0].astype(np.int32)
+    a1 = blocks[:, 1].astype(np.int32)
+    raw = np.zeros((len(blocks), 8), np.uint8)
+    raw[:, :6] = blocks[:, 2:8]
+    bits = raw.view('<u8')[:, 0]
+    indices = ((bits[:, None] >> (3 * np.arange(16, dtype=np.uint64))) & 7).astype(np.int64)
+
+    palette = _alphaPalette(a0, a1)
+    # 6 value mode, interpolated 4 steps plus 0 and 255
+    six = a0 <= a1
+    if six.any():
+        w0 = np.array([5, 0, 4, 3, 2, 1])
+        small = (w0 * a0[six, None] + (5 - w0) * a1[six, None]) // 5
+        palette[six] = np.concatenate([small, np.tile([0, 255], (six.sum(), 1))], axis=1)
+
+    return np.take_along_axis(palette, indices, axis=1).astype(np.uint8)
+
+
+def encode(pixels, vkFormat):
+    """Compress an ``(H, W, 4)`` uint8 image.
+
+    Returns
+    -------
+    blocks : array
+        ``(H / 4, W / 4, bytes per block)`` uint8, rows of blocks in the
+        order ``vkCmdCopyBufferToImage`` expects them.
+    """
+    if not canEncode(vkFormat):
+        raise ValueError('no encoder for VkFormat {}'.format(vkFormat))
+
+    blocks = toBlocks(np.asarray(pixels, np.uint8))
+    rows, columns = blocks.shape[:2]
+    blocks = blocks.reshape(-1, 16, blocks.shape[-1])
+
+    color = _encodeColor(blocks[:, :, :3].astype(np.float64))
+    if vkFormat == BC3_UNORM:
+        color = np.concatenate([_encodeAlpha(blocks[:, :, 3]), color], axis=1)
+
+    return color.reshape(rows, columns, -1)
+
+
+def decode(blocks, width, height, vkFormat):
+    """Decompress blocks to an ``(height, width, 4)`` uint8 image.
+
+    ``blocks`` may be any uint8 buffer starting with the level's blocks,
+    bytes past the level are ignored.
+    """
+    if not canEncode(vkFormat):
+        raise ValueError('no decoder for VkFormat {}'.format(vkFormat))
+
+    rows, columns = blockCount(width, height)
+    size = rows * columns * BLOCK_BYTES[vkFormat]
+    blocks = np.asarray(blocks, np.uint8).reshape(-1)[:size].reshape(rows * columns, BLOCK_BYTES[vkFormat])
+
+    texels = np.empty((len(blocks), 16, 4), np.uint8)
+    if vkFormat == BC3_UNORM:
+        texels[:, :, 3] = _decodeAlpha(blocks[:, :8])
+        texels[:, :, :3] = _decodeColor(blocks[:, 8:])
+    else:
+        texels[:, :, 3] = 255
+        texels[:, :, :3] = _decodeColor(blocks)
+
+    return fromBlocks(texels.reshape(rows, columns, 16, 4), width, height)
+
+
+def psnr(a, b, channels=3):
+    """Peak signal to noise ratio in dB over the first ``channels`` channels."""
+    a = np.asarray(a, np.float64)[..., :channels]
+    b = np.asarray(b, np.float64)[..., :channels]
+    mse = np.mean((a - b) ** 2)
+    return float('inf') if mse == 0 else 10.0 * np.log10(255.0 ** 2 / mse)
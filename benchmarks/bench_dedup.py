@@ -0,0 +1,104 @@
+# -*- coding: UTF-8 -*-
+"""
+Compare the vectorized vertex deduplication in mesh.py with the dict loop the
+model loading examples used to run.
+
+    python benchmarks/bench_dedup.py                      # synthetic grid mesh
+    python benchmarks/bench_dedup.py models/chalet.obj    # needs tinyobjloader
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mesh
+
+
+def dedupLoop(vertices, texcoords, positionIndices, texcoordIndices):
+    # the original __loadModel loop, working on flat python lists
+    uniqueVertices = {}
+    vertexData = []
+    indexData = []
+    for vid, tid in zip(positionIndices, texcoordIndices):
+        data = (
+            vertices[3 * vid + 0],
+            vertices[3 * vid + 1],
+            vertices[3 * vid + 2],
+
+            1.0, 1.0, 1.0,
+
+            texcoords[2 * tid + 0],
+            1.0 - texcoords[2 * tid + 1]
+        )
+
+        if data not in uniqueVertices:
+            uniqueVertices[data] = len(vertexData)
+            vertexData.append(data)
+        indexData.append(uniqueVertices[data])
+
+    return np.array(vertexData, np.float32), np.array(indexData, np.uint32)
+
+
+def gridMesh(size):
+    # a size x size quad grid with a uv seam, so vertices get shared and split
+    ys, xs = np.mgrid[0:size + 1, 0:size + 1]
+    positions = np.stack([xs.ravel(), ys.ravel(), np.zeros(xs.size)], axis=1) / float(size)
+    texcoords = np.concatenate([positions[:, :2], positions[:, :2] * 0.5])
+
+    quad = ys[:-1, :-1].ravel() * (size + 1) + xs[:-1, :-1].ravel()
+    tris = np.stack([quad, quad + 1, quad + size + 2, quad, quad + size + 2, quad + size + 1], axis=1).ravel()
+    uvs = tris + np.repeat(quad % 2, 6) * len(positions)
+    return positions, texcoords, tris, uvs
+
+
+def sameUpToReordering(a, b):
+    av, ai = a
+    bv, bi = b
+    return len(av) == len(bv) and len(ai) == len(bi) and np.array_equal(av[ai], bv[bi])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('model', nargs='?', help='OBJ file, uses a synthetic grid when omitted')
+    parser.add_argument('--grid', type=int, default=300, help='synthetic grid resolution')
+    args = parser.parse_args()
+
+    if args.model:
+        import tinyobjloader as tol
+        positions, texcoords, vid, tid = mesh.fromTinyObj(tol.LoadObj(args.model))
+    else:
+        positions, texcoords, vid, tid = gridMesh(args.grid)
+
+    flatVertices = positions.ravel().tolist()
+    flatTexcoords = texcoords.ravel().tolist()
+    vidList = vid.tolist()
+    tidList = tid.tolist()
+    print('{} corners, {} positions, {} texcoords'.format(len(vid), len(positions), len(texcoords)))
+
+    startTime = time.perf_counter()
+    reference = dedupLoop(flatVertices, flatTexcoords, vidList, tidList)
+    loopTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    result = mesh.deduplicateVertices(positions, texcoords, vid, tid)
+    numpyTime = time.perf_counter() - startTime
+
+    print('dict loop: {:8.3f} s  {} vertices'.format(loopTime, len(reference[0])))
+    print('numpy:     {:8.3f} s  {} vertices'.format(numpyTime, len(result[0])))
+    print('speedup:   {:8.1f}x'.format(loopTime / max(numpyTime, 1e-9)))
+
+    exact = np.array_equal(reference[0], result[0]) and np.array_equal(reference[1], result[1])
+    print('identical: {}'.format(exact))
+    print('identical up to reordering: {}'.format(sameUpToReordering(reference, result)))
+
+    if not sameUpToReordering(reference, result):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
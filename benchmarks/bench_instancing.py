@@ -0,0 +1,66 @@
+# -*- coding: UTF-8 -*-
+"""
+Instanced against separate, direct against indirect draws in 28_mipmapping.py.
+
+Renders a grid of copies of the model offscreen, once with one draw per
+sub mesh whose instance count covers all visible copies, once with one
+draw per copy. Both read their model matrix from the per instance vertex
+buffer, so the GPU work is the same and the difference is the cost of
+recording and submitting the draws. Each is run with a
+``vkCmdDrawIndexed`` call per draw and with all draws copied into an
+indirect buffer and recorded with ``vkCmdDrawIndexedIndirect``. Run from
+anywhere, the script switches to the repository root so models/,
+textures/ and shader/ resolve.
+
+    python benchmarks/bench_instancing.py --instances 64 --frames 300
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+from PySide2 import QtGui
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_resize import (ROOT, loadExample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', type=int, default=64, help='copies of the model')
+    parser.add_argument('--frames', type=int, default=300, help='frames per run')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    example = loadExample('28_mipmapping.py', 'mipmapping')
+
+    app = QtGui.QGuiApplication(sys.argv[:1])
+    win = example.HelloTriangleApplication(headless=True, instances=args.instances)
+
+    results = {}
+    for instanced in (True, False):
+        for indirectDraws in (False, True):
+            # command buffers are recorded every frame while meshlet culling is on
+            win.meshletCulling = True
+            win.instancedDraws = instanced
+            win.indirectDraws = indirectDraws
+            name = '{} {}'.format('instanced' if instanced else 'separate', 'indirect' if indirectDraws else 'direct')
+            print('{} draws, {} instances'.format(name, args.instances))
+            # the first frames warm up pipelines and caches
+            win.runHeadless(10)
+            results[name] = np.median(win.runHeadless(args.frames)) * 1000.0
+
+    fastest = min(results.values())
+    print('median frame ms:')
+    for name, frameTime in results.items():
+        print('  {:20s} {:8.2f}  ({:.2f}x)'.format(name, frameTime, frameTime / max(fastest, 1e-9)))
+
+    del win
+
+
+if __name__ == '__main__':
+    main()
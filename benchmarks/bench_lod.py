@@ -0,0 +1,64 @@
+# -*- coding: UTF-8 -*-
+"""
+LOD chain build time, triangle counts and the level picked per distance.
+
+Builds lod.buildLodChain for a mesh and prints every level's triangle count
+and error, then the projected bounding sphere radius and the selected level
+for a camera moving away from the mesh, with the projection 28_mipmapping
+uses. The synthetic grid is bent so clustering has something to simplify.
+
+    python benchmarks/bench_lod.py --grid 400
+    python benchmarks/bench_lod.py models/chalet.obj --pixel-error 2
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glm
+import lod
+import mesh
+from bench_dedup import gridMesh
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', nargs='?', help='OBJ file, uses a synthetic grid when omitted')
+    parser.add_argument('--grid', type=int, default=400, help='synthetic grid resolution')
+    parser.add_argument('--pixel-error', type=float, default=1.0, help='allowed error in pixels')
+    parser.add_argument('--height', type=int, default=720, help='viewport height in pixels')
+    args = parser.parse_args()
+
+    if args.model:
+        vertices, indices = mesh.deduplicateVertices(*mesh.loadObj(args.model))
+    else:
+        vertices, indices = mesh.deduplicateVertices(*gridMesh(args.grid))
+        vertices[:, 2] = 0.2 * np.sin(vertices[:, 0] * 6.0) * np.cos(vertices[:, 1] * 5.0)
+
+    startTime = time.perf_counter()
+    levels = lod.buildLodChain(vertices, indices)
+    print('built {} levels in {:.3f} s'.format(len(levels), time.perf_counter() - startTime))
+    for level, (levelIndices, error) in enumerate(levels):
+        print('level {}: {:8d} triangles  error {:.4g}'.format(level, len(levelIndices) // 3, error))
+
+    errors = [error for _, error in levels]
+    center, radius = lod.boundingSphere(vertices)
+    proj = glm.perspective(-45.0, 16.0 / 9.0, 0.1, 1000.0)
+    up = np.array([0, 0, 1], np.float32)
+    for distance in (1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0):
+        eye = (center + np.array([distance, distance, distance]) * radius).astype(np.float32)
+        view = glm.lookAt(eye, center.astype(np.float32), up)
+        pixelRadius = lod.projectedRadius(center, radius, view, proj, args.height)
+        level = lod.selectLevel(errors, radius, pixelRadius, args.pixel_error)
+        print('distance {:5.1f} radii: {:8.1f} px radius, level {}'.format(
+            distance * np.sqrt(3.0), pixelRadius, level))
+
+
+if __name__ == '__main__':
+    main()
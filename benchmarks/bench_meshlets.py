@@ -0,0 +1,80 @@
+# -*- coding: UTF-8 -*-
+"""
+Meshlet build time and per frame culling on an orbiting camera.
+
+Builds meshlet.buildMeshlets for a mesh, then orbits a camera around it
+like 28_mipmapping's rotating model and prints, per frame, the share of
+triangles culled by the frustum and normal cones, the number of draws left
+after drawRanges merged neighbours and the time culling took. Without an
+argument a UV sphere is used, roughly half of which always faces away.
+
+    python benchmarks/bench_meshlets.py --sphere 300
+    python benchmarks/bench_meshlets.py models/chalet.obj --distance 1.5
+"""
+
+import os
+import sys
+import time
+import math
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glm
+import lod
+import mesh
+import meshlet
+import meshopt
+
+
+def sphereMesh(size):
+    theta, phi = np.meshgrid(np.linspace(0.0, math.pi, size + 1), np.linspace(0.0, 2.0 * math.pi, 2 * size + 1),
+                             indexing='ij')
+    positions = np.stack([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)], axis=-1)
+    width = 2 * size + 1
+    quad = (np.arange(size)[:, None] * width + np.arange(2 * size)[None, :]).ravel()
+    indices = np.stack([quad, quad + width, quad + 1, quad + 1, quad + width, quad + width + 1], axis=1).ravel()
+    return positions.reshape(-1, 3), indices.astype(np.uint32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', nargs='?', help='OBJ file, uses a UV sphere when omitted')
+    parser.add_argument('--sphere', type=int, default=300, help='UV sphere rings')
+    parser.add_argument('--distance', type=float, default=3.0, help='camera distance in bounding sphere radii')
+    parser.add_argument('--frames', type=int, default=8, help='camera positions around the mesh')
+    args = parser.parse_args()
+
+    if args.model:
+        vertices, indices = mesh.deduplicateVertices(*mesh.loadObj(args.model))
+        vertices, indices = meshopt.optimizeMesh(vertices, indices)
+    else:
+        vertices, indices = sphereMesh(args.sphere)
+
+    startTime = time.perf_counter()
+    meshlets = meshlet.buildMeshlets(vertices, indices)
+    print('{} triangles, {} meshlets ({:.1f} triangles each) in {:.3f} s'.format(
+        len(indices) // 3, len(meshlets), len(indices) / 3.0 / max(len(meshlets), 1), time.perf_counter() - startTime))
+
+    center, radius = lod.boundingSphere(vertices)
+    proj = glm.perspective(-45.0, 16.0 / 9.0, 0.1, 100.0 * radius)
+    up = np.array([0, 0, 1], np.float32)
+    for frame in range(args.frames):
+        angle = 2.0 * math.pi * frame / args.frames
+        eye = center + args.distance * radius * np.array([math.cos(angle), math.sin(angle), 0.5])
+        view = glm.lookAt(eye.astype(np.float32), center.astype(np.float32), up)
+
+        startTime = time.perf_counter()
+        visible = meshlet.cullMeshlets(meshlets, view, proj)
+        firstIndex, indexCount, vertexOffset = meshlet.drawRanges(meshlets, visible)
+        elapsed = time.perf_counter() - startTime
+
+        culled = 1.0 - indexCount.sum() / float(meshlets.indexCount.sum())
+        print('frame {}: culled {:5.1f}% of triangles, {:5d} draws, {:.3f} ms'.format(
+            frame, 100.0 * culled, len(firstIndex), elapsed * 1000.0))
+
+
+if __name__ == '__main__':
+    main()
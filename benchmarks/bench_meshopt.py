@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+"""
+Vertex cache efficiency before and after meshopt.optimizeMesh.
+
+Reports ACMR (transformed vertices per triangle) and ATVR (transformed
+vertices per unique vertex) of a simulated FIFO cache for a few cache
+sizes. The synthetic grid has its triangles shuffled first, the way meshes
+exported from modelling tools often are.
+
+    python benchmarks/bench_meshopt.py --grid 300
+    python benchmarks/bench_meshopt.py models/chalet.obj
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mesh
+import meshopt
+from bench_dedup import gridMesh
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', nargs='?', help='OBJ file, uses a shuffled synthetic grid when omitted')
+    parser.add_argument('--grid', type=int, default=300, help='synthetic grid resolution')
+    parser.add_argument('--cache', type=int, default=meshopt.DEFAULT_CACHE_SIZE, help='cache size to optimize for')
+    args = parser.parse_args()
+
+    if args.model:
+        vertices, indices = mesh.deduplicateVertices(*mesh.loadObj(args.model))
+    else:
+        vertices, indices = mesh.deduplicateVertices(*gridMesh(args.grid))
+        triangles = np.random.RandomState(0).permutation(len(indices) // 3)
+        indices = indices.reshape(-1, 3)[triangles].reshape(-1)
+
+    print('{} vertices, {} triangles'.format(len(vertices), len(indices) // 3))
+
+    startTime = time.perf_counter()
+    newVertices, newIndices = meshopt.optimizeMesh(vertices, indices, args.cache)
+    print('optimized in {:.3f} s for a cache of {}'.format(time.perf_counter() - startTime, args.cache))
+
+    for cacheSize in (16, 32, 64):
+        acmr, atvr = meshopt.vertexCacheStats(indices, len(vertices), cacheSize)
+        newAcmr, newAtvr = meshopt.vertexCacheStats(newIndices, len(newVertices), cacheSize)
+        print('FIFO {:3d}: ACMR {:.3f} -> {:.3f}   ATVR {:.3f} -> {:.3f}'.format(
+            cacheSize, acmr, newAcmr, atvr, newAtvr))
+
+
+if __name__ == '__main__':
+    main()
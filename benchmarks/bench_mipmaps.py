@@ -0,0 +1,112 @@
+# -*- coding: UTF-8 -*-
+"""
+Compare the NumPy mip chain in texture.py with the vkCmdBlitImage chain of
+28_mipmapping.py.
+
+The CPU filters are timed directly. The blit chain is emulated with NumPy
+(a 2x2 average into int(size / 2), which is what a linear blit of a halved
+level samples) to compare quality against the kaiser chain. With --gpu the
+example is also started headless with each mipmap mode and the time until
+the first frame is done is reported, which includes the blits or the larger
+upload.
+
+    python benchmarks/bench_mipmaps.py                       # random 2048x2048 image
+    python benchmarks/bench_mipmaps.py textures/chalet.jpg   # needs PIL
+    python benchmarks/bench_mipmaps.py --size 1000 --gpu
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import texture
+
+
+def blitChain(pixels):
+    # level i + 1 samples the middle of every 2x2 block of level i, texels
+    # past int(size / 2) * 2 are dropped like the blit chain drops them
+    chain = [pixels]
+    current = pixels.astype(np.float32)
+    for level in range(1, texture.mipLevelCount(pixels.shape[1], pixels.shape[0])):
+        h, w = current.shape[:2]
+        h2, w2 = max(h // 2, 1), max(w // 2, 1)
+        current = current[:h2 * 2 if h > 1 else 1, :w2 * 2 if w > 1 else 1]
+        current = current.reshape(h2, -1, w2, current.shape[1] // w2, current.shape[2]).mean(axis=(1, 3))
+        chain.append(np.clip(current + 0.5, 0, 255).astype(np.uint8))
+    return chain
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10.0 * np.log10(255.0 ** 2 / mse)
+
+
+def timeStartup(mipmaps):
+    from PySide2 import QtGui
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location('mipmapping', os.path.join(ROOT, '28_mipmapping.py'))
+    example = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(example)
+
+    app = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication(sys.argv[:1])
+    startTime = time.perf_counter()
+    win = example.HelloTriangleApplication(headless=True, mipmaps=mipmaps)
+    win.runHeadless(1)
+    startupTime = time.perf_counter() - startTime
+    del win
+    return startupTime
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image', nargs='?', help='image file, uses random pixels when omitted')
+    parser.add_argument('--size', type=int, default=2048, help='random image size')
+    parser.add_argument('--gpu', action='store_true', help='also time the example start up with each mode')
+    args = parser.parse_args()
+
+    if args.image:
+        from PIL import Image
+        pixels = np.asarray(Image.open(args.image).convert('RGBA'))
+    else:
+        pixels = np.random.RandomState(0).randint(0, 256, (args.size, args.size, 4)).astype(np.uint8)
+
+    height, width = pixels.shape[:2]
+    print('{}x{}, {} levels'.format(width, height, texture.mipLevelCount(width, height)))
+
+    chains = {}
+    for name, build in [('blit (numpy)', blitChain),
+                        ('box', lambda p: texture.buildMipChain(p, 'box')),
+                        ('kaiser', lambda p: texture.buildMipChain(p, 'kaiser'))]:
+        startTime = time.perf_counter()
+        chains[name] = build(pixels)
+        print('{:13s} {:8.3f} s'.format(name, time.perf_counter() - startTime))
+
+    # level 1 against the kaiser reference, the blit chain differs in size on odd levels
+    reference = chains['kaiser'][1]
+    for name in ('blit (numpy)', 'box'):
+        level = chains[name][1]
+        if level.shape == reference.shape:
+            print('{:13s} level 1 PSNR vs kaiser {:6.2f} dB'.format(name, psnr(level, reference)))
+        else:
+            print('{:13s} level 1 is {}x{}, expected {}x{}'.format(name, level.shape[1], level.shape[0],
+                                                                  reference.shape[1], reference.shape[0]))
+
+    data, levels = texture.packMipChain(chains['box'])
+    print('packed chain {:.1f} MB in {} regions'.format(data.nbytes / 1048576.0, len(levels)))
+
+    if args.gpu:
+        os.chdir(ROOT)
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        for mipmaps in ('gpu', 'cpu'):
+            print('start up with {} mipmaps: {:.3f} s'.format(mipmaps, timeStartup(mipmaps)))
+
+
+if __name__ == '__main__':
+    main()
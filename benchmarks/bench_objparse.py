@@ -0,0 +1,139 @@
+# -*- coding: UTF-8 -*-
+"""
+Time and memory of OBJ parsing, mesh.ObjReader in one and in several
+processes against tinyobjloader.
+
+Without an argument a synthetic grid mesh is written to a temporary OBJ
+file. Peak memory is measured with tracemalloc, which sees NumPy buffers
+and Python objects alike. tinyobjloader is skipped if it is not installed.
+
+    python benchmarks/bench_objparse.py --grid 1000
+    python benchmarks/bench_objparse.py models/chalet.obj --workers 8
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mesh
+from bench_dedup import gridMesh
+
+
+def writeObj(path, positions, texcoords, positionIndices, texcoordIndices):
+    with open(path, 'w') as f:
+        for p in positions.tolist():
+            f.write('v {!r} {!r} {!r}\n'.format(*p))
+        for t in texcoords.tolist():
+            f.write('vt {!r} {!r}\n'.format(*t))
+        faces = np.stack([positionIndices + 1, texcoordIndices + 1], axis=1).reshape(-1, 6)
+        for face in faces.tolist():
+            f.write('f {}/{} {}/{} {}/{}\n'.format(*face))
+
+
+# the same quad as plain OBJ and as variations the parser has to accept
+SYNTAX_CASES = {
+    'plain': 'v 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\nvt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\n'
+             'f 1/1 2/2 3/3\nf 1/1 3/3 4/4\n',
+    'CRLF': 'v 0 0 0\r\nv 1 0 0\r\nv 1 1 0\r\nv 0 1 0\r\nvt 0 0\r\nvt 1 0\r\nvt 1 1\r\nvt 0 1\r\n'
+            'f 1/1 2/2 3/3\r\nf 1/1 3/3 4/4\r\n',
+    'indented': 'v 0 0 0\n  v 1 0 0\n\tv 1 1 0\nv 0 1 0\nvt 0 0\nvt 1 0\n  vt 1 1\nvt 0 1\n'
+                'g quad\n  f 1/1 2/2 3/3\n\tf 1/1 3/3 4/4\n',
+    'comments': '# quad\nv 0 0 0\nv 1 0 0 # x\nv 1 1 0\nv 0 1 0\nvt 0 0\nvt 1 0\nvt 1 1\nvt 0 1 # last\n'
+                'f 1/1 2/2 3/3 # tri\nf 1/1 3/3 4/4#tri\n',
+    'polygon': 'v 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\r\nvt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\n'
+               '  f 1/1 2/2 3/3 4/4 # quad\r\n',
+}
+
+
+def checkSyntax():
+    # every variation has to parse to the plain quad
+    directory = tempfile.mkdtemp()
+    results = {}
+    for name, text in SYNTAX_CASES.items():
+        path = os.path.join(directory, name + '.obj')
+        with open(path, 'wb') as f:
+            f.write(text.encode('ascii'))
+        results[name] = mesh.loadObj(path)
+        os.remove(path)
+    os.rmdir(directory)
+
+    reference = results['plain']
+    failed = [name for name, result in results.items()
+              if not all(np.array_equal(a, b) for a, b in zip(reference, result))]
+    print('syntax variations: {}'.format(', '.join(failed) + ' differ' if failed else 'ok'))
+    return not failed
+
+
+def measure(func):
+    tracemalloc.start()
+    startTime = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - startTime
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def report(name, elapsed, peak):
+    print('{:16s} {:8.3f} s  peak {:8.1f} MB'.format(name, elapsed, peak / 1048576.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', nargs='?', help='OBJ file, a synthetic grid is written when omitted')
+    parser.add_argument('--grid', type=int, default=500, help='synthetic grid resolution')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes for the parallel run')
+    args = parser.parse_args()
+
+    if not checkSyntax():
+        sys.exit(1)
+
+    path = args.model
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), 'grid.obj')
+        writeObj(path, *gridMesh(args.grid))
+
+    try:
+        print('{}: {:.1f} MB'.format(path, os.path.getsize(path) / 1048576.0))
+
+        reference, elapsed, peak = measure(lambda: mesh.loadObj(path))
+        report('ObjReader', elapsed, peak)
+        print('{:16s} {:8.1f} MB'.format('output', sum(a.nbytes for a in reference) / 1048576.0))
+
+        # tracemalloc only sees this process, the workers' memory is not counted
+        result, elapsed, peak = measure(lambda: mesh.loadObj(path, workers=args.workers))
+        report('{} processes'.format(args.workers), elapsed, peak)
+        same = all(np.array_equal(a, b) for a, b in zip(reference, result))
+        print('identical to one process: {}'.format(same))
+        if not same:
+            sys.exit(1)
+
+        try:
+            import tinyobjloader as tol
+        except ImportError:
+            print('tinyobjloader not installed, skipped')
+            return
+
+        result, elapsed, peak = measure(lambda: mesh.fromTinyObj(tol.LoadObj(path)))
+        report('tinyobjloader', elapsed, peak)
+
+        same = all(np.array_equal(a, b) for a, b in zip(reference, result))
+        print('identical: {}'.format(same))
+        if not same:
+            sys.exit(1)
+    finally:
+        if not args.model:
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: UTF-8 -*-
+"""
+Pipeline cache save and load round trip.
+
+Creates a bare instance and device, saves a PipelineCache to a temporary
+file, loads it into a second PipelineCache and checks the driver got back
+the blob it handed out. No window or pipeline is needed, so this runs on
+render nodes and software drivers too.
+
+    python benchmarks/bench_pipelinecache.py
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from vulkan import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipelinecache import (PipelineCache, FILE_HEADER)
+
+
+def createDevice():
+    appInfo = VkApplicationInfo(
+        pApplicationName='pipeline cache',
+        applicationVersion=VK_MAKE_VERSION(1, 0, 0),
+        pEngineName='pyvulkan',
+        engineVersion=VK_MAKE_VERSION(1, 0, 0),
+        apiVersion=VK_API_VERSION
+    )
+    instance = vkCreateInstance(VkInstanceCreateInfo(pApplicationInfo=appInfo, enabledLayerCount=0), None)
+    physicalDevice = vkEnumeratePhysicalDevices(instance)[0]
+
+    queueInfo = VkDeviceQueueCreateInfo(
+        queueFamilyIndex=0,
+        queueCount=1,
+        pQueuePriorities=[1.0]
+    )
+    device = vkCreateDevice(physicalDevice, VkDeviceCreateInfo(pQueueCreateInfos=[queueInfo], enabledLayerCount=0),
+                            None)
+    return instance, physicalDevice, device
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=10, help='save and load rounds to time')
+    args = parser.parse_args()
+
+    instance, physicalDevice, device = createDevice()
+    path = os.path.join(tempfile.mkdtemp(), 'pipeline.cache')
+
+    first = PipelineCache(device, physicalDevice, path)
+    assert first.loadedBytes == 0
+    first.save()
+    first.destroy()
+    print('saved {} bytes, file {} bytes'.format(first.savedBytes, os.path.getsize(path)))
+    assert os.path.getsize(path) == FILE_HEADER.size + first.savedBytes
+
+    saveTimes = []
+    loadTimes = []
+    for i in range(args.rounds):
+        startTime = time.perf_counter()
+        cache = PipelineCache(device, physicalDevice, path)
+        loadTimes.append(time.perf_counter() - startTime)
+        assert cache.loadedBytes == first.savedBytes, (cache.loadedBytes, first.savedBytes)
+
+        startTime = time.perf_counter()
+        cache.save()
+        saveTimes.append(time.perf_counter() - startTime)
+        cache.destroy()
+
+    print('round trip ok, load {:.3f} ms  save {:.3f} ms'.format(
+        1000.0 * sum(loadTimes) / len(loadTimes), 1000.0 * sum(saveTimes) / len(saveTimes)))
+
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+    vkDestroyDevice(device, None)
+    vkDestroyInstance(instance, None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: UTF-8 -*-
+"""
+Resize stress test for 28_mipmapping.py.
+
+Resizes the window back and forth and reports how long each swap chain
+recreation took. Run from anywhere, the script switches to the repository
+root so models/, textures/ and shader/ resolve.
+
+    python benchmarks/bench_resize.py --count 200
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib.util
+
+import numpy as np
+from PySide2 import QtGui
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loadExample(fileName, moduleName):
+    spec = importlib.util.spec_from_file_location(moduleName, os.path.join(ROOT, fileName))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=100, help='number of resizes')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    example = loadExample('28_mipmapping.py', 'mipmapping')
+
+    app = QtGui.QGuiApplication(sys.argv)
+    win = example.HelloTriangleApplication()
+    win.show()
+    app.processEvents()
+
+    sizes = [(1280, 720), (960, 540), (1600, 900), (640, 480)]
+    del win.recreateTimes[:]
+
+    startTime = time.perf_counter()
+    for i in range(args.count):
+        width, height = sizes[i % len(sizes)]
+        win.resize(width, height)
+        app.processEvents()
+        win.render()
+    totalTime = time.perf_counter() - startTime
+
+    times = np.array(win.recreateTimes) * 1000.0
+    print('{} resizes, {} swap chain recreations in {:.2f} s'.format(args.count, len(times), totalTime))
+    if len(times):
+        print('recreation latency ms: mean {:.2f}  median {:.2f}  p95 {:.2f}  max {:.2f}'.format(
+            times.mean(), np.median(times), np.percentile(times, 95), times.max()))
+
+    win.timer.stop()
+    del win
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# -*- coding: UTF-8 -*-
+"""
+Frustum culling of many objects with scene.Scene.
+
+Scatters objects with random positions, rotations and scales over a square
+and culls them for a camera turning in its middle, once with bounding
+spheres only and once with boxes for the objects that cross a plane.
+A plain Python loop over a slice of the objects gives the per object
+baseline; its results are checked against the vectorized ones.
+
+    python benchmarks/bench_scene.py --objects 100000 --frames 100
+"""
+
+import os
+import sys
+import time
+import math
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glm
+import scene
+
+
+def randomTransforms(count, size, rng):
+    transforms = np.tile(np.identity(4, np.float32), (count, 1, 1))
+    angles = np.radians(rng.uniform(0.0, 360.0, count))
+    scales = rng.uniform(0.2, 1.0, count)
+    c, s = np.cos(angles) * scales, np.sin(angles) * scales
+    # rotation about z, row vector convention
+    transforms[:, 0, 0] = c
+    transforms[:, 0, 1] = s
+    transforms[:, 1, 0] = -s
+    transforms[:, 1, 1] = c
+    transforms[:, 2, 2] = scales
+    transforms[:, 3, :2] = rng.uniform(-size, size, (count, 2))
+    return transforms
+
+
+def cullLoop(store, viewProj, count):
+    # the sphere test one object at a time
+    planes = scene.frustumPlanes(viewProj)
+    visible = []
+    for i in range(count):
+        center = store.centers[i]
+        radius = store.radii[i]
+        for plane in planes:
+            if np.dot(plane[:3], center) + plane[3] < -radius:
+                break
+        else:
+            visible.append(i)
+    return np.array(visible, np.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objects', type=int, default=100000)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--loop', type=int, default=10000, help='objects the Python loop baseline tests')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    size = math.sqrt(args.objects)
+    store = scene.Scene()
+    startTime = time.perf_counter()
+    store.addObjects(randomTransforms(args.objects, size, rng), (-0.5, -0.5, 0.0), (0.5, 0.5, 1.0))
+    print('{} objects added in {:.3f} s'.format(len(store), time.perf_counter() - startTime))
+
+    proj = glm.perspective(45.0, 16.0 / 9.0, 0.1, size)
+    up = np.array([0, 0, 1], np.float32)
+    for boxes in (False, True):
+        times = []
+        visibleCounts = []
+        for frame in range(args.frames):
+            angle = 2.0 * math.pi * frame / args.frames
+            target = np.array([math.cos(angle), math.sin(angle), 1.8], np.float32)
+            view = glm.lookAt(np.array([0, 0, 2], np.float32), target, up)
+            viewProj = np.dot(view, proj)
+
+            startTime = time.perf_counter()
+            visible = store.cull(viewProj, boxes)
+            times.append(time.perf_counter() - startTime)
+            visibleCounts.append(len(visible))
+
+        times = np.array(times) * 1000.0
+        print('{:8s} {:7.3f} ms/frame (max {:.3f}), {:.1f}% visible'.format(
+            'boxes' if boxes else 'spheres', times.mean(), times.max(),
+            100.0 * np.mean(visibleCounts) / len(store)))
+
+    count = min(args.loop, len(store))
+    startTime = time.perf_counter()
+    expected = cullLoop(store, viewProj, count)
+    loopTime = (time.perf_counter() - startTime) * len(store) / count
+    print('python loop {:7.1f} ms/frame (extrapolated from {} objects)'.format(loopTime * 1000.0, count))
+
+    visible = store.cull(viewProj, boxes=False)
+    same = np.array_equal(visible[visible < count], expected)
+    print('same as the loop: {}'.format(same))
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+"""
+Decode many textures serially and with texture.TextureLoader.
+
+Writes synthetic JPEG files to a temporary directory (or uses the images
+given on the command line) and times decodeTexture over all of them, once
+in a loop and once per pool kind. Needs PIL.
+
+    python benchmarks/bench_texture_pool.py --count 100 --size 1024
+    python benchmarks/bench_texture_pool.py textures/*.jpg --mipmaps cpu
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import texture
+
+
+def writeImages(directory, count, size):
+    from PIL import Image
+
+    y, x = np.mgrid[0:size, 0:size]
+    paths = []
+    for i in range(count):
+        pixels = np.stack([(x * (i + 1)) % 256, (y * 3 + i) % 256, (x ^ y) % 256], axis=-1).astype(np.uint8)
+        path = os.path.join(directory, 'texture_{:03d}.jpg'.format(i))
+        Image.fromarray(pixels).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', help='image files, synthetic ones are written when omitted')
+    parser.add_argument('--count', type=int, default=32, help='number of synthetic images')
+    parser.add_argument('--size', type=int, default=1024, help='synthetic image size')
+    parser.add_argument('--mipmaps', choices=['auto', 'cpu', 'gpu'], default='cpu')
+    parser.add_argument('--workers', type=int, default=None, help='pool size, one per core by default')
+    args = parser.parse_args()
+
+    directory = None
+    paths = args.images
+    if not paths:
+        directory = tempfile.mkdtemp()
+        paths = writeImages(directory, args.count, args.size)
+
+    try:
+        print('{} textures, mipmaps {}, {} cores'.format(len(paths), args.mipmaps, os.cpu_count()))
+
+        startTime = time.perf_counter()
+        for path in paths:
+            texture.decodeTexture(path, mipmaps=args.mipmaps)
+        serialTime = time.perf_counter() - startTime
+        print('serial:    {:8.3f} s'.format(serialTime))
+
+        for name, processes in (('threads', False), ('processes', True)):
+            loader = texture.TextureLoader(args.workers, processes)
+            startTime = time.perf_counter()
+            firstTime = None
+            for path, decoded in loader.load(paths, mipmaps=args.mipmaps):
+                if firstTime is None:
+                    firstTime = time.perf_counter() - startTime
+            poolTime = time.perf_counter() - startTime
+            loader.shutdown()
+            print('{:10s} {:8.3f} s  {:5.2f}x  first texture after {:.3f} s'.format(
+                name + ':', poolTime, serialTime / poolTime, firstTime))
+    finally:
+        if directory:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
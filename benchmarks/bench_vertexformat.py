@@ -0,0 +1,54 @@
+# -*- coding: UTF-8 -*-
+"""
+Vertex buffer size and quantization error of vertexformat layouts.
+
+Packs the deduplicated vertices of a mesh with every position encoding and
+reports bytes per vertex, the buffer size against the float32 layout of
+mesh.py, the largest and RMS error per attribute and the time packing
+takes. Texture coordinate errors are also given in texels of a texture of
+``--texture`` pixels.
+
+    python benchmarks/bench_vertexformat.py --grid 500
+    python benchmarks/bench_vertexformat.py models/chalet.obj --texture 4096
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mesh
+import vertexformat
+from bench_dedup import gridMesh
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', nargs='?', help='OBJ file, uses a synthetic grid when omitted')
+    parser.add_argument('--grid', type=int, default=500, help='synthetic grid resolution')
+    parser.add_argument('--texture', type=int, default=4096, help='texture size for texel errors')
+    args = parser.parse_args()
+
+    if args.model:
+        vertices, indices = mesh.deduplicateVertices(*mesh.loadObj(args.model))
+    else:
+        vertices, indices = mesh.deduplicateVertices(*gridMesh(args.grid))
+
+    print('{} vertices, float32 layout {:.2f} MB'.format(len(vertices), vertices.nbytes / 1048576.0))
+
+    for position in ('float', 'half', 'unorm16'):
+        layout = vertexformat.VertexLayout.fromVertices(vertices, position)
+        startTime = time.perf_counter()
+        layout.pack(vertices)
+        elapsed = time.perf_counter() - startTime
+
+        print('\npositions {}, packed in {:.3f} s'.format(position, elapsed))
+        for line in layout.report(vertices, (args.texture, args.texture)):
+            print('  ' + line)
+
+
+if __name__ == '__main__':
+    main()
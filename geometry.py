@@ -0,0 +1,262 @@
+# -*- coding: UTF-8 -*-
+"""
+Vertex and index buffers shared by many meshes.
+
+Notes
+-----
+
+A ``GeometryPool`` owns one device local vertex buffer and one index
+buffer. Every mesh added to it gets a range of each, managed by two
+``RangeAllocator`` counting in vertices and indices rather than bytes, so
+the offsets it hands out are directly the ``vertexOffset`` and
+``firstIndex`` of ``vkCmdDrawIndexed``. Indices stay relative to their
+mesh's first vertex, a whole scene is drawn after binding the two buffers
+once.
+
+Removed meshes leave holes that later meshes reuse first fit. When no hole
+is large enough ``add`` compacts the pool, and grows it when the free space
+does not suffice either. Both copy every live range into new buffers, the
+source and destination of a copy may not overlap within one buffer. The old
+buffers may still be read by frames in flight, they are retired and
+destroyed by ``collect`` once the caller knows the GPU is done with them.
+Command buffers that bind the pool's buffers have to be recorded again
+after ``buffersChanged``.
+"""
+
+from vulkan import *
+import numpy as np
+
+from allocator import RangeAllocator
+
+
+INDEX_DTYPES = {
+    VK_INDEX_TYPE_UINT16: np.dtype('<u2'),
+    VK_INDEX_TYPE_UINT32: np.dtype('<u4'),
+}
+
+
+def _packed(ranges):
+    # True if the ranges fill the start of the allocator without holes
+    return max([r.end for r in ranges.ranges] + [0]) == ranges.usedBytes
+
+
+class PoolMesh(object):
+    """Ranges of one mesh in a ``GeometryPool``."""
+
+    def __init__(self, vertexOffset, vertexCount, firstIndex, indexCount):
+        self.vertexOffset = vertexOffset
+        self.vertexCount = vertexCount
+        self.firstIndex = firstIndex
+        self.indexCount = indexCount
+
+    def __repr__(self):
+        return 'PoolMesh(vertexOffset={}, vertexCount={}, firstIndex={}, indexCount={})'.format(
+            self.vertexOffset, self.vertexCount, self.firstIndex, self.indexCount)
+
+
+class GeometryPool(object):
+    """One vertex and one index buffer sub-allocated per mesh.
+
+    Parameters
+    ----------
+    device : VkDevice
+    allocator : DeviceMemoryAllocator
+    vertexStride : int
+        Bytes per vertex, every mesh of the pool uses the same layout.
+    vertexCapacity, indexCapacity : int
+        Initial size of the buffers in vertices and indices.
+    indexType : VkIndexType
+        ``VK_INDEX_TYPE_UINT16`` or ``VK_INDEX_TYPE_UINT32``.
+    """
+
+    def __init__(self, device, allocator, vertexStride, vertexCapacity, indexCapacity,
+                 indexType=VK_INDEX_TYPE_UINT32):
+        self.__device = device
+        self.__allocator = allocator
+        self.vertexStride = vertexStride
+        self.indexType = indexType
+        self.indexSize = INDEX_DTYPES[indexType].itemsize
+
+        self.__meshes = []
+        self.__retired = []
+        # set whenever the buffers were replaced, cleared by the caller
+        self.buffersChanged = False
+
+        self.__vertexRanges = RangeAllocator(max(vertexCapacity, 1))
+        self.__indexRanges = RangeAllocator(max(indexCapacity, 1))
+        self.vertexBuffer, self.__vertexMemory = self.__createBuffer(self.__vertexRanges.size * vertexStride,
+                                                                     VK_BUFFER_USAGE_VERTEX_BUFFER_BIT)
+        self.indexBuffer, self.__indexMemory = self.__createBuffer(self.__indexRanges.size * self.indexSize,
+                                                                   VK_BUFFER_USAGE_INDEX_BUFFER_BIT)
+
+    def __len__(self):
+        return len(self.__meshes)
+
+    @property
+    def meshes(self):
+        return list(self.__meshes)
+
+    @property
+    def vertexCapacity(self):
+        return self.__vertexRanges.size
+
+    @property
+    def indexCapacity(self):
+        return self.__indexRanges.size
+
+    @property
+    def fragmentation(self):
+        """Larger of the vertex and index buffer's ``RangeAllocator.fragmentation``."""
+        return max(self.__vertexRanges.fragmentation, self.__indexRanges.fragmentation)
+
+    def __createBuffer(self, size, usage):
+        # transfer source too, compaction copies out of the old buffers
+        bufferInfo = VkBufferCreateInfo(
+            size=size,
+            usage=usage | VK_BUFFER_USAGE_TRANSFER_DST_BIT | VK_BUFFER_USAGE_TRANSFER_SRC_BIT,
+            sharingMode=VK_SHARING_MODE_EXCLUSIVE
+        )
+        buffer = vkCreateBuffer(self.__device, bufferInfo, None)
+        memory = self.__allocator.allocateBuffer(buffer, VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
+        return buffer, memory
+
+    def __allocate(self, vertexCount, indexCount):
+        # offsets of both ranges, or None if one of them does not fit
+        vertexOffset = self.__vertexRanges.allocate(vertexCount) if vertexCount else 0
+        if vertexOffset is None:
+            return None
+
+        firstIndex = self.__indexRanges.allocate(indexCount) if indexCount else 0
+        if firstIndex is None:
+            if vertexCount:
+                self.__vertexRanges.free(vertexOffset)
+            return None
+        return vertexOffset, firstIndex
+
+    def add(self, batch, vertices, indices):
+        """Upload a mesh into free space of the pool.
+
+        Parameters
+        ----------
+        batch : UploadBatch
+            Records the copies, and the compaction of the pool if needed.
+        vertices : array
+            ``(N, vertexStride)`` packed vertices, see ``VertexLayout.pack``.
+        indices : array
+            Indices relative to the mesh's first vertex.
+
+        Returns
+        -------
+        mesh : PoolMesh
+        """
+        vertices = np.ascontiguousarray(vertices, np.uint8).reshape(-1, self.vertexStride)
+        indices = np.ascontiguousarray(indices, INDEX_DTYPES[self.indexType])
+
+        offsets = self.__allocate(len(vertices), len(indices))
+        if offsets is None:
+            vertexCapacity = self.vertexCapacity
+            indexCapacity = self.indexCapacity
+            # compact first, grow by doubling if the free space is too small,
+            # the allocators count vertices and indices rather than bytes
+            while self.__vertexRanges.usedBytes + len(vertices) > vertexCapacity:
+                vertexCapacity *= 2
+            while self.__indexRanges.usedBytes + len(indices) > indexCapacity:
+                indexCapacity *= 2
+            self.__rebuild(batch, vertexCapacity, indexCapacity)
+            offsets = self.__allocate(len(vertices), len(indices))
+
+        vertexOffset, firstIndex = offsets
+        mesh = PoolMesh(vertexOffset, len(vertices), firstIndex, len(indices))
+        if len(vertices):
+            batch.copyBuffer(batch.stage(vertices), self.vertexBuffer, vertices.nbytes,
+                             dstOffset=vertexOffset * self.vertexStride)
+        if len(indices):
+            batch.copyBuffer(batch.stage(indices), self.indexBuffer, indices.nbytes,
+                             dstOffset=firstIndex * self.indexSize)
+
+        self.__meshes.append(mesh)
+        return mesh
+
+    def remove(self, mesh):
+        """Return a mesh's ranges to the pool, its draws must no longer be submitted."""
+        self.__meshes.remove(mesh)
+        if mesh.vertexCount:
+            self.__vertexRanges.free(mesh.vertexOffset)
+        if mesh.indexCount:
+            self.__indexRanges.free(mesh.firstIndex)
+
+    def compact(self, batch):
+        """Move all meshes to the start of the pool, returns False if nothing had to move.
+
+        The offsets of every ``PoolMesh`` are updated, draws recorded with
+        the old ones have to be recorded again.
+        """
+        if _packed(self.__vertexRanges) and _packed(self.__indexRanges):
+            return False
+        self.__rebuild(batch, self.vertexCapacity, self.indexCapacity)
+        return True
+
+    def __rebuild(self, batch, vertexCapacity, indexCapacity):
+        vertexRanges = RangeAllocator(vertexCapacity)
+        indexRanges = RangeAllocator(indexCapacity)
+        vertexBuffer, vertexMemory = self.__createBuffer(vertexCapacity * self.vertexStride,
+                                                         VK_BUFFER_USAGE_VERTEX_BUFFER_BIT)
+        indexBuffer, indexMemory = self.__createBuffer(indexCapacity * self.indexSize,
+                                                       VK_BUFFER_USAGE_INDEX_BUFFER_BIT)
+
+        # first fit into empty allocators packs the ranges in their old order
+        vertexMoves = []
+        for mesh in sorted(self.__meshes, key=lambda m: m.vertexOffset):
+            if mesh.vertexCount:
+                offset = vertexRanges.allocate(mesh.vertexCount)
+                vertexMoves.append(VkBufferCopy(mesh.vertexOffset * self.vertexStride, offset * self.vertexStride,
+                                                mesh.vertexCount * self.vertexStride))
+                mesh.vertexOffset = offset
+
+        indexMoves = []
+        for mesh in sorted(self.__meshes, key=lambda m: m.firstIndex):
+            if mesh.indexCount:
+                offset = indexRanges.allocate(mesh.indexCount)
+                indexMoves.append(VkBufferCopy(mesh.firstIndex * self.indexSize, offset * self.indexSize,
+                                               mesh.indexCount * self.indexSize))
+                mesh.firstIndex = offset
+
+        # the batch may already hold copies into the old buffers, they have
+        # to land before they are copied along
+        barrier = VkMemoryBarrier(
+            srcAccessMask=VK_ACCESS_TRANSFER_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_TRANSFER_READ_BIT
+        )
+        vkCmdPipelineBarrier(batch.commandBuffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_TRANSFER_BIT, 0,
+                             1, [barrier], 0, None, 0, None)
+        if vertexMoves:
+            vkCmdCopyBuffer(batch.commandBuffer, self.vertexBuffer, vertexBuffer, len(vertexMoves), vertexMoves)
+        if indexMoves:
+            vkCmdCopyBuffer(batch.commandBuffer, self.indexBuffer, indexBuffer, len(indexMoves), indexMoves)
+
+        self.__retired.append((self.vertexBuffer, self.__vertexMemory))
+        self.__retired.append((self.indexBuffer, self.__indexMemory))
+        self.__vertexRanges = vertexRanges
+        self.__indexRanges = indexRanges
+        self.vertexBuffer, self.__vertexMemory = vertexBuffer, vertexMemory
+        self.indexBuffer, self.__indexMemory = indexBuffer, indexMemory
+        self.buffersChanged = True
+
+    def collect(self):
+        """Destroy the buffers replaced by compaction or growth.
+
+        Only call this once the upload batch that copied out of them has
+        finished and no submitted frame reads them anymore.
+        """
+        for buffer, memory in self.__retired:
+            vkDestroyBuffer(self.__device, buffer, None)
+            self.__allocator.free(memory)
+        self.__retired = []
+
+    def destroy(self):
+        self.collect()
+        vkDestroyBuffer(self.__device, self.vertexBuffer, None)
+        self.__allocator.free(self.__vertexMemory)
+        vkDestroyBuffer(self.__device, self.indexBuffer, None)
+        self.__allocator.free(self.__indexMemory)
+        self.__meshes = []
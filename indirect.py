@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+"""
+Indexed draws as data for ``vkCmdDrawIndexedIndirect``.
+
+Notes
+-----
+
+Every draw issued from Python costs a few microseconds of cffi overhead,
+thousands of them per frame cost far more CPU time than the GPU needs to
+execute them. ``DRAW_INDEXED_INDIRECT_COMMAND`` is the memory layout of
+``VkDrawIndexedIndirectCommand`` as a NumPy structured dtype: draws are
+built as arrays, copied into a buffer the GPU reads and submitted with a
+single ``vkCmdDrawIndexedIndirect`` when the device supports
+``multiDrawIndirect``. Without it ``maxDrawIndirectCount`` is 1 and
+``cmdDrawIndexedIndirect`` falls back to one call per draw.
+
+The fields are in the order ``vkCmdDrawIndexed`` takes its arguments, so
+``vkCmdDrawIndexed(buffer, *command)`` draws a row of the array directly.
+"""
+
+from vulkan import *
+import numpy as np
+
+
+# VkDrawIndexedIndirectCommand
+DRAW_INDEXED_INDIRECT_COMMAND = np.dtype([
+    ('indexCount', '<u4'),
+    ('instanceCount', '<u4'),
+    ('firstIndex', '<u4'),
+    ('vertexOffset', '<i4'),
+    ('firstInstance', '<u4'),
+])
+
+
+def drawCommands(firstIndex, indexCount, vertexOffset, instanceCount=1, firstInstance=0):
+    """Structured array of indexed draws, one per element of the inputs.
+
+    Parameters
+    ----------
+    firstIndex, indexCount, vertexOffset : array
+        Index range and base vertex of every draw.
+    instanceCount, firstInstance : int | array
+        Instances of every draw, one value for all draws or one per draw.
+
+    Returns
+    -------
+    commands : array
+        ``DRAW_INDEXED_INDIRECT_COMMAND`` records.
+    """
+    commands = np.empty(len(firstIndex), DRAW_INDEXED_INDIRECT_COMMAND)
+    commands['indexCount'] = indexCount
+    commands['instanceCount'] = instanceCount
+    commands['firstIndex'] = firstIndex
+    commands['vertexOffset'] = vertexOffset
+    commands['firstInstance'] = firstInstance
+    return commands
+
+
+def perInstance(commands, instanceCount):
+    """Repeat ``commands`` once per instance, each drawing one instance.
+
+    The copies select their instance through ``firstInstance``, indirect
+    draws then need the ``drawIndirectFirstInstance`` feature.
+    """
+    repeated = np.tile(commands, instanceCount)
+    repeated['instanceCount'] = 1
+    repeated['firstInstance'] = np.repeat(np.arange(instanceCount), len(commands))
+    return repeated
+
+
+def cmdDrawIndexedIndirect(commandBuffer, buffer, offset, drawCount, maxDrawCount=1):
+    """Record ``drawCount`` draws stored at ``offset`` of ``buffer``.
+
+    ``maxDrawCount`` is the device's ``maxDrawIndirectCount``, 1 when
+    ``multiDrawIndirect`` is not enabled. Returns the number of calls made.
+    """
+    stride = DRAW_INDEXED_INDIRECT_COMMAND.itemsize
+    maxDrawCount = max(int(maxDrawCount), 1)
+    calls = 0
+    for first in range(0, drawCount, maxDrawCount):
+        count = min(maxDrawCount, drawCount - first)
+        vkCmdDrawIndexedIndirect(commandBuffer, buffer, offset + first * stride, count, stride)
+        calls += 1
+    return calls
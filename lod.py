@@ -0,0 +1,231 @@
+# -*- coding: UTF-8 -*-
+"""
+Level of detail chains and their selection.
+
+Notes
+-----
+
+Coarser levels are built by vertex clustering with quadric error metrics
+(Lindstrom, "Out-of-Core Simplification of Large Polygonal Models", 2000):
+positions are snapped to a grid, all vertices of a cell collapse into one
+and triangles that lose a corner disappear. Edge collapse simplification
+gives better shapes but is sequential, clustering is a handful of NumPy
+passes and still fast for millions of triangles.
+
+The vertex kept for a cell is the existing one with the smallest quadric
+error of the cell, the sum of the planes of all triangles touching it. No
+vertex is created, so every level is just another index buffer for the
+vertex buffer of the full mesh. Each level remembers its error, the
+largest distance between a vertex and the one it collapsed into, which
+``selectLevel`` compares against the size of a pixel at the mesh's
+projected bounding sphere.
+"""
+
+import math
+
+import numpy as np
+
+
+# every level targets this fraction of the previous level's triangles,
+# about right when the screen size of the mesh halves between levels
+LOD_REDUCTION = 0.25
+LOD_MIN_TRIANGLES = 256
+LOD_MAX_LEVELS = 6
+
+# mesh cache sections, see mesh.saveMeshCache
+LOD_SECTIONS = ('lodIndices', 'lodRanges', 'lodErrors')
+
+
+def boundingSphere(positions):
+    """Center and radius of a sphere around ``positions``, centered on the bounding box."""
+    positions = np.asarray(positions, np.float64)[:, :3]
+    if len(positions) == 0:
+        return np.zeros(3), 0.0
+    center = (positions.min(axis=0) + positions.max(axis=0)) / 2.0
+    return center, float(np.sqrt(((positions - center) ** 2).sum(axis=1).max()))
+
+
+def _vertexQuadrics(positions, triangles, vertexCount):
+    # area weighted plane quadrics summed per vertex, the 10 distinct
+    # entries of the symmetric 4x4 matrix
+    p0, p1, p2 = positions[triangles[:, 0]], positions[triangles[:, 1]], positions[triangles[:, 2]]
+    normals = np.cross(p1 - p0, p2 - p0)
+    area = np.linalg.norm(normals, axis=1)
+    normals /= np.maximum(area, 1e-30)[:, None]
+    a, b, c = normals.T
+    d = -(normals * p0).sum(axis=1)
+
+    planes = np.stack([a * a, a * b, a * c, a * d, b * b, b * c, b * d, c * c, c * d, d * d], axis=1)
+    planes *= area[:, None]
+
+    corners = triangles.reshape(-1)
+    quadrics = np.empty((vertexCount, 10))
+    for k in range(10):
+        quadrics[:, k] = np.bincount(corners, np.repeat(planes[:, k], 3), vertexCount)
+    return quadrics
+
+
+def _quadricError(quadrics, positions):
+    x, y, z = positions.T
+    q = quadrics.T
+    return (q[0] * x * x + 2 * q[1] * x * y + 2 * q[2] * x * z + 2 * q[3] * x
+            + q[4] * y * y + 2 * q[5] * y * z + 2 * q[6] * y
+            + q[7] * z * z + 2 * q[8] * z + q[9])
+
+
+def _removeDegenerate(triangles):
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1]) &
+                          (triangles[:, 1] != triangles[:, 2]) &
+                          (triangles[:, 2] != triangles[:, 0])]
+
+    # rotate the smallest index first, keeping the winding, then drop repeats
+    first = np.argmin(triangles, axis=1)
+    rotation = (first[:, None] + np.arange(3)) % 3
+    canonical = np.take_along_axis(triangles, rotation, axis=1)
+    _, keep = np.unique(canonical, axis=0, return_index=True)
+    return triangles[np.sort(keep)]
+
+
+def clusterVertices(positions, indices, resolution, quadrics=None):
+    """Simplify a triangle list by collapsing the vertices of grid cells.
+
+    Parameters
+    ----------
+    positions : array
+        ``(V, 3)`` vertex positions.
+    indices : array
+        Triangle list indices.
+    resolution : float
+        Cells along the longest side of the bounding box.
+    quadrics : array | None
+        Per vertex quadrics from an earlier call on the same mesh.
+
+    Returns
+    -------
+    indices : array
+        Surviving triangles in their original order, into the same vertices.
+    error : float
+        Largest distance between a vertex and the vertex it collapsed into.
+    """
+    positions = np.asarray(positions, np.float64)[:, :3]
+    triangles = np.asarray(indices, np.int64).reshape(-1, 3)
+    if quadrics is None:
+        quadrics = _vertexQuadrics(positions, triangles, len(positions))
+
+    lower = positions.min(axis=0)
+    cellSize = max(float((positions.max(axis=0) - lower).max()), 1e-30) / resolution
+    side = int(math.ceil(resolution)) + 1
+    cells = np.minimum(np.floor((positions - lower) / cellSize).astype(np.int64), side - 1)
+    _, cellOf = np.unique((cells[:, 0] * side + cells[:, 1]) * side + cells[:, 2], return_inverse=True)
+
+    cellCount = int(cellOf.max()) + 1
+    cellQuadrics = np.empty((cellCount, 10))
+    for k in range(10):
+        cellQuadrics[:, k] = np.bincount(cellOf, quadrics[:, k], cellCount)
+
+    # the vertex of every cell that fits the cell's planes best
+    error = _quadricError(cellQuadrics[cellOf], positions)
+    order = np.argsort(error)
+    order = order[np.argsort(cellOf[order], kind='stable')]
+    firsts = np.flatnonzero(np.diff(cellOf[order], prepend=-1))
+    representative = np.empty(cellCount, np.int64)
+    representative[cellOf[order[firsts]]] = order[firsts]
+
+    collapsed = representative[cellOf]
+    distance = np.sqrt(((positions - positions[collapsed]) ** 2).sum(axis=1)).max()
+    result = _removeDegenerate(collapsed[triangles])
+    return result.reshape(-1).astype(np.asarray(indices).dtype), float(distance)
+
+
+def buildLodChain(vertices, indices, reduction=LOD_REDUCTION, minTriangles=LOD_MIN_TRIANGLES,
+                  maxLevels=LOD_MAX_LEVELS):
+    """Index buffers for progressively coarser versions of a mesh.
+
+    The grid resolution of every level is searched until its triangle count
+    is within 20 % of ``reduction`` times the previous level's.
+
+    Returns
+    -------
+    levels : list
+        ``(indices, error)`` per level, coarsest last. Level 0 is ``indices``
+        with an error of 0.
+    """
+    positions = np.asarray(vertices, np.float64)[:, :3]
+    indices = np.asarray(indices)
+    levels = [(indices, 0.0)]
+    if len(indices) // 3 <= minTriangles:
+        return levels
+
+    quadrics = _vertexQuadrics(positions, indices.reshape(-1, 3).astype(np.int64), len(positions))
+    # triangle counts of surfaces grow with the square of the resolution
+    resolution = 2.0 * math.sqrt(len(positions))
+    while len(levels) < maxLevels:
+        previous = len(levels[-1][0]) // 3
+        target = previous * reduction
+        if target < minTriangles:
+            break
+
+        resolution *= math.sqrt(reduction)
+        for _ in range(8):
+            result, error = clusterVertices(positions, indices, resolution, quadrics)
+            count = len(result) // 3
+            if abs(count - target) <= 0.2 * target:
+                break
+            resolution *= math.sqrt(target / float(max(count, 1)))
+
+        if count == 0 or count >= previous:
+            break
+        levels.append((result, error))
+
+    return levels
+
+
+def toSections(levels):
+    """Mesh cache sections of the levels past level 0.
+
+    ``lodRanges`` holds ``(firstIndex, indexCount)`` of every level,
+    level 0 included, into the mesh's indices followed by ``lodIndices``.
+    """
+    base = len(levels[0][0])
+    ranges = [(0, base)]
+    for indices, _ in levels[1:]:
+        ranges.append((ranges[-1][0] + ranges[-1][1], len(indices)))
+
+    lodIndices = [np.asarray(indices, np.uint32) for indices, _ in levels[1:]]
+    return {
+        'lodIndices': np.concatenate(lodIndices) if lodIndices else np.zeros(0, np.uint32),
+        'lodRanges': np.asarray(ranges, np.uint32),
+        'lodErrors': np.asarray([error for _, error in levels], np.float32),
+    }
+
+
+def fromSections(indices, sections):
+    """Inverse of ``toSections``, ``[(indices, error)]`` per level."""
+    allIndices = np.concatenate([np.asarray(indices, np.uint32), sections['lodIndices']])
+    return [(allIndices[first:first + count], float(error))
+            for (first, count), error in zip(sections['lodRanges'].tolist(), sections['lodErrors'])]
+
+
+def projectedRadius(center, radius, modelView, proj, viewportHeight):
+    """Radius in pixels of a bounding sphere on screen.
+
+    ``modelView`` and ``proj`` are row vector matrices like the ones
+    ``glm`` builds. Infinite when the camera is inside the sphere.
+    """
+    viewCenter = np.dot(np.append(np.asarray(center, np.float64), 1.0), modelView)[:3]
+    distance = float(np.linalg.norm(viewCenter))
+    if distance <= radius:
+        return float('inf')
+    return radius * abs(float(proj[1][1])) * viewportHeight / 2.0 / math.sqrt(distance * distance - radius * radius)
+
+
+def selectLevel(errors, radius, pixelRadius, pixelError=1.0):
+    """Coarsest level whose error covers at most ``pixelError`` pixels."""
+    if radius <= 0.0:
+        return 0
+    pixelsPerUnit = pixelRadius / radius
+    level = 0
+    for i, error in enumerate(errors):
+        if error * pixelsPerUnit <= pixelError:
+            level = i
+    return level
@@ -0,0 +1,275 @@
+# -*- coding: UTF-8 -*-
+"""
+Device memory sub-allocation.
+
+Notes
+-----
+
+Instead of one ``vkAllocateMemory`` per buffer or image, resources are placed
+inside large ``VkDeviceMemory`` blocks, one list of blocks per memory type.
+Host visible blocks are mapped once when they are allocated, so
+``Allocation.mapped`` can be written at any time without ``vkMapMemory``.
+"""
+
+from vulkan import *
+import numpy as np
+
+from allocator import RangeAllocator, alignUp
+
+
+DEFAULT_BLOCK_SIZE = 64 * 1024 * 1024
+
+
+class MemoryBlock(object):
+
+    def __init__(self, memory, size, memoryTypeIndex, granularity, mapped=None):
+        self.memory = memory
+        self.size = size
+        self.memoryTypeIndex = memoryTypeIndex
+        self.ranges = RangeAllocator(size, granularity)
+        self.mapped = mapped
+
+
+class Allocation(object):
+
+    def __init__(self, block, offset, size):
+        self.block = block
+        self.offset = offset
+        self.size = size
+
+    @property
+    def memory(self):
+        return self.block.memory
+
+    @property
+    def mapped(self):
+        """Writable view of the allocation, None if it is not host visible."""
+        if self.block.mapped is None:
+            return None
+        return memoryview(self.block.mapped)[self.offset:self.offset + self.size]
+
+
+class MemoryStats(object):
+
+    def __init__(self):
+        self.blockCount = 0
+        self.allocationCount = 0
+        self.bytesAllocated = 0
+        self.bytesUsed = 0
+        self.fragmentation = 0.0
+
+    def __str__(self):
+        return 'blocks: {}, allocations: {}, used: {:.1f}/{:.1f} MB, fragmentation: {:.2f}'.format(
+            self.blockCount, self.allocationCount,
+            self.bytesUsed / 1048576.0, self.bytesAllocated / 1048576.0, self.fragmentation)
+
+
+class DeviceMemoryAllocator(object):
+    """Block based sub-allocator keyed by memory type.
+
+    Parameters
+    ----------
+    device : VkDevice
+    physicalDevice : VkPhysicalDevice
+    blockSize : int
+        Size of the ``VkDeviceMemory`` blocks, larger resources get a block
+        of their own.
+    """
+
+    def __init__(self, device, physicalDevice, blockSize=DEFAULT_BLOCK_SIZE):
+        self.__device = device
+        self.__blockSize = blockSize
+
+        self.__memProperties = vkGetPhysicalDeviceMemoryProperties(physicalDevice)
+        self.__granularity = vkGetPhysicalDeviceProperties(physicalDevice).limits.bufferImageGranularity
+
+        self.__blocks = {}
+
+    def findMemoryType(self, typeFilter, properties):
+        for i, prop in enumerate(self.__memProperties.memoryTypes):
+            if (typeFilter & (1 << i)) and ((prop.propertyFlags & properties) == properties):
+                return i
+
+        return -1
+
+    def __createBlock(self, memoryTypeIndex, size):
+        allocInfo = VkMemoryAllocateInfo(
+            allocationSize=size,
+            memoryTypeIndex=memoryTypeIndex
+        )
+        memory = vkAllocateMemory(self.__device, allocInfo, None)
+
+        mapped = None
+        flags = self.__memProperties.memoryTypes[memoryTypeIndex].propertyFlags
+        if flags & VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT:
+            mapped = vkMapMemory(self.__device, memory, 0, size, 0)
+
+        block = MemoryBlock(memory, size, memoryTypeIndex, self.__granularity, mapped)
+        self.__blocks.setdefault(memoryTypeIndex, []).append(block)
+        return block
+
+    def __destroyBlock(self, block):
+        if block.mapped is not None:
+            vkUnmapMemory(self.__device, block.memory)
+        vkFreeMemory(self.__device, block.memory, None)
+        self.__blocks[block.memoryTypeIndex].remove(block)
+
+    def allocate(self, memRequirements, properties, linear=True):
+        """Place a resource with the given ``VkMemoryRequirements``.
+
+        ``linear`` is True for buffers and linear images, False for optimal
+        tiling images, see ``bufferImageGranularity``.
+        """
+        memoryTypeIndex = self.findMemoryType(memRequirements.memoryTypeBits, properties)
+        if memoryTypeIndex < 0:
+            raise Exception('failed to find suitable memory type!')
+
+        size = memRequirements.size
+        alignment = memRequirements.alignment
+
+        for block in self.__blocks.get(memoryTypeIndex, []):
+            offset = block.ranges.allocate(size, alignment, linear)
+            if offset is not None:
+                return Allocation(block, offset, size)
+
+        block = self.__createBlock(memoryTypeIndex, max(self.__blockSize, size))
+        offset = block.ranges.allocate(size, alignment, linear)
+        return Allocation(block, offset, size)
+
+    def allocateBuffer(self, buffer, properties):
+        memRequirements = vkGetBufferMemoryRequirements(self.__device, buffer)
+        allocation = self.allocate(memRequirements, properties, True)
+        vkBindBufferMemory(self.__device, buffer, allocation.memory, allocation.offset)
+        return allocation
+
+    def allocateImage(self, image, properties, linear=False):
+        memRequirements = vkGetImageMemoryRequirements(self.__device, image)
+        allocation = self.allocate(memRequirements, properties, linear)
+        vkBindImageMemory(self.__device, image, allocation.memory, allocation.offset)
+        return allocation
+
+    def free(self, allocation):
+        block = allocation.block
+        block.ranges.free(allocation.offset)
+
+        # keep one block per memory type around to avoid allocation churn
+        if len(block.ranges) == 0 and len(self.__blocks[block.memoryTypeIndex]) > 1:
+            self.__destroyBlock(block)
+
+    def defragment(self, allocations):
+        """Compact blocks and release the ones left empty.
+
+        Vulkan cannot rebind the memory of an existing resource, so only the
+        bookkeeping moves here: the returned ``(allocation, oldOffset)``
+        pairs tell the caller which resources have to be recreated at
+        ``allocation.offset`` and have their contents copied over.
+
+        Parameters
+        ----------
+        allocations : list
+            Every live ``Allocation``, their offsets are updated in place.
+        """
+        moved = []
+        byBlock = {}
+        for allocation in allocations:
+            byBlock.setdefault(id(allocation.block), {})[allocation.offset] = allocation
+
+        for blocks in self.__blocks.values():
+            for block in blocks:
+                owners = byBlock.get(id(block), {})
+                for oldOffset, newOffset, size in block.ranges.defragment():
+                    allocation = owners.get(oldOffset)
+                    if allocation is not None:
+                        allocation.offset = newOffset
+                        moved.append((allocation, oldOffset))
+
+        for blocks in self.__blocks.values():
+            empty = [b for b in blocks if len(b.ranges) == 0]
+            # keep one block per memory type, as free() does
+            if len(empty) == len(blocks):
+                empty = empty[1:]
+            for block in empty:
+                self.__destroyBlock(block)
+
+        return moved
+
+    def stats(self):
+        stats = MemoryStats()
+        free = 0
+        scattered = 0.0
+        for blocks in self.__blocks.values():
+            for block in blocks:
+                stats.blockCount += 1
+                stats.allocationCount += len(block.ranges)
+                stats.bytesAllocated += block.size
+                stats.bytesUsed += block.ranges.usedBytes
+                # allocations never span blocks, so fragmentation is only
+                # meaningful within one, weighted by the block's free bytes
+                free += block.ranges.freeBytes
+                scattered += block.ranges.fragmentation * block.ranges.freeBytes
+
+        if free:
+            stats.fragmentation = scattered / free
+        return stats
+
+    def destroy(self):
+        for blocks in list(self.__blocks.values()):
+            for block in list(blocks):
+                self.__destroyBlock(block)
+        self.__blocks = {}
+
+
+class UniformRingBuffer(object):
+    """Host visible uniform buffer split into equally sized slots.
+
+    The buffer is mapped once for its whole lifetime. Every slot starts on a
+    ``minUniformBufferOffsetAlignment`` boundary so it can be selected with a
+    dynamic offset, and ``view`` gives a NumPy array over the mapped slot to
+    write into directly.
+
+    Parameters
+    ----------
+    device : VkDevice
+    physicalDevice : VkPhysicalDevice
+    allocator : DeviceMemoryAllocator
+    slotSize : int
+        Bytes used per slot.
+    slotCount : int
+        Number of slots, one per frame that may be in use at the same time.
+    usage : VkBufferUsageFlags
+        Per frame vertex data like instance transforms can live in a ring
+        too, slots are then bound with a vertex buffer offset.
+    """
+
+    def __init__(self, device, physicalDevice, allocator, slotSize, slotCount, usage=VK_BUFFER_USAGE_UNIFORM_BUFFER_BIT):
+        self.__device = device
+        self.__allocator = allocator
+
+        limits = vkGetPhysicalDeviceProperties(physicalDevice).limits
+        self.slotSize = slotSize
+        self.slotCount = slotCount
+        self.stride = alignUp(slotSize, limits.minUniformBufferOffsetAlignment)
+
+        bufferInfo = VkBufferCreateInfo(
+            size=self.stride * slotCount,
+            usage=usage,
+            sharingMode=VK_SHARING_MODE_EXCLUSIVE
+        )
+        self.buffer = vkCreateBuffer(device, bufferInfo, None)
+        self.memory = allocator.allocateBuffer(self.buffer,
+                                               VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
+
+        self.__data = np.frombuffer(self.memory.mapped, np.uint8)
+
+    def offset(self, slot):
+        return slot * self.stride
+
+    def view(self, slot, dtype=np.float32, shape=None):
+        offset = self.offset(slot)
+        data = self.__data[offset:offset + self.slotSize].view(dtype)
+        return data if shape is None else data.reshape(shape)
+
+    def destroy(self):
+        self.__data = None
+        vkDestroyBuffer(self.__device, self.buffer, None)
+        self.__allocator.free(self.memory)
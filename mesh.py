@@ -0,0 +1,587 @@
+# -*- coding: UTF-8 -*-
+"""
+Mesh helpers shared by the model loading examples.
+
+Notes
+-----
+
+Vertices are laid out like ``Vertex`` in the examples: position (3 floats),
+color (3 floats, always white) and texture coordinate (2 floats), so a mesh is
+an ``(N, 8)`` float32 array plus a flat uint32 index array.
+
+``ObjReader`` parses OBJ files chunk by chunk straight into NumPy arrays, so
+memory stays close to the size of the output instead of holding a Python
+float object per coordinate like ``tinyobjloader.LoadObj`` does. Chunks can
+be parsed in a process pool, the index offsets of every chunk are applied
+when they are merged back in file order.
+"""
+
+import os
+import re
+import struct
+import hashlib
+import warnings
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+
+VERTEX_COMPONENTS = 8
+
+OBJ_CHUNK_SIZE = 4 * 1024 * 1024
+# below this size starting worker processes costs more than it saves
+OBJ_PARALLEL_SIZE = 64 * 1024 * 1024
+
+
+def fromTinyObj(model):
+    """Convert a ``tinyobjloader.LoadObj`` result to NumPy arrays.
+
+    Parameters
+    ----------
+    model : dict
+        Result of ``tol.LoadObj(path)``.
+
+    Returns
+    -------
+    positions : array
+        ``(V, 3)`` float64 vertex positions.
+    texcoords : array
+        ``(T, 2)`` float64 texture coordinates.
+    positionIndices : array
+        Position index of every face corner.
+    texcoordIndices : array
+        Texture coordinate index of every face corner.
+    """
+    attrib = model['attribs']
+    positions = np.array(attrib['vertices'], np.float64).reshape(-1, 3)
+    texcoords = np.array(attrib['texcoords'], np.float64).reshape(-1, 2)
+
+    shapes = model['shapes']
+    # every corner is stored as (vertex_index, normal_index, texcoord_index)
+    corners = [np.array(shapes[shape]['indices'], np.int64).reshape(-1, 3) for shape in shapes]
+    corners = np.concatenate(corners) if corners else np.zeros((0, 3), np.int64)
+
+    return positions, texcoords, corners[:, 0], corners[:, 2]
+
+
+class GrowableArray(object):
+    """Append only NumPy array, the capacity doubles when it is full.
+
+    Parameters
+    ----------
+    dtype : dtype
+    columns : int
+        Row width, 0 for a 1D array.
+    """
+
+    def __init__(self, dtype, columns=0, capacity=1024):
+        self.__shape = (columns,) if columns else ()
+        self.__data = np.empty((capacity,) + self.__shape, dtype)
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def extend(self, values):
+        values = np.asarray(values).reshape((-1,) + self.__shape)
+        end = self.__size + len(values)
+        if end > len(self.__data):
+            data = np.empty((max(end, 2 * len(self.__data)),) + self.__shape, self.__data.dtype)
+            data[:self.__size] = self.__data[:self.__size]
+            self.__data = data
+        self.__data[self.__size:end] = values
+        self.__size = end
+
+    def toArray(self):
+        """The filled part, trimmed to its size."""
+        return self.__data[:self.__size].copy()
+
+
+class ObjChunk(object):
+    """Records parsed from one piece of an OBJ file.
+
+    Index arrays hold one entry per triangle corner, 0 based, -1 where the
+    face has no such attribute. Relative (negative) OBJ indices are resolved
+    against the records of this chunk only; ``offset`` adds the number of
+    records that came before the chunk.
+    """
+
+    def __init__(self, positions, texcoords, normals, indices, relative):
+        self.positions = positions
+        self.texcoords = texcoords
+        self.normals = normals
+        self.positionIndices, self.texcoordIndices, self.normalIndices = indices
+        self.__relative = relative
+
+    def offset(self, positionBase, texcoordBase, normalBase):
+        for indices, relative, base in zip((self.positionIndices, self.texcoordIndices, self.normalIndices),
+                                           self.__relative, (positionBase, texcoordBase, normalBase)):
+            if relative is not None:
+                indices[relative] += base
+        self.__relative = (None, None, None)
+
+
+# record kinds and the keyword every line of that kind starts with
+OBJ_POSITION, OBJ_TEXCOORD, OBJ_NORMAL, OBJ_FACE = range(4)
+_OBJ_KEYWORDS = (b'v', b'vt', b'vn', b'f')
+
+
+def _stripIndent(data):
+    # leading blanks are valid OBJ, drop them so every line starts with its keyword
+    return re.sub(rb'(?m)^[ \t]+', b'', data)
+
+
+def _stripComments(text):
+    # a record may end in a comment, f 1/1 2/2 3/3 # tri
+    return re.sub(rb'#[^\n]*', b'', text) if b'#' in text else text
+
+
+def _lineKinds(buf, starts):
+    # kind of every line from its first two bytes, -1 for records we skip
+    padded = np.concatenate([buf, np.zeros(2, np.uint8)])
+    first = padded[starts]
+    second = padded[starts + 1]
+    blank = (second == ord(' ')) | (second == ord('\t'))
+
+    kinds = np.full(len(starts), -1, np.int8)
+    kinds[(first == ord('v')) & blank] = OBJ_POSITION
+    kinds[(first == ord('v')) & (second == ord('t'))] = OBJ_TEXCOORD
+    kinds[(first == ord('v')) & (second == ord('n'))] = OBJ_NORMAL
+    kinds[(first == ord('f')) & blank] = OBJ_FACE
+    return kinds
+
+
+def _recordText(data, starts, kinds, kind):
+    # every line of one kind without its keyword, one slice per run of lines
+    change = np.flatnonzero(np.diff(kinds)) + 1
+    runStarts = np.concatenate([[0], change])
+    runEnds = np.concatenate([change, [len(kinds)]])
+    runs = [data[starts[a]:starts[b] - 1] for a, b in zip(runStarts, runEnds) if kinds[a] == kind]
+
+    text = b'\n' + b'\n'.join(runs)
+    return _stripComments(text.replace(b'\n' + _OBJ_KEYWORDS[kind], b'\n'))
+
+
+def _fromText(text, dtype):
+    # whitespace separated numbers, None if anything else is in there
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            return np.fromstring(text, dtype, sep=' ')
+    except (ValueError, DeprecationWarning):
+        return None
+
+
+def _parseVectors(text, count, columns):
+    values = _fromText(text, np.float64) if count else np.zeros(0)
+    if values is not None and len(values) == count * columns:
+        return values.reshape(-1, columns)
+
+    # extra components (v x y z w, vt u v w, vertex colors), keep the first ones
+    lines = [line for line in text.split(b'\n') if line.strip()]
+    values = np.zeros((count, columns), np.float64)
+    for i, line in enumerate(lines):
+        fields = line.split()[:columns]
+        values[i, :len(fields)] = [float(f) for f in fields]
+    return values
+
+
+def _parseFaces(text, count):
+    """Raw corner indices of face lines, triangulated as a fan.
+
+    Returns an ``(C, 3)`` int64 array of 1 based or negative OBJ indices,
+    0 where a corner has no such attribute, and the face line of every corner.
+    """
+    if not count:
+        return np.zeros((0, 3), np.int64), np.zeros(0, np.int64)
+
+    # fast path, every face a triangle in the same v, v/t, v/t/n or v//n form
+    first = text[1:text.find(b'\n', 1) if text.find(b'\n', 1) > 0 else len(text)].split()[0]
+    layout = {0: [0], 1: [0, 1]}.get(first.count(b'/'), [0, 2] if b'//' in first else [0, 1, 2])
+    values = _fromText(text.replace(b'/', b' '), np.int64)
+    if values is not None and len(values) == count * 3 * len(layout):
+        corners = np.zeros((count * 3, 3), np.int64)
+        corners[:, layout] = values.reshape(-1, len(layout))
+        return corners, np.repeat(np.arange(count), 3)
+
+    # polygons or mixed forms
+    corners = []
+    cornerLines = []
+    lines = [line for line in text.split(b'\n') if line.strip()]
+    for i, line in enumerate(lines):
+        face = []
+        for token in line.split():
+            fields = token.split(b'/')
+            face.append([int(f) if f else 0 for f in fields] + [0] * (3 - len(fields)))
+        for k in range(1, len(face) - 1):
+            corners.extend((face[0], face[k], face[k + 1]))
+            cornerLines.extend((i, i, i))
+
+    return np.array(corners, np.int64).reshape(-1, 3), np.array(cornerLines, np.int64)
+
+
+def parseObjChunk(data):
+    """Parse complete lines of an OBJ file.
+
+    Only ``v``, ``vt``, ``vn`` and ``f`` records are read, everything else
+    (groups, materials, comments) is skipped. Lines are classified with
+    NumPy and each kind is parsed as one block of text, Python only loops
+    over the lines of a block when it holds polygons or extra components.
+
+    Parameters
+    ----------
+    data : bytes
+        Whole lines, the last one may lack its line break.
+
+    Returns
+    -------
+    chunk : ObjChunk
+    """
+    buf = np.frombuffer(data, np.uint8)
+    starts = np.concatenate([[0], np.flatnonzero(buf == ord('\n')) + 1, [len(data) + 1]])
+    first = np.concatenate([buf, [0]])[starts[:-1]]
+    if ((first == ord(' ')) | (first == ord('\t'))).any():
+        data = _stripIndent(data)
+        buf = np.frombuffer(data, np.uint8)
+        starts = np.concatenate([[0], np.flatnonzero(buf == ord('\n')) + 1, [len(data) + 1]])
+    kinds = _lineKinds(buf, starts[:-1])
+    counts = [int(np.count_nonzero(kinds == kind)) for kind in range(4)]
+
+    positions = _parseVectors(_recordText(data, starts, kinds, OBJ_POSITION), counts[OBJ_POSITION], 3)
+    texcoords = _parseVectors(_recordText(data, starts, kinds, OBJ_TEXCOORD), counts[OBJ_TEXCOORD], 2)
+    normals = _parseVectors(_recordText(data, starts, kinds, OBJ_NORMAL), counts[OBJ_NORMAL], 3)
+    corners, cornerLines = _parseFaces(_recordText(data, starts, kinds, OBJ_FACE), counts[OBJ_FACE])
+
+    # records of each kind defined before every face line, for relative indices
+    faceLines = np.flatnonzero(kinds == OBJ_FACE)[cornerLines]
+    indices = []
+    relative = []
+    for kind in (OBJ_POSITION, OBJ_TEXCOORD, OBJ_NORMAL):
+        before = np.cumsum(kinds == kind)[faceLines]
+        raw = corners[:, kind]
+        resolved = np.where(raw > 0, raw - 1, before + raw)
+        resolved[raw == 0] = -1
+        indices.append(resolved)
+        relative.append(raw < 0 if (raw < 0).any() else None)
+
+    return ObjChunk(positions, texcoords, normals, indices, relative)
+
+
+def parseObjRange(path, start, end):
+    """Parse the lines in ``[start, end)`` of a file, see ``parseObjChunk``."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return parseObjChunk(f.read(end - start))
+
+
+class ObjReader(object):
+    """Streaming Wavefront OBJ reader.
+
+    Parameters
+    ----------
+    path : str
+        OBJ file.
+    chunkSize : int
+        Bytes read and parsed at a time, memory used by the parser besides
+        the output is bounded by a few times this.
+    progress : callable | None
+        Called as ``progress(bytesRead, totalBytes)`` after every chunk.
+    """
+
+    def __init__(self, path, chunkSize=OBJ_CHUNK_SIZE, progress=None):
+        self.path = path
+        self.chunkSize = chunkSize
+        self.progress = progress
+
+    def __lines(self):
+        # chunks of whole lines
+        totalBytes = os.path.getsize(self.path)
+        bytesRead = 0
+        rest = b''
+        with open(self.path, 'rb') as f:
+            for block in iter(lambda: f.read(self.chunkSize), b''):
+                bytesRead += len(block)
+                end = block.rfind(b'\n')
+                if end < 0:
+                    rest += block
+                    continue
+                yield rest + block[:end], bytesRead, totalBytes
+                rest = block[end + 1:]
+        if rest:
+            yield rest, bytesRead, totalBytes
+
+    def __ranges(self):
+        # byte ranges of about chunkSize, each one starting at a line start
+        totalBytes = os.path.getsize(self.path)
+        ranges = []
+        start = 0
+        with open(self.path, 'rb') as f:
+            while start < totalBytes:
+                f.seek(min(start + self.chunkSize, totalBytes))
+                f.readline()
+                end = min(f.tell(), totalBytes)
+                ranges.append((start, end))
+                start = end
+        return ranges
+
+    def __parsed(self, workers):
+        totalBytes = os.path.getsize(self.path)
+        if workers is None and (totalBytes < OBJ_PARALLEL_SIZE or os.cpu_count() == 1):
+            workers = 1
+
+        if workers == 1:
+            for data, bytesRead, totalBytes in self.__lines():
+                yield parseObjChunk(data), bytesRead, totalBytes
+            return
+
+        ranges = self.__ranges()
+        if len(ranges) < 2:
+            for start, end in ranges:
+                yield parseObjRange(self.path, start, end), end, totalBytes
+            return
+
+        # spawn, forking a process that runs Qt or other threads is not safe
+        context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as executor:
+            futures = [executor.submit(parseObjRange, self.path, start, end) for start, end in ranges]
+            for future, (start, end) in zip(futures, ranges):
+                yield future.result(), end, totalBytes
+
+    def chunks(self, workers=1):
+        """Yield an ``ObjChunk`` per piece of the file, indices are global.
+
+        Parameters
+        ----------
+        workers : int | None
+            Processes parsing in parallel. None uses one per core for files
+            of at least ``OBJ_PARALLEL_SIZE``. Chunks are still yielded in
+            file order.
+        """
+        counts = [0, 0, 0]
+        for chunk, bytesRead, totalBytes in self.__parsed(workers):
+            chunk.offset(*counts)
+            counts[0] += len(chunk.positions)
+            counts[1] += len(chunk.texcoords)
+            counts[2] += len(chunk.normals)
+
+            yield chunk
+
+            if self.progress:
+                self.progress(bytesRead, totalBytes)
+
+    def read(self, workers=1):
+        """Parse the whole file into one ``ObjChunk``, see ``chunks``."""
+        positions = GrowableArray(np.float64, 3)
+        texcoords = GrowableArray(np.float64, 2)
+        normals = GrowableArray(np.float64, 3)
+        indices = [GrowableArray(np.int64) for i in range(3)]
+
+        for chunk in self.chunks(workers):
+            positions.extend(chunk.positions)
+            texcoords.extend(chunk.texcoords)
+            normals.extend(chunk.normals)
+            for array, values in zip(indices, (chunk.positionIndices, chunk.texcoordIndices, chunk.normalIndices)):
+                array.extend(values)
+            del chunk
+
+        obj = ObjChunk(positions.toArray(), texcoords.toArray(), normals.toArray(),
+                       [array.toArray() for array in indices], (None, None, None))
+
+        # a bad index would otherwise read past the vertex arrays later on
+        for name, values, count, required in (('position', obj.positionIndices, len(obj.positions), True),
+                                              ('texture coordinate', obj.texcoordIndices, len(obj.texcoords), False),
+                                              ('normal', obj.normalIndices, len(obj.normals), False)):
+            if len(values) == 0:
+                continue
+            lowest = 0 if required else -1
+            if values.min() < lowest or values.max() >= count:
+                raise ValueError('{}: face references a {} outside the {} defined'.format(self.path, name, count))
+        return obj
+
+
+def loadObj(path, progress=None, workers=1):
+    """Read an OBJ file, returns the same arrays as ``fromTinyObj``."""
+    obj = ObjReader(path, progress=progress).read(workers)
+    return obj.positions, obj.texcoords, obj.positionIndices, obj.texcoordIndices
+
+
+def deduplicateVertices(positions, texcoords, positionIndices, texcoordIndices):
+    """Build an indexed vertex buffer from per-corner OBJ indices.
+
+    This is the vectorized equivalent of the ``uniqueVertices`` dict loop in
+    ``__loadModel``: corners whose vertex data compare equal share one vertex,
+    and vertices are numbered in order of first appearance, so the output is
+    identical to the loop's.
+
+    Parameters
+    ----------
+    positions : array
+        ``(V, 3)`` vertex positions.
+    texcoords : array
+        ``(T, 2)`` texture coordinates, V axis pointing up as in OBJ files.
+    positionIndices : array
+        Position index of every face corner.
+    texcoordIndices : array
+        Texture coordinate index of every face corner.
+
+    Returns
+    -------
+    vertices : array
+        ``(N, 8)`` float32 vertex data.
+    indices : array
+        uint32 index of every face corner into ``vertices``.
+    """
+    positions = np.asarray(positions, np.float64).reshape(-1, 3)
+    texcoords = np.asarray(texcoords, np.float64).reshape(-1, 2)
+    vid = np.asarray(positionIndices, np.int64).ravel()
+    tid = np.asarray(texcoordIndices, np.int64).ravel()
+
+    if len(vid) == 0:
+        return np.zeros((0, VERTEX_COMPONENTS), np.float32), np.zeros(0, np.uint32)
+
+    # corners referencing the same (position, texcoord) pair are equal for sure,
+    # collapse those on a cheap integer key first
+    key = vid * max(len(texcoords), 1) + tid
+    _, keyCorner, cornerKey = np.unique(key, return_index=True, return_inverse=True)
+
+    # then compare the actual values, different indices may hold equal data.
+    # values stay float64 like the python floats the loop hashes, and adding
+    # 0.0 folds -0.0 into 0.0 so the byte comparison matches float equality
+    rows = np.empty((len(keyCorner), 5), np.float64)
+    rows[:, :3] = positions[vid[keyCorner]]
+    rows[:, 3] = texcoords[tid[keyCorner], 0]
+    rows[:, 4] = 1.0 - texcoords[tid[keyCorner], 1]
+    rows += 0.0
+
+    packed = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+    _, rowKey, keyRow = np.unique(packed, return_index=True, return_inverse=True)
+    keyRow = keyRow.ravel()
+
+    # number unique vertices by the first corner that uses them
+    firstCorner = np.full(len(rowKey), len(vid), np.int64)
+    np.minimum.at(firstCorner, keyRow, keyCorner)
+    order = np.argsort(firstCorner, kind='stable')
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+
+    unique = rows[rowKey[order]]
+    vertices = np.empty((len(unique), VERTEX_COMPONENTS), np.float32)
+    vertices[:, 0:3] = unique[:, 0:3]
+    vertices[:, 3:6] = 1.0
+    vertices[:, 6:8] = unique[:, 3:5]
+
+    indices = remap[keyRow[cornerKey.ravel()]].astype(np.uint32)
+
+    return vertices, indices
+
+
+# baked mesh cache
+#
+# header:  magic, version, section count, layout tag, sha1 of the source file
+# table:   one entry per section, name, numpy dtype, rows, columns, offset
+# data:    raw little endian arrays, each starting on a CACHE_ALIGNMENT boundary
+
+CACHE_MAGIC = b'VKMESH\x00\x00'
+CACHE_VERSION = 1
+CACHE_ALIGNMENT = 64
+CACHE_HEADER = struct.Struct('<8sII32s20s')
+CACHE_SECTION = struct.Struct('<16s8sQQQ')
+
+VERTEX_LAYOUT = 'pos3f color3f uv2f'
+
+
+def fileHash(path, blockSize=1 << 20):
+    """SHA-1 digest of a file's content."""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            sha.update(block)
+    return sha.digest()
+
+
+def saveMeshCache(path, sourceHash, layout, **sections):
+    """Write arrays to a baked mesh cache file.
+
+    Parameters
+    ----------
+    path : str
+        Cache file to write, replaced atomically.
+    sourceHash : bytes
+        ``fileHash`` of the file the arrays were built from.
+    layout : str
+        Tag describing how the arrays are laid out, e.g. ``VERTEX_LAYOUT``.
+    sections : array
+        Named 1D or 2D arrays, usually ``vertices`` and ``indices``.
+    """
+    arrays = [(name, np.ascontiguousarray(a)) for name, a in sections.items()]
+
+    offset = CACHE_HEADER.size + CACHE_SECTION.size * len(arrays)
+    table = []
+    for name, a in arrays:
+        offset = (offset + CACHE_ALIGNMENT - 1) // CACHE_ALIGNMENT * CACHE_ALIGNMENT
+        rows = a.shape[0] if a.ndim else 1
+        columns = a.shape[1] if a.ndim > 1 else 0
+        table.append(CACHE_SECTION.pack(name.encode(), a.dtype.newbyteorder('<').str.encode(),
+                                        rows, columns, offset))
+        offset += a.nbytes
+
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(arrays), layout.encode(), sourceHash))
+        for entry in table:
+            f.write(entry)
+        for entry, (name, a) in zip(table, arrays):
+            f.write(b'\x00' * (CACHE_SECTION.unpack(entry)[4] - f.tell()))
+            f.write(a.astype(a.dtype.newbyteorder('<'), copy=False).tobytes())
+    os.replace(tmpPath, path)
+
+
+def loadMeshCache(path, sourceHash=None, layout=None):
+    """Map a baked mesh cache file.
+
+    The returned arrays are read only views into one ``np.memmap`` of the
+    file, nothing is copied until the data is uploaded.
+
+    Parameters
+    ----------
+    path : str
+        Cache file written by ``saveMeshCache``.
+    sourceHash : bytes | None
+        Expected source hash, a mismatch means the cache is stale.
+    layout : str | None
+        Expected layout tag.
+
+    Returns
+    -------
+    sections : dict | None
+        Arrays by section name, or None if the file is missing or stale.
+    """
+    # np.memmap can not map an empty file, a truncated header is stale too
+    if not os.path.isfile(path) or os.path.getsize(path) < CACHE_HEADER.size:
+        return None
+
+    data = np.memmap(path, np.uint8, 'r')
+
+    magic, version, count, cacheLayout, cacheHash = CACHE_HEADER.unpack_from(data, 0)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    if sourceHash is not None and cacheHash != sourceHash:
+        return None
+    if layout is not None and cacheLayout.rstrip(b'\x00') != layout.encode():
+        return None
+
+    if CACHE_HEADER.size + count * CACHE_SECTION.size > len(data):
+        return None
+
+    sections = {}
+    for i in range(count):
+        name, dtype, rows, columns, offset = CACHE_SECTION.unpack_from(data, CACHE_HEADER.size + i * CACHE_SECTION.size)
+        dtype = np.dtype(dtype.rstrip(b'\x00').decode())
+        # a truncated file, the section would run past its end
+        if offset + rows * max(columns, 1) * dtype.itemsize > len(data):
+            return None
+        shape = (rows, columns) if columns else (rows,)
+        sections[name.rstrip(b'\x00').decode()] = np.frombuffer(data, dtype, rows * max(columns, 1), offset).reshape(shape)
+
+    return sections
@@ -0,0 +1,200 @@
+# -*- coding: UTF-8 -*-
+"""
+Meshlets, small clusters of triangles culled as a whole.
+
+Notes
+-----
+
+``buildMeshlets`` walks the triangles in index buffer order and starts a new
+meshlet when the current one would exceed ``MAX_VERTICES`` unique vertices
+or ``MAX_TRIANGLES`` triangles, the limits mesh shading pipelines use. The
+triangles are not moved, so every meshlet is a contiguous range of the
+index buffer and can be drawn with ``vkCmdDrawIndexed``. Meshlets are
+tighter after ``meshopt.optimizeVertexCache``, which already keeps
+neighbouring triangles together.
+
+Every meshlet gets a bounding sphere for frustum culling and a normal cone
+for backface culling, computed like meshoptimizer's
+``meshopt_computeMeshletBounds``: the cone's axis is the average triangle
+normal, its apex sits behind all triangle planes and the whole meshlet
+faces away from any eye inside the cone given by ``coneCutoff``.
+
+``cullMeshlets`` tests all meshlets at once, ``drawRanges`` merges the
+survivors that are neighbours in the index buffer back into single draws.
+"""
+
+import numpy as np
+
+from scene import frustumPlanes
+
+
+MAX_VERTICES = 64
+MAX_TRIANGLES = 124
+
+# cone cutoff of meshlets whose normals spread too far to ever be backface culled
+CONE_DISABLED = 2.0
+
+
+class Meshlets(object):
+    """Meshlet ranges and bounds as arrays, one row per meshlet.
+
+    Attributes
+    ----------
+    firstIndex, indexCount, vertexOffset : array
+        ``vkCmdDrawIndexed`` arguments of every meshlet.
+    center : array
+        ``(M, 3)`` bounding sphere centers.
+    radius : array
+        Bounding sphere radii.
+    coneApex, coneAxis : array
+        ``(M, 3)`` normal cone apex and unit axis.
+    coneCutoff : array
+        Sine of the cone's half angle, ``CONE_DISABLED`` for none.
+    """
+
+    FIELDS = ('firstIndex', 'indexCount', 'vertexOffset', 'center', 'radius', 'coneApex', 'coneAxis', 'coneCutoff')
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields[name])
+
+    def __len__(self):
+        return len(self.firstIndex)
+
+    @classmethod
+    def concatenate(cls, meshlets):
+        meshlets = list(meshlets)
+        if not meshlets:
+            return buildMeshlets(np.zeros((0, 3)), np.zeros(0, np.uint32))
+        return cls(**{name: np.concatenate([getattr(m, name) for m in meshlets]) for name in cls.FIELDS})
+
+    @property
+    def triangleCount(self):
+        return int(self.indexCount.sum()) // 3
+
+
+def _partition(indices, maxVertices, maxTriangles):
+    # first triangle of every meshlet, greedy in index order
+    corners = indices.tolist()
+    starts = [0]
+    used = set()
+    triangles = 0
+    for t in range(0, len(corners), 3):
+        a, b, c = corners[t:t + 3]
+        added = (a not in used) + (b not in used) + (c not in used)
+        if triangles == maxTriangles or len(used) + added > maxVertices:
+            starts.append(t // 3)
+            used = set()
+            triangles = 0
+        used.update((a, b, c))
+        triangles += 1
+    return np.asarray(starts, np.int64)
+
+
+def buildMeshlets(positions, indices, maxVertices=MAX_VERTICES, maxTriangles=MAX_TRIANGLES,
+                  firstIndex=0, vertexOffset=0):
+    """Split a triangle list into meshlets.
+
+    Parameters
+    ----------
+    positions : array
+        ``(V, 3)`` or mesh vertices, the first three columns are used.
+    indices : array
+        Triangle list indices into ``positions``.
+    firstIndex, vertexOffset : int
+        Where ``indices`` start in the index buffer and the base vertex they
+        are drawn with, added to the meshlets' draw arguments.
+
+    Returns
+    -------
+    meshlets : Meshlets
+    """
+    positions = np.asarray(positions, np.float64)[:, :3]
+    indices = np.asarray(indices, np.int64)
+    triangleCount = len(indices) // 3
+    if triangleCount == 0:
+        empty = np.zeros(0, np.int64)
+        return Meshlets(firstIndex=empty, indexCount=empty, vertexOffset=empty.copy(),
+                        center=np.zeros((0, 3)), radius=np.zeros(0), coneApex=np.zeros((0, 3)),
+                        coneAxis=np.zeros((0, 3)), coneCutoff=np.zeros(0))
+
+    starts = _partition(indices, maxVertices, maxTriangles)
+    counts = np.diff(np.append(starts, triangleCount))
+    meshletOf = np.repeat(np.arange(len(starts)), counts)
+
+    corners = positions[indices].reshape(-1, 3, 3)
+    lower = np.minimum.reduceat(corners.min(axis=1), starts)
+    upper = np.maximum.reduceat(corners.max(axis=1), starts)
+    center = (lower + upper) / 2.0
+    distance = np.sqrt(((corners - center[meshletOf][:, None]) ** 2).sum(axis=2)).max(axis=1)
+    radius = np.maximum.reduceat(distance, starts)
+
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    length = np.linalg.norm(normals, axis=1)
+    valid = length > 1e-30
+    normals = np.where(valid[:, None], normals / np.maximum(length, 1e-30)[:, None], 0.0)
+
+    axis = np.add.reduceat(normals, starts)
+    axisLength = np.linalg.norm(axis, axis=1)
+    axis = np.where(axisLength[:, None] > 1e-30, axis / np.maximum(axisLength, 1e-30)[:, None], 0.0)
+
+    # widest angle between the axis and a triangle normal
+    spread = np.where(valid, (normals * axis[meshletOf]).sum(axis=1), 1.0)
+    minDot = np.minimum.reduceat(spread, starts)
+
+    # move the apex back along the axis until it is behind every triangle plane
+    dn = (normals * axis[meshletOf]).sum(axis=1)
+    dc = ((center[meshletOf] - corners[:, 0]) * normals).sum(axis=1)
+    t = np.where(valid & (dn > 1e-30), dc / np.maximum(dn, 1e-30), 0.0)
+    maxT = np.maximum(np.maximum.reduceat(t, starts), 0.0)
+    apex = center - axis * maxT[:, None]
+
+    cutoff = np.where((minDot > 0.1) & (axisLength > 1e-30),
+                      np.sqrt(np.maximum(1.0 - minDot * minDot, 0.0)), CONE_DISABLED)
+
+    return Meshlets(firstIndex=firstIndex + 3 * starts, indexCount=3 * counts,
+                    vertexOffset=np.full(len(starts), vertexOffset, np.int64),
+                    center=center, radius=radius, coneApex=apex, coneAxis=axis, coneCutoff=cutoff)
+
+
+def cullMeshlets(meshlets, modelView, proj):
+    """Meshlets that may be visible, frustum and cone culled.
+
+    ``modelView`` and ``proj`` are row vector matrices like the ones
+    ``glm`` builds, meshlet bounds are in model space.
+
+    Returns
+    -------
+    visible : array
+        Boolean mask over the meshlets.
+    """
+    modelView = np.asarray(modelView, np.float64)
+    planes = frustumPlanes(np.dot(modelView, proj))
+    distance = np.dot(meshlets.center, planes[:, :3].T) + planes[:, 3]
+    visible = (distance >= -meshlets.radius[:, None]).all(axis=1)
+
+    # the eye in model space, row 3 of the inverse model view matrix
+    eye = np.linalg.inv(modelView)[3, :3]
+    direction = meshlets.coneApex - eye
+    direction /= np.maximum(np.linalg.norm(direction, axis=1), 1e-30)[:, None]
+    backfacing = (direction * meshlets.coneAxis).sum(axis=1) >= meshlets.coneCutoff
+    return visible & ~backfacing
+
+
+def drawRanges(meshlets, visible):
+    """Merge visible meshlets that follow each other in the index buffer.
+
+    Returns
+    -------
+    firstIndex, indexCount, vertexOffset : array
+        Arguments of one ``vkCmdDrawIndexed`` per merged range.
+    """
+    first = meshlets.firstIndex[visible]
+    count = meshlets.indexCount[visible]
+    offset = meshlets.vertexOffset[visible]
+    if len(first) == 0:
+        return first, count, offset
+
+    joined = (first[1:] == first[:-1] + count[:-1]) & (offset[1:] == offset[:-1])
+    starts = np.flatnonzero(np.concatenate([[True], ~joined]))
+    return first[starts], np.add.reduceat(count, starts), offset[starts]
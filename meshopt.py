@@ -0,0 +1,290 @@
+# -*- coding: UTF-8 -*-
+"""
+Index and vertex buffer optimization.
+
+Notes
+-----
+
+``optimizeVertexCache`` reorders triangles with Tipsify (Sander, Nehab and
+Barczak, "Fast Triangle Reordering for Vertex Locality and Reduced
+Overdraw", 2007) so consecutive triangles share vertices still in the GPU's
+post-transform cache. ``optimizeOverdraw`` then sorts the clusters Tipsify
+produced so outward facing ones come first, which lets early depth testing
+reject more fragments without hurting cache reuse, and
+``optimizeVertexFetch`` renumbers vertices in the order the index buffer
+first uses them.
+
+Tipsify visits every triangle once but is sequential, it runs in plain
+Python on lists, so the result is meant to be computed once and stored in
+the mesh cache.
+"""
+
+import numpy as np
+
+
+DEFAULT_CACHE_SIZE = 16
+
+# FIFO size used to report cache efficiency, about what current GPUs reuse
+SIMULATED_CACHE_SIZE = 32
+
+
+def _adjacency(indices, vertexCount):
+    # triangles using every vertex, CSR style
+    corners = np.asarray(indices, np.int64)
+    triangles = np.arange(len(corners)) // 3
+    order = np.argsort(corners, kind='stable')
+    offsets = np.zeros(vertexCount + 1, np.int64)
+    np.cumsum(np.bincount(corners, minlength=vertexCount), out=offsets[1:])
+    return offsets, triangles[order]
+
+
+def optimizeVertexCache(indices, vertexCount, cacheSize=DEFAULT_CACHE_SIZE):
+    """Reorder triangles for post-transform cache reuse with Tipsify.
+
+    Parameters
+    ----------
+    indices : array
+        Triangle list indices.
+    vertexCount : int
+        Number of vertices the indices refer to.
+    cacheSize : int
+        Cache size Tipsify plans for.
+
+    Returns
+    -------
+    indices : array
+        The same triangles in a new order, same dtype as the input.
+    clusters : array
+        Start of every cluster in triangles. A new cluster starts where
+        Tipsify had to jump to an unrelated part of the mesh.
+    """
+    indices = np.asarray(indices)
+    triangleCount = len(indices) // 3
+    offsets, adjacent = _adjacency(indices, vertexCount)
+
+    offsets = offsets.tolist()
+    adjacent = adjacent.tolist()
+    corners = indices.tolist()
+    live = np.diff(offsets).tolist()
+    cacheTime = [0] * vertexCount
+    emitted = [False] * triangleCount
+
+    deadEnd = []
+    order = []
+    clusters = [0]
+    time = cacheSize + 1
+    cursor = 0
+
+    fanning = 0 if triangleCount else -1
+    while fanning >= 0:
+        candidates = []
+        for t in adjacent[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            order.append(t)
+            for v in corners[3 * t:3 * t + 3]:
+                deadEnd.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time - cacheTime[v] > cacheSize:
+                    cacheTime[v] = time
+                    time += 1
+
+        # next fanning vertex, the one staying in the cache longest that
+        # still has triangles left and won't be evicted while fanning
+        fanning = -1
+        best = -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = 0
+                if time - cacheTime[v] + 2 * live[v] <= cacheSize:
+                    priority = time - cacheTime[v]
+                if priority > best:
+                    best = priority
+                    fanning = v
+
+        if fanning < 0:
+            # dead end, try recently used vertices first, then scan
+            while deadEnd:
+                v = deadEnd.pop()
+                if live[v] > 0:
+                    fanning = v
+                    break
+            else:
+                while cursor < vertexCount and live[cursor] == 0:
+                    cursor += 1
+                fanning = cursor if cursor < vertexCount else -1
+
+            if fanning >= 0 and len(order) > clusters[-1]:
+                clusters.append(len(order))
+
+    triangles = np.asarray(order, np.int64)
+    result = indices.reshape(-1, 3)[triangles].reshape(-1)
+    return result, np.asarray(clusters, np.int64)
+
+
+def optimizeOverdraw(indices, positions, clusters):
+    """Sort triangle clusters front to back from the outside of the mesh.
+
+    Clusters whose average normal points away from the mesh center are
+    likely to occlude the others from any view point, drawing them first
+    saves shading occluded fragments. Triangles inside a cluster keep their
+    cache friendly order.
+
+    Returns
+    -------
+    indices : array
+        Reordered indices.
+    """
+    indices = np.asarray(indices)
+    if len(clusters) < 2:
+        return indices
+
+    positions = np.asarray(positions, np.float64)[:, :3]
+    triangles = positions[indices.reshape(-1, 3)]
+    # area weighted normals and centroids
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    areas = np.linalg.norm(normals, axis=1)
+    centroids = triangles.mean(axis=1)
+
+    clusterNormals = np.add.reduceat(normals, clusters)
+    clusterAreas = np.add.reduceat(areas, clusters)
+    clusterCentroids = np.add.reduceat(centroids * areas[:, None], clusters) / np.maximum(clusterAreas, 1e-30)[:, None]
+    center = (centroids * areas[:, None]).sum(axis=0) / max(areas.sum(), 1e-30)
+
+    length = np.linalg.norm(clusterNormals, axis=1)
+    facing = ((clusterCentroids - center) * clusterNormals).sum(axis=1) / np.maximum(length, 1e-30)
+    clusterOrder = np.argsort(-facing, kind='stable')
+
+    ends = np.append(clusters[1:], len(indices) // 3)
+    triangleOrder = np.concatenate([np.arange(clusters[c], ends[c]) for c in clusterOrder])
+    return indices.reshape(-1, 3)[triangleOrder].reshape(-1)
+
+
+def optimizeVertexFetch(vertices, indices):
+    """Renumber vertices in the order the indices first use them.
+
+    Unused vertices are dropped.
+
+    Returns
+    -------
+    vertices : array
+        Reordered vertices.
+    indices : array
+        Indices into the reordered vertices, same dtype as the input.
+    """
+    indices = np.asarray(indices)
+    used, first = np.unique(indices, return_index=True)
+    order = used[np.argsort(first, kind='stable')]
+
+    remap = np.zeros(len(vertices), np.int64)
+    remap[order] = np.arange(len(order))
+    return np.asarray(vertices)[order], remap[indices].astype(indices.dtype)
+
+
+def vertexCacheStats(indices, vertexCount=None, cacheSize=SIMULATED_CACHE_SIZE):
+    """Simulate a FIFO post-transform cache.
+
+    Returns
+    -------
+    acmr : float
+        Average cache miss ratio, transformed vertices per triangle. 0.5 is
+        the ideal for large regular meshes, 3 means no reuse at all.
+    atvr : float
+        Average transform to vertex ratio, transformed vertices per unique
+        vertex. 1 is the ideal.
+    """
+    corners = np.asarray(indices).tolist()
+    if vertexCount is None:
+        vertexCount = (max(corners) + 1) if corners else 0
+
+    # a vertex is cached while fewer than cacheSize misses happened since it was loaded
+    loadedAt = [-cacheSize - 1] * vertexCount
+    misses = 0
+    for v in corners:
+        if misses - loadedAt[v] > cacheSize:
+            loadedAt[v] = misses
+            misses += 1
+
+    triangles = max(len(corners) // 3, 1)
+    unique = max(len(set(corners)), 1)
+    return misses / float(triangles), misses / float(unique)
+
+
+def optimizeMesh(vertices, indices, cacheSize=DEFAULT_CACHE_SIZE, overdraw=True):
+    """Cache, overdraw and fetch optimization in one go.
+
+    Returns
+    -------
+    vertices : array
+    indices : array
+    """
+    indices, clusters = optimizeVertexCache(indices, len(vertices), cacheSize)
+    if overdraw:
+        indices = optimizeOverdraw(indices, vertices, clusters)
+    return optimizeVertexFetch(vertices, indices)
+
+
+# vertices a 16 bit index can reach from the draw's vertexOffset
+INDEX16_RANGE = 65536
+
+
+class SubMesh(object):
+    """One ``vkCmdDrawIndexed`` worth of a mesh."""
+
+    def __init__(self, firstIndex, indexCount, vertexOffset):
+        self.firstIndex = firstIndex
+        self.indexCount = indexCount
+        self.vertexOffset = vertexOffset
+
+    def __repr__(self):
+        return 'SubMesh(firstIndex={}, indexCount={}, vertexOffset={})'.format(
+            self.firstIndex, self.indexCount, self.vertexOffset)
+
+
+def splitIndices16(indices, vertexRange=INDEX16_RANGE):
+    """Turn 32 bit indices into 16 bit ones drawn with base vertex offsets.
+
+    Triangles keep their order. A new sub mesh starts when the vertices of
+    the current one would no longer fit in ``vertexRange`` consecutive
+    vertices, this works well once vertices are numbered in order of first
+    use, see ``optimizeVertexFetch``.
+
+    Returns
+    -------
+    indices : array | None
+        uint16 indices relative to their sub mesh's ``vertexOffset``, None
+        if a single triangle spans more than ``vertexRange`` vertices.
+    subMeshes : list
+        ``SubMesh`` per draw.
+    """
+    indices = np.asarray(indices)
+    if len(indices) == 0:
+        return indices.astype(np.uint16), []
+
+    if int(indices.max()) < vertexRange:
+        return indices.astype(np.uint16), [SubMesh(0, len(indices), 0)]
+
+    triangles = indices.reshape(-1, 3).astype(np.int64)
+    low = triangles.min(axis=1)
+    high = triangles.max(axis=1)
+    if (high - low >= vertexRange).any():
+        return None, []
+
+    result = np.empty(len(indices), np.uint16)
+    subMeshes = []
+    start = 0
+    while start < len(triangles):
+        # first triangle that would make the running vertex span too wide
+        spanLow = np.minimum.accumulate(low[start:])
+        spanHigh = np.maximum.accumulate(high[start:])
+        over = np.flatnonzero(spanHigh - spanLow >= vertexRange)
+        end = start + (over[0] if len(over) else len(triangles) - start)
+
+        base = int(spanLow[end - start - 1])
+        result[3 * start:3 * end] = (triangles[start:end] - base).reshape(-1)
+        subMeshes.append(SubMesh(3 * start, 3 * (end - start), base))
+        start = end
+
+    return result, subMeshes
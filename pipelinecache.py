@@ -0,0 +1,163 @@
+# -*- coding: UTF-8 -*-
+"""
+VkPipelineCache persisted to disk.
+
+Notes
+-----
+
+The file holds a small header of our own followed by the blob returned by
+``vkGetPipelineCacheData``. The blob is only handed back to the driver if
+its header matches the vendor, device and pipeline cache UUID of the current
+physical device and the driver version matches too, otherwise the cache
+starts empty. The header also remembers how long pipeline creation took
+without a cache, which is what the saved time is measured against.
+"""
+
+import os
+import time
+import struct
+
+from vulkan import *
+
+
+FILE_MAGIC = b'VKPC'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<4sIId')
+
+# VkPipelineCacheHeaderVersionOne
+VK_HEADER = struct.Struct('<IIII16s')
+
+
+def _uuidBytes(uuid):
+    return bytes(bytearray(list(uuid)))
+
+
+class PipelineCache(object):
+    """Pipeline cache loaded from and saved to ``path``.
+
+    Parameters
+    ----------
+    device : VkDevice
+    physicalDevice : VkPhysicalDevice
+    path : str
+        Cache file, it does not need to exist.
+    """
+
+    def __init__(self, device, physicalDevice, path):
+        self.__device = device
+        self.__path = path
+        self.__properties = vkGetPhysicalDeviceProperties(physicalDevice)
+
+        # metrics
+        self.loadedBytes = 0
+        self.savedBytes = 0
+        self.createTimes = []
+        self.coldCreateTime = None
+
+        data = self.__load()
+        self.loadedBytes = len(data)
+
+        # the binding can not pass bytes as a void pointer, hand it a view
+        # of them that stays alive until the driver copied the data
+        initialData = ffi.from_buffer(data) if data else None
+        if data:
+            createInfo = VkPipelineCacheCreateInfo(
+                initialDataSize=len(data),
+                pInitialData=initialData
+            )
+        else:
+            createInfo = VkPipelineCacheCreateInfo(
+                initialDataSize=0,
+                pInitialData=None
+            )
+
+        self.cache = vkCreatePipelineCache(device, createInfo, None)
+        del initialData
+
+    def __load(self):
+        if not os.path.isfile(self.__path):
+            return b''
+
+        with open(self.__path, 'rb') as f:
+            content = f.read()
+
+        if len(content) < FILE_HEADER.size + VK_HEADER.size:
+            return b''
+
+        magic, version, driverVersion, coldCreateTime = FILE_HEADER.unpack_from(content, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            return b''
+
+        data = content[FILE_HEADER.size:]
+        headerSize, headerVersion, vendorID, deviceID, uuid = VK_HEADER.unpack_from(data, 0)
+
+        props = self.__properties
+        if (headerVersion != VK_PIPELINE_CACHE_HEADER_VERSION_ONE or
+                vendorID != props.vendorID or
+                deviceID != props.deviceID or
+                driverVersion != props.driverVersion or
+                uuid != _uuidBytes(props.pipelineCacheUUID)):
+            print('pipeline cache {} belongs to another device or driver, ignored'.format(self.__path))
+            return b''
+
+        self.coldCreateTime = coldCreateTime
+        return data
+
+    def createGraphicsPipeline(self, pipelineInfo):
+        startTime = time.perf_counter()
+        pipeline = vkCreateGraphicsPipelines(self.__device, self.cache, 1, pipelineInfo, None)
+        self.createTimes.append(time.perf_counter() - startTime)
+        return pipeline
+
+    @property
+    def createTime(self):
+        """Time the first pipeline of this run took to create."""
+        return self.createTimes[0] if self.createTimes else 0.0
+
+    @property
+    def savedTime(self):
+        """Creation time saved compared to the first run, which had no cache."""
+        if self.coldCreateTime is None:
+            return 0.0
+        return self.coldCreateTime - self.createTime
+
+    def data(self):
+        """The driver's cache blob as bytes."""
+        # the binding only declares vkGetPipelineCacheData, resolve it by hand
+        getData = ffi.cast('PFN_vkGetPipelineCacheData', lib.vkGetDeviceProcAddr(self.__device, b'vkGetPipelineCacheData'))
+        if getData == ffi.NULL:
+            raise ProcedureNotFoundError()
+
+        size = ffi.new('size_t*')
+        while True:
+            result = getData(self.__device, self.cache, size, ffi.NULL)
+            if result != VK_SUCCESS:
+                raise exception_codes[result]
+
+            # the cache may grow between the two calls, then try again
+            blob = ffi.new('char[]', size[0])
+            result = getData(self.__device, self.cache, size, blob)
+            if result == VK_SUCCESS:
+                return ffi.buffer(blob, size[0])[:]
+            if result != VK_INCOMPLETE:
+                raise exception_codes[result]
+
+    def save(self):
+        data = self.data()
+
+        coldCreateTime = self.createTime if self.coldCreateTime is None else self.coldCreateTime
+
+        tmpPath = self.__path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            f.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, self.__properties.driverVersion, coldCreateTime))
+            f.write(data)
+        os.replace(tmpPath, self.__path)
+
+        self.savedBytes = len(data)
+
+    def destroy(self):
+        vkDestroyPipelineCache(self.__device, self.cache, None)
+
+    def __str__(self):
+        return 'pipeline cache: loaded {} bytes, saved {} bytes, creation {:.1f} ms, saved {:.1f} ms'.format(
+            self.loadedBytes, self.savedBytes, self.createTime * 1000.0, self.savedTime * 1000.0)
@@ -0,0 +1,201 @@
+# -*- coding: UTF-8 -*-
+"""
+Scene object store and frustum culling.
+
+Notes
+-----
+
+Objects are kept as a structure of arrays, one row per object: model
+matrix, mesh and world space bounds. Nothing is stored per object in Python,
+so culling is a few NumPy expressions over all objects no matter how many
+there are.
+
+Matrices are row vector matrices like the ones ``glm`` builds, a point is
+transformed by ``p @ model @ view @ proj``. The clip matrix the frustum
+planes are extracted from is therefore ``view @ proj`` (``proj * view`` in
+GLSL's column vector notation). Culling first tests bounding spheres, then
+the boxes of the objects whose spheres straddle a plane.
+"""
+
+import numpy as np
+
+
+def frustumPlanes(viewProj):
+    """``(6, 4)`` normalized planes of a row vector clip matrix, inside is positive.
+
+    Left, right, bottom, top, near and far, for -w <= z <= w clip space like
+    ``glm.perspective`` produces.
+    """
+    m = np.asarray(viewProj, np.float64)
+    planes = np.stack([m[:, 3] + m[:, 0], m[:, 3] - m[:, 0],
+                       m[:, 3] + m[:, 1], m[:, 3] - m[:, 1],
+                       m[:, 3] + m[:, 2], m[:, 3] - m[:, 2]])
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+def transformBoxes(lower, upper, transforms):
+    """World space boxes around local boxes moved by row vector matrices.
+
+    Parameters
+    ----------
+    lower, upper : array
+        ``(N, 3)`` or ``(3,)`` local box corners.
+    transforms : array
+        ``(N, 4, 4)`` model matrices.
+
+    Returns
+    -------
+    lower, upper : array
+        ``(N, 3)`` world space boxes.
+    """
+    transforms = np.asarray(transforms, np.float64)
+    lower = np.asarray(lower, np.float64)
+    upper = np.asarray(upper, np.float64)
+    # Arvo's method, every matrix entry picks the smaller and larger product
+    center = (lower + upper) / 2.0
+    extent = (upper - lower) / 2.0
+    worldCenter = np.einsum('...i,...ij->...j', center, transforms[:, :3, :3]) + transforms[:, 3, :3]
+    worldExtent = np.einsum('...i,...ij->...j', extent, np.abs(transforms[:, :3, :3]))
+    return worldCenter - worldExtent, worldCenter + worldExtent
+
+
+class Scene(object):
+    """Objects as structure of arrays.
+
+    The arrays below are views of the first ``len(scene)`` rows of storage
+    whose capacity doubles when it is full, the index of a row is the
+    object's id.
+
+    Attributes
+    ----------
+    transforms : array
+        ``(N, 4, 4)`` float32 model matrices.
+    meshes : array
+        Mesh id of every object.
+    lower, upper : array
+        ``(N, 3)`` world space bounding boxes.
+    centers : array
+        ``(N, 3)`` world space bounding sphere centers.
+    radii : array
+        Bounding sphere radii.
+    """
+
+    def __init__(self, capacity=1024):
+        self.__size = 0
+        self.__transforms = np.empty((capacity, 4, 4), np.float32)
+        self.__meshes = np.empty(capacity, np.int32)
+        self.__localLower = np.empty((capacity, 3), np.float32)
+        self.__localUpper = np.empty((capacity, 3), np.float32)
+        self.__lower = np.empty((capacity, 3), np.float32)
+        self.__upper = np.empty((capacity, 3), np.float32)
+        self.__centers = np.empty((capacity, 3), np.float32)
+        self.__radii = np.empty(capacity, np.float32)
+
+    def __len__(self):
+        return self.__size
+
+    def __reserve(self, size):
+        capacity = len(self.__meshes)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name in ('transforms', 'meshes', 'localLower', 'localUpper', 'lower', 'upper', 'centers', 'radii'):
+            attribute = '_Scene__' + name
+            old = getattr(self, attribute)
+            new = np.empty((capacity,) + old.shape[1:], old.dtype)
+            new[:self.__size] = old[:self.__size]
+            setattr(self, attribute, new)
+
+    @property
+    def transforms(self):
+        return self.__transforms[:self.__size]
+
+    @property
+    def meshes(self):
+        return self.__meshes[:self.__size]
+
+    @property
+    def lower(self):
+        return self.__lower[:self.__size]
+
+    @property
+    def upper(self):
+        return self.__upper[:self.__size]
+
+    @property
+    def centers(self):
+        return self.__centers[:self.__size]
+
+    @property
+    def radii(self):
+        return self.__radii[:self.__size]
+
+    def addObjects(self, transforms, lower, upper, mesh=0):
+        """Add objects, returns their ids.
+
+        Parameters
+        ----------
+        transforms : array
+            ``(N, 4, 4)`` model matrices, or one ``(4, 4)`` matrix.
+        lower, upper : array
+            Bounding box of the objects' meshes in model space, ``(3,)`` or
+            ``(N, 3)``.
+        mesh : int | array
+            Mesh id, one for all objects or one per object.
+        """
+        transforms = np.asarray(transforms, np.float32).reshape(-1, 4, 4)
+        start = self.__size
+        end = start + len(transforms)
+        self.__reserve(end)
+
+        self.__size = end
+        self.__meshes[start:end] = mesh
+        self.__localLower[start:end] = lower
+        self.__localUpper[start:end] = upper
+        ids = np.arange(start, end)
+        self.setTransforms(ids, transforms)
+        return ids
+
+    def setTransforms(self, ids, transforms):
+        """Move objects and update their world space bounds."""
+        ids = np.asarray(ids)
+        transforms = np.asarray(transforms, np.float32).reshape(-1, 4, 4)
+        self.__transforms[ids] = transforms
+
+        lower, upper = transformBoxes(self.__localLower[ids], self.__localUpper[ids], transforms)
+        self.__lower[ids] = lower
+        self.__upper[ids] = upper
+        self.__centers[ids] = (lower + upper) / 2.0
+        self.__radii[ids] = np.linalg.norm(upper - lower, axis=1) / 2.0
+
+    def cull(self, viewProj, boxes=True):
+        """Ids of the objects inside or crossing the view frustum.
+
+        Parameters
+        ----------
+        viewProj : array
+            Row vector clip matrix, ``view @ proj``.
+        boxes : bool
+            Test the boxes of objects whose sphere crosses a plane, a
+            tighter fit for long or flat objects.
+
+        Returns
+        -------
+        visible : array
+            int32 ids in ascending order.
+        """
+        planes = frustumPlanes(viewProj).astype(np.float32)
+        # (6, N), every plane's distances are contiguous
+        distance = np.dot(planes[:, :3], self.centers.T) + planes[:, 3:]
+        radii = self.radii
+        outside = (distance + radii).min(axis=0) < 0.0
+        crossing = ~outside & ((distance - radii).min(axis=0) < 0.0)
+
+        if boxes and crossing.any():
+            ids = np.flatnonzero(crossing)
+            # the box corner furthest along each plane's normal
+            positive = planes[:, :3] > 0.0
+            corner = np.where(positive[None], self.__upper[ids][:, None], self.__lower[ids][:, None])
+            outside[ids] = ((corner * planes[:, :3]).sum(axis=2) + planes[:, 3] < 0.0).any(axis=1)
+
+        return np.flatnonzero(~outside).astype(np.int32)
@@ -0,0 +1,462 @@
+# -*- coding: UTF-8 -*-
+"""
+Texture helpers, CPU side mipmap generation and baked textures.
+
+Notes
+-----
+
+``buildMipChain`` computes the whole mip pyramid with NumPy instead of
+``vkCmdBlitImage``. Every level is resampled from the previous one with a
+separable filter, one axis at a time, so odd and non power of two sizes are
+handled exactly: level ``i`` is ``max(1, size >> i)`` and every output texel
+weighs the source texels it covers. ``packMipChain`` lays the levels out in
+one buffer so they can be uploaded with a single ``vkCmdCopyBufferToImage``.
+
+Baked textures store such a buffer on disk, every level already filtered, so
+loading one is a memory map and a copy into the staging buffer. Bake with
+
+    python texture.py textures/chalet.jpg textures/chalet.vktex
+    python texture.py textures/chalet.jpg textures/chalet.vktex --format bc1
+
+``TextureLoader`` runs ``decodeTexture`` on a thread or process pool, so
+image decoding, RGBA conversion and mip filtering of many textures use every
+core while the main thread goes on with Vulkan work.
+"""
+
+import os
+import math
+import struct
+import concurrent.futures
+
+import numpy as np
+
+import bcn
+
+
+FILTERS = ('box', 'kaiser')
+
+# kaiser windowed sinc, radius in destination texels and window shape
+KAISER_RADIUS = 3.0
+KAISER_BETA = 4.0
+
+# bufferOffset of every level, a multiple of any texel or block size we use
+LEVEL_ALIGNMENT = 16
+
+
+def mipLevelCount(width, height):
+    return int(math.floor(math.log2(max(width, height)))) + 1
+
+
+def mipExtent(width, height, level):
+    return max(1, width >> level), max(1, height >> level)
+
+
+def isPowerOfTwo(value):
+    return value > 0 and value & (value - 1) == 0
+
+
+def _boxTaps(srcSize, dstSize):
+    # every destination texel averages the source interval it covers,
+    # partially covered texels are weighted by the covered fraction
+    scale = float(srcSize) / dstSize
+    lo = np.arange(dstSize) * scale
+    hi = lo + scale
+
+    count = int(math.ceil(scale)) + 1
+    index = np.floor(lo).astype(np.int64)[:, None] + np.arange(count)
+    weight = np.minimum(index + 1, hi[:, None]) - np.maximum(index, lo[:, None])
+    return index, np.clip(weight, 0.0, None)
+
+
+def _kaiserTaps(srcSize, dstSize):
+    scale = float(srcSize) / dstSize
+    support = KAISER_RADIUS * max(scale, 1.0)
+    center = (np.arange(dstSize) + 0.5) * scale
+
+    count = int(math.ceil(2.0 * support)) + 1
+    index = np.floor(center - support).astype(np.int64)[:, None] + np.arange(count)
+
+    x = (index + 0.5 - center[:, None]) / max(scale, 1.0)
+    r = np.clip(x / KAISER_RADIUS, -1.0, 1.0)
+    window = np.i0(KAISER_BETA * np.sqrt(1.0 - r * r)) / np.i0(KAISER_BETA)
+    weight = np.sinc(x) * np.where(np.abs(x) < KAISER_RADIUS, window, 0.0)
+    return index, weight
+
+
+def filterTaps(srcSize, dstSize, filter='box'):
+    """Source indices and weights of a 1D resampling.
+
+    Returns
+    -------
+    index : array
+        ``(dstSize, K)`` source texel of every tap, clamped to the edge.
+    weight : array
+        ``(dstSize, K)`` float32 weights, every row sums to 1.
+    """
+    if filter == 'box':
+        index, weight = _boxTaps(srcSize, dstSize)
+    elif filter == 'kaiser':
+        index, weight = _kaiserTaps(srcSize, dstSize)
+    else:
+        raise ValueError('unknown filter {!r}, expected one of {}'.format(filter, FILTERS))
+
+    weight /= weight.sum(axis=1, keepdims=True)
+    return np.clip(index, 0, srcSize - 1), weight.astype(np.float32)
+
+
+def _resampleAxis(image, axis, dstSize, filter):
+    srcSize = image.shape[axis]
+    if srcSize == dstSize:
+        return image
+
+    index, weight = filterTaps(srcSize, dstSize, filter)
+    shape = [1] * image.ndim
+    shape[axis] = dstSize
+
+    # one pass per tap keeps the temporaries at the size of the output
+    result = None
+    for k in range(index.shape[1]):
+        term = np.take(image, index[:, k], axis=axis) * weight[:, k].reshape(shape)
+        result = term if result is None else np.add(result, term, out=result)
+    return result
+
+
+def downsample(image, width, height, filter='box'):
+    """Resample a float ``(H, W, C)`` image to ``(height, width, C)``."""
+    image = _resampleAxis(image, 0, height, filter)
+    return _resampleAxis(image, 1, width, filter)
+
+
+def buildMipChain(pixels, filter='box', levels=None):
+    """Compute every mip level of an image.
+
+    Parameters
+    ----------
+    pixels : array
+        ``(H, W, C)`` uint8 image, level 0.
+    filter : str
+        ``'box'`` or ``'kaiser'``.
+    levels : int | None
+        Number of levels, the full chain down to 1x1 if None.
+
+    Returns
+    -------
+    chain : list
+        ``(h, w, C)`` uint8 arrays, level 0 first.
+    """
+    pixels = np.asarray(pixels)
+    height, width = pixels.shape[:2]
+    if levels is None:
+        levels = mipLevelCount(width, height)
+
+    chain = [np.ascontiguousarray(pixels, np.uint8)]
+    current = pixels.astype(np.float32)
+    for level in range(1, levels):
+        w, h = mipExtent(width, height, level)
+        # later levels are filtered from the unrounded previous level
+        current = downsample(current, w, h, filter)
+        chain.append(np.clip(current + 0.5, 0, 255).astype(np.uint8))
+
+    return chain
+
+
+def packMipChain(chain, width=None, height=None, alignment=LEVEL_ALIGNMENT):
+    """Concatenate mip levels into one upload buffer.
+
+    Parameters
+    ----------
+    chain : list
+        Level arrays, level 0 first, their raw bytes are copied as is.
+    width, height : int | None
+        Size of level 0, taken from ``chain[0].shape`` if None. Needed when
+        the arrays are not ``(h, w, C)`` texels, e.g. compressed blocks.
+    alignment : int
+        Alignment of every level's offset.
+
+    Returns
+    -------
+    data : array
+        uint8 buffer holding every level.
+    regions : list
+        ``(bufferOffset, width, height)`` of every level, level 0 first.
+    """
+    if width is None:
+        height, width = chain[0].shape[:2]
+
+    regions = []
+    offset = 0
+    for i, level in enumerate(chain):
+        offset = (offset + alignment - 1) // alignment * alignment
+        regions.append((offset,) + mipExtent(width, height, i))
+        offset += level.nbytes
+
+    data = np.zeros(offset, np.uint8)
+    for (start, w, h), level in zip(regions, chain):
+        data[start:start + level.nbytes] = level.reshape(-1).view(np.uint8)
+
+    return data, regions
+
+
+# baked texture container, like KTX2 the format is stored as a VkFormat value
+#
+# header:  magic, version, vkFormat, width, height, level count, sha1 of the source image
+# table:   one entry per level, offset into the data, size, width, height
+# data:    the packed levels, starting on a TEXTURE_ALIGNMENT boundary
+
+FORMAT_R8G8B8A8_UNORM = 37
+
+TEXTURE_MAGIC = b'VKTEX\x00\x00\x00'
+TEXTURE_VERSION = 1
+TEXTURE_ALIGNMENT = 64
+TEXTURE_HEADER = struct.Struct('<8sIIIII20s')
+TEXTURE_LEVEL = struct.Struct('<QQII')
+
+
+class BakedTexture(object):
+    """Mip levels of a baked texture.
+
+    ``data`` is a read only view into the memory mapped file and ``levels``
+    holds ``(bufferOffset, width, height)`` into it, the same as
+    ``packMipChain`` returns.
+    """
+
+    def __init__(self, vkFormat, width, height, levels, data):
+        self.format = vkFormat
+        self.width = width
+        self.height = height
+        self.levels = levels
+        self.data = data
+
+    @property
+    def mipLevels(self):
+        return len(self.levels)
+
+
+def saveTexture(path, vkFormat, width, height, chain, sourceHash=b''):
+    """Write mip levels to a baked texture file.
+
+    Parameters
+    ----------
+    path : str
+        File to write, replaced atomically.
+    vkFormat : int
+        ``VkFormat`` of the level data.
+    width, height : int
+        Size of level 0.
+    chain : list
+        Level arrays, level 0 first, e.g. from ``buildMipChain``.
+    sourceHash : bytes
+        ``mesh.fileHash`` of the source image, empty if unknown.
+    """
+    data, regions = packMipChain(chain, width, height)
+
+    start = TEXTURE_HEADER.size + TEXTURE_LEVEL.size * len(chain)
+    start = (start + TEXTURE_ALIGNMENT - 1) // TEXTURE_ALIGNMENT * TEXTURE_ALIGNMENT
+
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        f.write(TEXTURE_HEADER.pack(TEXTURE_MAGIC, TEXTURE_VERSION, vkFormat, width, height,
+                                    len(chain), sourceHash))
+        for (offset, w, h), level in zip(regions, chain):
+            f.write(TEXTURE_LEVEL.pack(offset, level.nbytes, w, h))
+        f.write(b'\x00' * (start - f.tell()))
+        f.write(data.tobytes())
+    os.replace(tmpPath, path)
+
+
+def loadTexture(path, sourceHash=None):
+    """Map a baked texture file.
+
+    Parameters
+    ----------
+    path : str
+        File written by ``saveTexture``.
+    sourceHash : bytes | None
+        Expected source hash, a mismatch means the file is stale.
+
+    Returns
+    -------
+    texture : BakedTexture | None
+        None if the file is missing or stale.
+    """
+    # np.memmap can not map an empty file, a truncated header is stale too
+    if not os.path.isfile(path) or os.path.getsize(path) < TEXTURE_HEADER.size:
+        return None
+
+    content = np.memmap(path, np.uint8, 'r')
+
+    magic, version, vkFormat, width, height, count, bakedHash = TEXTURE_HEADER.unpack_from(content, 0)
+    if magic != TEXTURE_MAGIC or version != TEXTURE_VERSION:
+        return None
+    if sourceHash is not None and bakedHash != sourceHash:
+        return None
+
+    start = TEXTURE_HEADER.size + TEXTURE_LEVEL.size * count
+    start = (start + TEXTURE_ALIGNMENT - 1) // TEXTURE_ALIGNMENT * TEXTURE_ALIGNMENT
+    if start > len(content):
+        return None
+
+    levels = []
+    end = 0
+    for i in range(count):
+        offset, size, w, h = TEXTURE_LEVEL.unpack_from(content, TEXTURE_HEADER.size + i * TEXTURE_LEVEL.size)
+        # a truncated file, the level would run past its end
+        if start + offset + size > len(content):
+            return None
+        levels.append((offset, w, h))
+        end = max(end, offset + size)
+
+    return BakedTexture(vkFormat, width, height, levels, content[start:start + end])
+
+
+def compressChain(chain, vkFormat):
+    """Block compress every level of a ``buildMipChain`` result."""
+    return [bcn.encode(level, vkFormat) for level in chain]
+
+
+def _decodePixels(path, alpha=None):
+    # RGBA pixels of an image file, alpha replaced by a constant if given
+    from PIL import Image
+
+    image = Image.open(path).convert('RGBA')
+    if alpha is not None:
+        image.putalpha(alpha)
+    return np.asarray(image)
+
+
+def bake(sourcePath, path, filter='box', vkFormat=FORMAT_R8G8B8A8_UNORM, alpha=None):
+    """Decode an image, build its mip chain and save it as a baked texture.
+
+    ``alpha`` is put into every texel like ``decodeTexture`` does, bake with
+    the value the application loads the texture with or the level data
+    differs from what it would build itself.
+
+    Returns
+    -------
+    pixels : array
+        Level 0 as decoded, to compare the stored data against.
+    chain : list
+        Level arrays as written.
+    """
+    from mesh import fileHash
+
+    pixels = _decodePixels(sourcePath, alpha)
+    height, width = pixels.shape[:2]
+    chain = buildMipChain(pixels, filter)
+    if bcn.isCompressed(vkFormat):
+        chain = compressChain(chain, vkFormat)
+    saveTexture(path, vkFormat, width, height, chain, fileHash(sourcePath))
+    return pixels, chain
+
+
+def decodeTexture(path, bakedPath=None, mipmaps='auto', filter='box', alpha=None):
+    """Turn an image file into level data ready for upload.
+
+    Runs in a ``TextureLoader`` worker, everything here is plain Python and
+    NumPy so the result can cross a process boundary.
+
+    Parameters
+    ----------
+    path : str
+        Image file, anything PIL reads.
+    bakedPath : str | None
+        Baked texture of the same image, used if it is up to date. A newly
+        built mip chain is saved there.
+    mipmaps : str
+        ``'cpu'`` builds the full chain, ``'gpu'`` only decodes level 0 and
+        ignores the baked file, ``'auto'`` builds the chain when a blit chain
+        would be wrong, i.e. for non power of two sizes.
+    filter : str
+        Mip filter, see ``buildMipChain``.
+    alpha : int | None
+        Constant alpha put into every texel, the image's own alpha if None.
+
+    Returns
+    -------
+    texture : BakedTexture
+        With every mip level, or only level 0 when the chain is left to the GPU.
+    """
+    from mesh import fileHash
+
+    sourceHash = fileHash(path) if os.path.isfile(path) else None
+    if bakedPath and mipmaps != 'gpu':
+        baked = loadTexture(bakedPath, sourceHash)
+        if baked:
+            return baked
+
+    pixels = _decodePixels(path, alpha)
+
+    height, width = pixels.shape[:2]
+    if mipmaps == 'cpu' or (mipmaps == 'auto' and not (isPowerOfTwo(width) and isPowerOfTwo(height))):
+        chain = buildMipChain(pixels, filter)
+        if bakedPath:
+            saveTexture(bakedPath, FORMAT_R8G8B8A8_UNORM, width, height, chain, sourceHash or b'')
+    else:
+        chain = [pixels]
+
+    data, levels = packMipChain(chain)
+    return BakedTexture(FORMAT_R8G8B8A8_UNORM, width, height, levels, data)
+
+
+class TextureLoader(object):
+    """Decodes textures in the background.
+
+    Parameters
+    ----------
+    workers : int | None
+        Pool size, one per core if None.
+    processes : bool
+        Use processes instead of threads. PIL and NumPy release the GIL for
+        most of the work, so threads are usually enough and avoid copying
+        the results between processes.
+    """
+
+    def __init__(self, workers=None, processes=False):
+        if processes:
+            self.__executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count())
+
+    def submit(self, path, bakedPath=None, mipmaps='auto', filter='box', alpha=None):
+        """Start decoding one texture, returns a future of a ``BakedTexture``."""
+        return self.__executor.submit(decodeTexture, path, bakedPath, mipmaps, filter, alpha)
+
+    def load(self, paths, **kwargs):
+        """Decode several textures, yields ``(path, texture)`` as they finish."""
+        futures = dict((self.submit(path, **kwargs), path) for path in paths)
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+    def shutdown(self, wait=True):
+        self.__executor.shutdown(wait)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    formats = dict(bcn.NAMES, rgba8=FORMAT_R8G8B8A8_UNORM)
+    encodable = sorted(name for name, vkFormat in formats.items()
+                       if vkFormat == FORMAT_R8G8B8A8_UNORM or bcn.canEncode(vkFormat))
+
+    parser = argparse.ArgumentParser(description='bake an image and its mip chain into a texture file')
+    parser.add_argument('source', help='image file, anything PIL reads')
+    parser.add_argument('output', help='baked texture file to write')
+    parser.add_argument('--filter', choices=FILTERS, default='box')
+    parser.add_argument('--format', choices=encodable, default='rgba8')
+    parser.add_argument('--alpha', type=int, default=None,
+                        help="constant alpha, 28_mipmapping.py loads its texture with 1")
+    args = parser.parse_args()
+
+    vkFormat = formats[args.format]
+    pixels, chain = bake(args.source, args.output, args.filter, vkFormat, args.alpha)
+
+    height, width = pixels.shape[:2]
+    rawSize = sum(w * h * 4 for w, h in (mipExtent(width, height, i) for i in range(len(chain))))
+    size = os.path.getsize(args.output)
+    print('{}: {} {} levels, {:.1f} MB, {:.1f}x smaller than rgba8'.format(
+        args.output, args.format, len(chain), size / 1048576.0, rawSize / float(size)))
+
+    if bcn.isCompressed(vkFormat):
+        decoded = bcn.decode(chain[0], width, height, vkFormat)
+        print('level 0 PSNR rgb {:.2f} dB, rgba {:.2f} dB'.format(bcn.psnr(pixels, decoded),
+                                                                 bcn.psnr(pixels, decoded, 4)))
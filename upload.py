@@ -0,0 +1,254 @@
+# -*- coding: UTF-8 -*-
+"""
+Batched uploads.
+
+Notes
+-----
+
+An ``UploadBatch`` records any number of staging copies and layout
+transitions into one command buffer and submits it with a fence instead of
+waiting for the queue to go idle after every command. ``submit`` returns an
+``UploadTicket``; staging buffers stay alive until the ticket sees the fence
+signal, so the CPU can keep working while the transfer runs.
+"""
+
+from vulkan import *
+
+
+UINT64_MAX = 18446744073709551615
+
+
+def hasStencilComponent(fm):
+    return fm == VK_FORMAT_D32_SFLOAT_S8_UINT or fm == VK_FORMAT_D24_UNORM_S8_UINT
+
+
+class UploadTicket(object):
+
+    def __init__(self, device, commandPool, commandBuffer, fence, release):
+        self.__device = device
+        self.__commandPool = commandPool
+        self.__commandBuffer = commandBuffer
+        self.__fence = fence
+        self.__release = release
+
+    @property
+    def done(self):
+        return self.__fence is None
+
+    def __finish(self):
+        for func in self.__release:
+            func()
+        self.__release = []
+
+        vkFreeCommandBuffers(self.__device, self.__commandPool, 1, [self.__commandBuffer])
+        vkDestroyFence(self.__device, self.__fence, None)
+        self.__fence = None
+
+    def poll(self):
+        """Release the staging resources if the upload finished, returns ``done``."""
+        if self.__fence is None:
+            return True
+
+        try:
+            vkGetFenceStatus(self.__device, self.__fence)
+        except VkNotReady:
+            return False
+
+        self.__finish()
+        return True
+
+    def wait(self, timeout=UINT64_MAX):
+        if self.__fence is None:
+            return
+
+        vkWaitForFences(self.__device, 1, [self.__fence], VK_TRUE, timeout)
+        self.__finish()
+
+
+class UploadBatch(object):
+    """Records transfers into a single command buffer.
+
+    Parameters
+    ----------
+    device : VkDevice
+    commandPool : VkCommandPool
+    queue : VkQueue
+        Queue the batch is submitted to, it must support transfers.
+    allocator : DeviceMemoryAllocator
+        Staging buffers are taken from host visible memory of this allocator.
+    """
+
+    def __init__(self, device, commandPool, queue, allocator):
+        self.__device = device
+        self.__commandPool = commandPool
+        self.__queue = queue
+        self.__allocator = allocator
+
+        self.__staging = []
+
+        allocInfo = VkCommandBufferAllocateInfo(
+            level=VK_COMMAND_BUFFER_LEVEL_PRIMARY,
+            commandPool=commandPool,
+            commandBufferCount=1
+        )
+
+        self.__commandBuffer = vkAllocateCommandBuffers(device, allocInfo)[0]
+        beginInfo = VkCommandBufferBeginInfo(flags=VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT)
+        vkBeginCommandBuffer(self.__commandBuffer, beginInfo)
+
+    @property
+    def commandBuffer(self):
+        return self.__commandBuffer
+
+    def stage(self, data):
+        """Copy ``data`` (bytes, numpy array, any buffer) into a new staging buffer."""
+        size = memoryview(data).nbytes
+
+        bufferInfo = VkBufferCreateInfo(
+            size=size,
+            usage=VK_BUFFER_USAGE_TRANSFER_SRC_BIT,
+            sharingMode=VK_SHARING_MODE_EXCLUSIVE
+        )
+        buffer = vkCreateBuffer(self.__device, bufferInfo, None)
+        memory = self.__allocator.allocateBuffer(buffer,
+                                                 VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
+
+        ffi.memmove(memory.mapped, data, size)
+
+        self.__staging.append((buffer, memory))
+        return buffer
+
+    def copyBuffer(self, src, dst, size, srcOffset=0, dstOffset=0):
+        copyRegion = VkBufferCopy(srcOffset, dstOffset, size)
+        vkCmdCopyBuffer(self.__commandBuffer, src, dst, 1, [copyRegion])
+
+    def copyBufferToImage(self, buffer, image, width, height, mipLevel=0, bufferOffset=0):
+        subresource = VkImageSubresourceLayers(
+            aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
+            mipLevel=mipLevel,
+            baseArrayLayer=0,
+            layerCount=1
+        )
+        region = VkBufferImageCopy(
+            bufferOffset=bufferOffset,
+            bufferRowLength=0,
+            bufferImageHeight=0,
+            imageSubresource=subresource,
+            imageOffset=[0, 0],
+            imageExtent=[width, height, 1]
+        )
+
+        vkCmdCopyBufferToImage(self.__commandBuffer, buffer, image, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, 1, region)
+
+    def copyBufferToImageLevels(self, buffer, image, levels):
+        """Copy several mip levels with one command.
+
+        Parameters
+        ----------
+        levels : list
+            ``(bufferOffset, width, height)`` per level, level 0 first, as
+            returned by ``texture.packMipChain``.
+        """
+        regions = []
+        for mipLevel, (bufferOffset, width, height) in enumerate(levels):
+            subresource = VkImageSubresourceLayers(
+                aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
+                mipLevel=mipLevel,
+                baseArrayLayer=0,
+                layerCount=1
+            )
+            regions.append(VkBufferImageCopy(
+                bufferOffset=bufferOffset,
+                bufferRowLength=0,
+                bufferImageHeight=0,
+                imageSubresource=subresource,
+                imageOffset=[0, 0],
+                imageExtent=[width, height, 1]
+            ))
+
+        vkCmdCopyBufferToImage(self.__commandBuffer, buffer, image, VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+                               len(regions), regions)
+
+    def transitionImageLayout(self, image, imFormat, oldLayout, newLayout, mipLevels):
+        subresourceRange = VkImageSubresourceRange(
+            aspectMask=VK_IMAGE_ASPECT_COLOR_BIT,
+            baseMipLevel=0,
+            levelCount=mipLevels,
+            baseArrayLayer=0,
+            layerCount=1
+        )
+        if newLayout == VK_IMAGE_LAYOUT_DEPTH_STENCIL_ATTACHMENT_OPTIMAL:
+            subresourceRange.aspectMask = VK_IMAGE_ASPECT_DEPTH_BIT
+            if hasStencilComponent(imFormat):
+                subresourceRange.aspectMask = VK_IMAGE_ASPECT_DEPTH_BIT | VK_IMAGE_ASPECT_STENCIL_BIT
+
+        barrier = VkImageMemoryBarrier(
+            oldLayout=oldLayout,
+            newLayout=newLayout,
+            srcQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+            dstQueueFamilyIndex=VK_QUEUE_FAMILY_IGNORED,
+            image=image,
+            subresourceRange=subresourceRange
+        )
+
+        if oldLayout == VK_IMAGE_LAYOUT_UNDEFINED and newLayout == VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL:
+            barrier.srcAccessMask = 0
+            barrier.dstAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT
+
+            sourceStage = VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT
+            destinationStage = VK_PIPELINE_STAGE_TRANSFER_BIT
+        elif oldLayout == VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL and newLayout == VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL:
+            barrier.srcAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT
+            barrier.dstAccessMask = VK_ACCESS_SHADER_READ_BIT
+
+            sourceStage = VK_PIPELINE_STAGE_TRANSFER_BIT
+            destinationStage = VK_PIPELINE_STAGE_FRAGMENT_SHADER_BIT
+        elif oldLayout == VK_IMAGE_LAYOUT_UNDEFINED and newLayout == VK_IMAGE_LAYOUT_DEPTH_STENCIL_ATTACHMENT_OPTIMAL:
+            barrier.srcAccessMask = 0
+            barrier.dstAccessMask = VK_ACCESS_DEPTH_STENCIL_ATTACHMENT_READ_BIT | VK_ACCESS_DEPTH_STENCIL_ATTACHMENT_WRITE_BIT
+
+            sourceStage = VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT
+            destinationStage = VK_PIPELINE_STAGE_EARLY_FRAGMENT_TESTS_BIT
+        else:
+            raise Exception('unsupported layout transition!')
+
+        vkCmdPipelineBarrier(self.__commandBuffer,
+                             sourceStage,
+                             destinationStage,
+                             0,
+                             0, None,
+                             0, None,
+                             1, barrier)
+
+    def submit(self):
+        # make every buffer write visible to the draws submitted after this batch
+        barrier = VkMemoryBarrier(
+            srcAccessMask=VK_ACCESS_TRANSFER_WRITE_BIT,
+            dstAccessMask=VK_ACCESS_VERTEX_ATTRIBUTE_READ_BIT | VK_ACCESS_INDEX_READ_BIT |
+                          VK_ACCESS_INDIRECT_COMMAND_READ_BIT | VK_ACCESS_UNIFORM_READ_BIT
+        )
+        vkCmdPipelineBarrier(self.__commandBuffer,
+                             VK_PIPELINE_STAGE_TRANSFER_BIT,
+                             VK_PIPELINE_STAGE_DRAW_INDIRECT_BIT | VK_PIPELINE_STAGE_VERTEX_INPUT_BIT |
+                             VK_PIPELINE_STAGE_VERTEX_SHADER_BIT,
+                             0,
+                             1, [barrier],
+                             0, None,
+                             0, None)
+
+        vkEndCommandBuffer(self.__commandBuffer)
+
+        fence = vkCreateFence(self.__device, VkFenceCreateInfo(), None)
+        submitInfo = VkSubmitInfo(pCommandBuffers=[self.__commandBuffer])
+        vkQueueSubmit(self.__queue, 1, [submitInfo], fence)
+
+        release = [self.__destroyStaging(buffer, memory) for buffer, memory in self.__staging]
+        self.__staging = []
+
+        return UploadTicket(self.__device, self.__commandPool, self.__commandBuffer, fence, release)
+
+    def __destroyStaging(self, buffer, memory):
+        def release():
+            vkDestroyBuffer(self.__device, buffer, None)
+            self.__allocator.free(memory)
+        return release
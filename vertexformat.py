@@ -0,0 +1,271 @@
+# -*- coding: UTF-8 -*-
+"""
+Quantized vertex layouts.
+
+Notes
+-----
+
+``mesh`` keeps vertices as 8 float32 values, position, color and texture
+coordinate, 32 bytes each. A ``VertexLayout`` picks a VkFormat per attribute
+and packs those vertices into one interleaved buffer:
+
+* positions as half floats or UNORM16 relative to the mesh's bounding box.
+  ``positionTransform`` maps the stored values back to model space, it is
+  meant to be multiplied in front of the model matrix (row vectors, like
+  ``glm``), so the vertex shader stays the same.
+* texture coordinates as UNORM16 when they all lie in [0, 1], as half
+  floats otherwise.
+* attributes holding the same value for every vertex, like the always
+  white color, can be dropped. The shader then has to supply the value.
+
+Three component 16 bit formats are rarely supported for vertex buffers, so
+positions are padded to four components. Every format used here is one
+Vulkan requires ``VK_FORMAT_FEATURE_VERTEX_BUFFER_BIT`` for.
+"""
+
+import numpy as np
+
+
+# VkFormat values
+R8G8B8A8_UNORM = 37
+R16G16_UNORM = 77
+R16G16_SFLOAT = 83
+R16G16B16A16_UNORM = 91
+R16G16B16A16_SFLOAT = 97
+R32G32_SFLOAT = 103
+R32G32B32_SFLOAT = 106
+
+# name: (shader location, columns in a mesh vertex)
+ATTRIBUTES = {
+    'position': (0, slice(0, 3)),
+    'color': (1, slice(3, 6)),
+    'texcoord': (2, slice(6, 8)),
+}
+
+# encoding: (VkFormat by component count, stored dtype, padded component count)
+ENCODINGS = {
+    'float': ({2: R32G32_SFLOAT, 3: R32G32B32_SFLOAT}, np.dtype('<f4'), {2: 2, 3: 3}),
+    'half': ({2: R16G16_SFLOAT, 3: R16G16B16A16_SFLOAT}, np.dtype('<f2'), {2: 2, 3: 4}),
+    'unorm16': ({2: R16G16_UNORM, 3: R16G16B16A16_UNORM}, np.dtype('<u2'), {2: 2, 3: 4}),
+    'unorm8': ({3: R8G8B8A8_UNORM}, np.dtype('u1'), {3: 4}),
+}
+
+UNORM_MAX = {
+    'unorm16': 65535.0,
+    'unorm8': 255.0,
+}
+
+
+class VertexAttribute(object):
+    """One attribute of a ``VertexLayout``."""
+
+    def __init__(self, name, encoding, offset):
+        self.name = name
+        self.encoding = encoding
+        self.location, self.columns = ATTRIBUTES[name]
+        self.offset = offset
+
+        components = self.columns.stop - self.columns.start
+        formats, self.dtype, padded = ENCODINGS[encoding]
+        if components not in formats:
+            raise ValueError('{} can not be stored as {}'.format(name, encoding))
+        self.format = formats[components]
+        self.components = components
+        self.paddedComponents = padded[components]
+
+    @property
+    def nbytes(self):
+        return self.dtype.itemsize * self.paddedComponents
+
+    def __repr__(self):
+        return 'VertexAttribute({!r}, {!r}, offset={})'.format(self.name, self.encoding, self.offset)
+
+
+class VertexLayout(object):
+    """Encoding of every attribute kept in the vertex buffer.
+
+    Parameters
+    ----------
+    position, color, texcoord : str | None
+        ``'float'``, ``'half'``, ``'unorm16'`` or for color ``'unorm8'``.
+        None leaves the attribute out.
+    bounds : tuple | None
+        ``(lower, upper)`` corners of the box positions are stored relative
+        to, needed for quantized positions.
+    constants : dict | None
+        Values of the attributes that were left out because they are
+        constant, by name.
+    """
+
+    def __init__(self, position='float', color='float', texcoord='float', bounds=None, constants=None):
+        self.attributes = []
+        self.stride = 0
+        for name, encoding in (('position', position), ('color', color), ('texcoord', texcoord)):
+            if encoding is None:
+                continue
+            attribute = VertexAttribute(name, encoding, self.stride)
+            self.attributes.append(attribute)
+            self.stride += attribute.nbytes
+
+        if position not in (None, 'float') and bounds is None:
+            raise ValueError('quantized positions need bounds')
+        self.bounds = None if bounds is None else (np.asarray(bounds[0], np.float64), np.asarray(bounds[1], np.float64))
+        self.constants = dict(constants or {})
+
+    @classmethod
+    def fromVertices(cls, vertices, position='unorm16', texcoord='auto', dropConstant=True):
+        """Layout for ``vertices``, quantized as requested.
+
+        ``texcoord='auto'`` uses UNORM16 if every coordinate is in [0, 1]
+        and half floats otherwise. With ``dropConstant`` the color is left
+        out when all vertices share it.
+        """
+        vertices = np.asarray(vertices)
+        bounds = None
+        if len(vertices):
+            positions = vertices[:, ATTRIBUTES['position'][1]]
+            bounds = (positions.min(axis=0), positions.max(axis=0))
+
+        if texcoord == 'auto':
+            texcoords = vertices[:, ATTRIBUTES['texcoord'][1]]
+            inRange = len(texcoords) == 0 or (texcoords.min() >= 0.0 and texcoords.max() <= 1.0)
+            texcoord = 'unorm16' if inRange else 'half'
+
+        color = 'float'
+        constants = {}
+        if dropConstant and len(vertices):
+            colors = vertices[:, ATTRIBUTES['color'][1]]
+            if (colors == colors[0]).all():
+                color = None
+                constants['color'] = colors[0].copy()
+
+        if bounds is None and position != 'float':
+            position = 'float'
+        return cls(position, color, texcoord, bounds, constants)
+
+    def attribute(self, name):
+        for attribute in self.attributes:
+            if attribute.name == name:
+                return attribute
+        return None
+
+    def has(self, name):
+        return self.attribute(name) is not None
+
+    def __positionScale(self):
+        # stored value * scale + offset is the model space position
+        lower, upper = self.bounds
+        extent = np.where(upper > lower, upper - lower, 1.0)
+        if self.attribute('position').encoding == 'half':
+            # centered in [-1, 1], where half floats are densest
+            return extent / 2.0, (lower + upper) / 2.0
+        return extent, lower
+
+    @property
+    def positionTransform(self):
+        """4x4 float32 matrix turning stored positions into model space."""
+        transform = np.identity(4, np.float32)
+        position = self.attribute('position')
+        if position is None or position.encoding == 'float':
+            return transform
+
+        scale, offset = self.__positionScale()
+        transform[[0, 1, 2], [0, 1, 2]] = scale
+        transform[3, :3] = offset
+        return transform
+
+    def __encode(self, attribute, values):
+        if attribute.name == 'position' and attribute.encoding != 'float':
+            scale, offset = self.__positionScale()
+            values = (values - offset) / scale
+
+        if attribute.encoding in UNORM_MAX:
+            maximum = UNORM_MAX[attribute.encoding]
+            return np.rint(np.clip(values, 0.0, 1.0) * maximum).astype(attribute.dtype)
+        return values.astype(attribute.dtype)
+
+    def __decode(self, attribute, stored):
+        values = stored.astype(np.float64)
+        if attribute.encoding in UNORM_MAX:
+            values /= UNORM_MAX[attribute.encoding]
+
+        if attribute.name == 'position' and attribute.encoding != 'float':
+            scale, offset = self.__positionScale()
+            values = values * scale + offset
+        return values
+
+    def pack(self, vertices):
+        """Interleave ``(N, 8)`` mesh vertices into an ``(N, stride)`` uint8 array."""
+        vertices = np.asarray(vertices, np.float64)
+        packed = np.zeros((len(vertices), self.stride), np.uint8)
+        for attribute in self.attributes:
+            stored = np.zeros((len(vertices), attribute.paddedComponents), attribute.dtype)
+            stored[:, :attribute.components] = self.__encode(attribute, vertices[:, attribute.columns])
+            packed[:, attribute.offset:attribute.offset + attribute.nbytes] = stored.view(np.uint8)
+        return packed
+
+    def unpack(self, packed):
+        """``(N, 8)`` float64 vertices as the GPU reads them from ``packed``.
+
+        Positions are in model space, dropped attributes get their constant.
+        """
+        packed = np.asarray(packed, np.uint8).reshape(-1, self.stride)
+        vertices = np.zeros((len(packed), 8), np.float64)
+        for name, constant in self.constants.items():
+            vertices[:, ATTRIBUTES[name][1]] = constant
+
+        for attribute in self.attributes:
+            raw = np.ascontiguousarray(packed[:, attribute.offset:attribute.offset + attribute.nbytes])
+            stored = raw.view(attribute.dtype)[:, :attribute.components]
+            vertices[:, attribute.columns] = self.__decode(attribute, stored)
+        return vertices
+
+    def quantizationError(self, vertices, packed=None):
+        """Error the layout introduces, per attribute.
+
+        Returns
+        -------
+        errors : dict
+            ``(max, rms)`` absolute error per kept attribute, over all
+            components. Position errors are in model units.
+        """
+        vertices = np.asarray(vertices, np.float64)
+        if packed is None:
+            packed = self.pack(vertices)
+        decoded = self.unpack(packed)
+
+        errors = {}
+        for attribute in self.attributes:
+            difference = decoded[:, attribute.columns] - vertices[:, attribute.columns]
+            if len(difference) == 0:
+                errors[attribute.name] = (0.0, 0.0)
+                continue
+            errors[attribute.name] = (float(np.abs(difference).max()), float(np.sqrt(np.mean(difference ** 2))))
+        return errors
+
+    def report(self, vertices, textureSize=None):
+        """Lines describing the layout, its size and its error on ``vertices``.
+
+        ``textureSize`` converts texture coordinate errors to texels.
+        """
+        vertices = np.asarray(vertices)
+        fullSize = len(vertices) * vertices.shape[1] * 4 if vertices.ndim == 2 else 0
+        size = len(vertices) * self.stride
+        lines = ['{} bytes per vertex, {:.2f} MB, {:.2f}x smaller than float32'.format(
+            self.stride, size / 1048576.0, fullSize / float(max(size, 1)))]
+
+        diagonal = 1.0
+        if self.bounds is not None:
+            diagonal = max(float(np.linalg.norm(self.bounds[1] - self.bounds[0])), 1e-30)
+
+        for name, (maximum, rms) in self.quantizationError(vertices).items():
+            line = '{:9s} {:8s} max {:.3g}  rms {:.3g}'.format(name, self.attribute(name).encoding, maximum, rms)
+            if name == 'position':
+                line += '  ({:.2g} of the bounding box diagonal)'.format(maximum / diagonal)
+            elif name == 'texcoord' and textureSize:
+                line += '  ({:.3g} texels)'.format(maximum * max(textureSize))
+            lines.append(line)
+
+        for name in sorted(self.constants):
+            lines.append('{:9s} dropped, constant {}'.format(name, np.asarray(self.constants[name]).tolist()))
+        return lines